@@ -0,0 +1,125 @@
+import edlib
+import numpy as np
+
+
+def max_edit_distance(length, limit):
+    """
+    Returns the largest edit distance whose divergence stays below a percentage limit.
+
+    Parameters:
+    - length: int - The length of the sequence the divergence is computed against.
+    - limit: float - The divergence limit in percent (exclusive).
+
+    Returns:
+    - int - The largest edit distance e with e / length * 100 < limit, or -1 if there is none.
+    """
+    e = -1
+    while (e + 1) / length * 100 < limit:
+        e += 1
+    return e
+
+
+def max_edit_distances(lengths, limit):
+    """
+    Returns max_edit_distance for every length of an array, computing it once per distinct length.
+
+    Parameters:
+    - lengths: np.ndarray - The sequence lengths.
+    - limit: float - The divergence limit in percent (exclusive).
+
+    Returns:
+    - np.ndarray - The largest edit distance below limit of every length.
+    """
+    distinct, inverse = np.unique(lengths, return_inverse=True)
+    return np.array([max_edit_distance(int(length), limit) for length in distinct], dtype=np.int64)[inverse]
+
+
+def base_counts(data, offsets):
+    """
+    Counts the symbols of every sequence of a concatenated buffer.
+
+    Parameters:
+    - data: np.ndarray - The concatenated sequences (uint8).
+    - offsets: np.ndarray - The start of every sequence in data, followed by the end of the last one.
+
+    Returns:
+    - np.ndarray - One row per sequence with the number of occurrences of each symbol present in data.
+    """
+    no = len(offsets) - 1
+    data = data[:offsets[-1]]
+    alphabet, codes = np.unique(data, return_inverse=True)
+    owners = np.repeat(np.arange(no), np.diff(offsets))
+    return np.bincount(owners * len(alphabet) + codes.ravel(),
+                       minlength=no * len(alphabet)).reshape(no, len(alphabet))
+
+
+def distance_lower_bounds(lengths, counts, i, js):
+    """
+    Returns exact lower bounds of the edit distances between sequence i and the sequences js, without aligning.
+
+    An edit operation changes the count of at most one symbol up and one down, so the distance is at least the
+    larger of the total surplus and the total deficit of symbol counts; this bound is never smaller than the
+    length difference.
+
+    Parameters:
+    - lengths: np.ndarray - The length of every sequence.
+    - counts: np.ndarray - The symbol counts of every sequence (see base_counts).
+    - i: int - The index of the query sequence.
+    - js: np.ndarray - The indices of the target sequences.
+
+    Returns:
+    - np.ndarray - The lower bound of every pair.
+    """
+    diff = counts[js] - counts[i]
+    surplus = np.where(diff > 0, diff, 0).sum(axis=1)
+    return np.maximum(surplus, surplus - (lengths[js] - lengths[i]))
+
+
+def feasible_partners(lengths, counts, i, js, max_ed):
+    """
+    Keeps the partners of sequence i whose length and composition bounds do not exceed max_ed.
+
+    Parameters:
+    - lengths: np.ndarray - The length of every sequence.
+    - counts: np.ndarray - The symbol counts of every sequence (see base_counts).
+    - i: int - The index of the query sequence.
+    - js: np.ndarray - The indices of the candidate partners.
+    - max_ed: int or np.ndarray - The largest edit distance of interest, for all pairs or for each of them.
+
+    Returns:
+    - np.ndarray - The partners that can be within max_ed, in the given order.
+    """
+    js = np.asarray(js, dtype=np.int64)
+    close = np.abs(lengths[js] - lengths[i]) <= max_ed
+    js = js[close]
+    if np.ndim(max_ed):
+        max_ed = np.asarray(max_ed)[close]
+    return js[distance_lower_bounds(lengths, counts, i, js) <= max_ed]
+
+
+def bounded_distance(query, target, max_ed):
+    """
+    Returns the edit distance between two sequences if it is at most max_ed, otherwise -1.
+
+    edlib restricts the alignment to a band of width max_ed and stops as soon as the distance exceeds it.
+    """
+    return edlib.align(query, target, k=max_ed)["editDistance"]
+
+
+def bounded_distances(query, targets, max_ed):
+    """
+    Aligns a query with a batch of targets, each with a bounded alignment.
+
+    Parameters:
+    - query: str - The query sequence.
+    - targets: List[str] - The target sequences.
+    - max_ed: int or List[int] - The largest edit distance of interest, for all targets or for each of them.
+
+    Returns:
+    - List[int] - The edit distance of every target, or -1 where it exceeds max_ed.
+    """
+    align = edlib.align
+    if isinstance(max_ed, (int, np.integer)):
+        max_ed = int(max_ed)
+        return [align(query, target, k=max_ed)["editDistance"] for target in targets]
+    return [align(query, target, k=int(k))["editDistance"] for target, k in zip(targets, max_ed)]
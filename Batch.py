@@ -0,0 +1,327 @@
+import gzip
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+
+from DistanceCache import DistanceCache
+from GRMhor import analysis_arrays, apply_families, detect_families, read_monomers_file
+from Metrics import Metrics, set_metrics
+from MonFinder import ALPHA_CONSENSUS, find_record_monomers, iter_fasta_records
+from MonomerStore import write_binary_monomers
+from Pipeline import draw_annotation, record_file_name
+
+BATCH_STAGES = ('monomers', 'families', 'grm')
+
+
+def run_batch(manifest_file, out_dir, limits=(5,), monomer_cons=ALPHA_CONSENSUS, processes=1, pruning='exact',
+              clustering='all-pairs', step=1, max_period=60, b_draw=False, out_format='ps', b_quiet=False):
+    """
+    Annotates every input of a manifest in a local process pool, checkpointing each stage of each record.
+
+    Every record goes through three stages, each one a task of the pool: the monomer search (FASTA inputs only),
+    the family detection and the GRM. A stage writes its result under out_dir/<job>/ (the monomers as a binary
+    .monb file, the families and the GRM data as .npz files, see checkpoint_files) with an atomic rename, and a
+    restarted batch skips the stages whose checkpoint exists and was made with the same settings from the same
+    upstream checkpoints (see _stage_settings), so changing the consensus or regenerating a stage also redoes the
+    stages after it. The family
+    detection also flushes its distances to a per-record DistanceCache as it goes, so an interrupted detection
+    resumes without realigning the pairs already done. Records of different inputs and stages of different
+    records run in parallel; a failed task is reported and the rest of the batch goes on.
+
+    Parameters:
+    - manifest_file: str - The manifest of inputs (see read_manifest).
+    - out_dir: str - The directory receiving the checkpoints, the diagrams and summary.tsv.
+    - limits: List[float] - Divergence limits of the family detection.
+    - monomer_cons: str | dict - The consensus sequence of the monomer, or several consensuses by name.
+    - processes: int - Number of worker processes.
+    - pruning: str - Candidate pruning mode, as in find_families.
+    - clustering: str - Family detection mode, as in detect_families.
+    - step: int - Number of consecutive family labels compared by the GRM.
+    - max_period: int - The largest period counted in the GRM frequencies.
+    - b_draw: bool - Flag to draw the HOR scheme and the GRM/MDD diagrams of every record and limit.
+    - out_format: str - Format of the HOR scheme.
+    - b_quiet: bool - Flag to turn off the progress messages of the workers.
+
+    Returns:
+    - tuple: The summary rows (see write_batch_summary) and the failed tasks as (job, record, stage, error).
+    """
+    settings = {'limits': sorted(limits), 'monomer_cons': monomer_cons, 'pruning': pruning,
+                'clustering': clustering, 'step': step, 'max_period': max_period, 'b_draw': b_draw,
+                'out_format': out_format}
+    rows, failed = {}, []
+    with ProcessPoolExecutor(max_workers=processes, initializer=set_metrics,
+                             initargs=(Metrics(b_quiet),)) as executor:
+        running = {}
+        for no, (job, record, files, seq) in enumerate(batch_records(read_manifest(manifest_file), out_dir,
+                                                                     failed, settings)):
+            _submit_next(executor, running, (no, job, record, files), None, seq, settings, rows)
+            # At most two tasks per worker wait in the pool, which bounds the sequences held in memory.
+            while len(running) >= 2 * processes:
+                _collect(executor, running, settings, rows, failed)
+        while running:
+            _collect(executor, running, settings, rows, failed)
+
+    summary = [row for no in sorted(rows) for row in rows[no]]
+    write_batch_summary(os.path.join(out_dir, "summary.tsv"), summary)
+    return summary, failed
+
+
+def read_manifest(file_name):
+    """
+    Reads a batch manifest: one input per line, a FASTA file (plain or gzip compressed) or a monomers file (text
+    or binary), optionally followed by a tab and a job name (default: the file name). Empty lines and lines
+    starting with '#' are skipped, and relative paths are relative to the manifest.
+
+    Parameters:
+    - file_name: str - The path to the manifest.
+
+    Returns:
+    - List[tuple] - The job name and the input path of every line.
+    """
+    base = os.path.dirname(os.path.abspath(file_name))
+    jobs = []
+    with open(file_name) as fp:
+        for line in fp:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = line.split('\t')
+            name = record_file_name(fields[1] if len(fields) > 1 else os.path.basename(fields[0]))
+            if name in {job for job, _ in jobs}:
+                raise ValueError(f"Duplicate job name in {file_name}: {name}")
+            jobs.append((name, os.path.join(base, fields[0])))
+    return jobs
+
+
+def is_fasta_file(file_name):
+    """
+    Tells whether a file (plain or gzip compressed) is a FASTA file, from its first character.
+    """
+    with (gzip.open if file_name.endswith('.gz') else open)(file_name, 'rb') as file:
+        return file.read(1) == b'>'
+
+
+def checkpoint_files(out_dir, job, record):
+    """
+    Returns the checkpoint files of a record.
+
+    Parameters:
+    - out_dir: str - The output directory of the batch.
+    - job: str - The job name.
+    - record: str - The record name.
+
+    Returns:
+    - dict - The paths of the 'monomers' (.monb) and of the consensuses they were searched with
+      ('monomers_settings', None for a monomers file input), the 'distances' cache, the 'families' and the 'grm'
+      data (.npz), and the 'base' name of the diagrams.
+    """
+    base = os.path.join(out_dir, job, record_file_name(record))
+    return {'monomers': f"{base}.monb", 'monomers_settings': f"{base}.monb.json",
+            'distances': f"{base}.distances.sqlite",
+            'families': f"{base}.families.npz", 'grm': f"{base}.grm.npz", 'base': base}
+
+
+def batch_records(jobs, out_dir, failed, settings):
+    """
+    Yields the records of every job with their checkpoint files, reading the FASTA inputs one record at a time.
+
+    The sequence of a record is only read in if its monomers have not been checkpointed with the current
+    consensuses yet. A monomers file is a single record named after its job, whose monomers checkpoint is the
+    file itself.
+
+    Parameters:
+    - jobs: List[tuple] - The job names and input paths (see read_manifest).
+    - out_dir: str - The output directory of the batch.
+    - failed: list - Receives (job, None, 'read', error) for every input that cannot be read.
+    - settings: dict - The settings of the batch (see run_batch).
+
+    Returns:
+    - Iterator[tuple] - The job, the record name, its checkpoint files and its sequence (None if not needed).
+    """
+    for job, path in jobs:
+        try:
+            b_fasta = is_fasta_file(path)
+            os.makedirs(os.path.join(out_dir, job), exist_ok=True)
+            if not b_fasta:
+                files = checkpoint_files(out_dir, job, job)
+                files['monomers'], files['monomers_settings'] = path, None
+                yield job, job, files, None
+                continue
+            def checkpointed(record):
+                return _is_checkpointed(checkpoint_files(out_dir, job, record), 'monomers', settings)
+
+            for record, seq in iter_fasta_records(path, checkpointed):
+                yield job, record, checkpoint_files(out_dir, job, record), seq
+        except OSError as error:
+            print(f"Failed to read {path}: {error}")
+            failed.append((job, None, 'read', str(error)))
+
+
+def _submit_next(executor, running, record, stage, seq, settings, rows):
+    """
+    Submits the first stage of a record after stage whose checkpoint is missing or stale, or stores the summary
+    rows of the record when all its stages are done.
+    """
+    no, job, _, files = record
+    for next_stage in BATCH_STAGES[BATCH_STAGES.index(stage) + 1 if stage else 0:]:
+        if not _is_checkpointed(files, next_stage, settings):
+            args = (files, seq, settings) if next_stage == 'monomers' else (files, settings)
+            running[executor.submit(_STAGE_TASKS[next_stage], *args)] = (record, next_stage)
+            return
+    rows[no] = grm_summary(files, job, record[2], settings['limits'])
+
+
+def _collect(executor, running, settings, rows, failed):
+    """
+    Waits for finished tasks and submits the next stage of their records.
+    """
+    done, _ = wait(running, return_when=FIRST_COMPLETED)
+    for future in done:
+        record, stage = running.pop(future)
+        try:
+            future.result()
+        except Exception as error:
+            print(f"Failed {record[1]}/{record[2]} at stage {stage}: {error!r}")
+            failed.append((record[1], record[2], stage, repr(error)))
+            continue
+        print(f"Done {record[1]}/{record[2]}: {stage}")
+        _submit_next(executor, running, record, stage, None, settings, rows)
+
+
+def _stage_settings(stage, settings, files):
+    """
+    Returns the settings a checkpoint of the stage depends on, as a JSON string: the batch settings it uses,
+    including the consensuses, and the fingerprints of the upstream checkpoints it reads.
+    """
+    names, upstream = {'monomers': (('monomer_cons',), ()),
+                       'families': (('monomer_cons', 'limits', 'pruning', 'clustering'), ('monomers',)),
+                       'grm': (('monomer_cons', 'limits', 'pruning', 'clustering', 'step', 'max_period', 'b_draw',
+                                'out_format'), ('monomers', 'families'))}[stage]
+    # The consensuses do not apply to the monomers of a monomers file input.
+    stage_settings = {name: settings[name] for name in names
+                      if name != 'monomer_cons' or files['monomers_settings'] is not None}
+    stage_settings.update({f"{name}_checkpoint": _fingerprint(files[name]) for name in upstream})
+    return json.dumps(stage_settings, sort_keys=True)
+
+
+def _fingerprint(file_name):
+    """
+    Returns the size and modification time of a checkpoint, which change whenever it is rewritten.
+    """
+    stat = os.stat(file_name)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _is_checkpointed(files, stage, settings):
+    """
+    Tells whether the checkpoint of a stage exists and was made with the current settings from the current
+    upstream checkpoints.
+    """
+    if not os.path.exists(files[stage]):
+        return False
+    if stage == 'monomers':
+        # A monomers file input is its own checkpoint; a searched one records its consensuses next to it.
+        if files['monomers_settings'] is None:
+            return True
+        if not os.path.exists(files['monomers_settings']):
+            return False
+        with open(files['monomers_settings']) as fp:
+            return fp.read() == _stage_settings(stage, settings, files)
+    with np.load(files[stage]) as data:
+        return str(data['settings']) == _stage_settings(stage, settings, files)
+
+
+def _save_checkpoint(file_name, arrays):
+    """
+    Writes a .npz checkpoint through a temporary file, so an interrupted write never leaves a checkpoint behind.
+    """
+    with open(f"{file_name}.tmp", "wb") as file:
+        np.savez(file, **arrays)
+    os.replace(f"{file_name}.tmp", file_name)
+
+
+def monomers_stage(files, seq, settings):
+    """
+    Batch stage: finds the monomers of a record and checkpoints them as a binary monomers file, followed by the
+    consensuses they were searched with.
+    """
+    if os.path.exists(files['monomers_settings']):
+        os.remove(files['monomers_settings'])
+    monomers = find_record_monomers(seq, settings['monomer_cons'])
+    write_binary_monomers(f"{files['monomers']}.tmp", monomers)
+    os.replace(f"{files['monomers']}.tmp", files['monomers'])
+    with open(f"{files['monomers_settings']}.tmp", "w") as fp:
+        fp.write(_stage_settings('monomers', settings, files))
+    os.replace(f"{files['monomers_settings']}.tmp", files['monomers_settings'])
+
+
+def families_stage(files, settings):
+    """
+    Batch stage: detects the families of a record at every limit and checkpoints them.
+    """
+    monomers = read_monomers_file(files['monomers'], 0)
+    with DistanceCache(files['distances']) as cache:
+        families_of_limit = detect_families(monomers, settings['limits'], settings['pruning'], 1, cache,
+                                            settings['clustering'])
+    arrays = {'settings': np.array(_stage_settings('families', settings, files))}
+    for limit, families in families_of_limit.items():
+        apply_families(monomers, families)
+        arrays[f"offsets_{limit:g}"] = monomers.family_offsets
+        arrays[f"members_{limit:g}"] = monomers.family_members
+    _save_checkpoint(files['families'], arrays)
+
+
+def grm_stage(files, settings):
+    """
+    Batch stage: computes the HOR layout and the GRM of a record at every limit (drawing the diagrams if asked)
+    and checkpoints the family labels and the GRM data.
+    """
+    monomers = read_monomers_file(files['monomers'], 0)
+    arrays = {'settings': np.array(_stage_settings('grm', settings, files))}
+    with np.load(files['families']) as data:
+        families_of_limit = {limit: (data[f"offsets_{limit:g}"], data[f"members_{limit:g}"])
+                             for limit in settings['limits']}
+    for limit, (offsets, members) in families_of_limit.items():
+        apply_families(monomers, [members[offsets[k]: offsets[k + 1]].tolist() for k in range(len(monomers))])
+        analysis = analysis_arrays(monomers, settings['step'], settings['max_period'])
+        if settings['b_draw']:
+            draw_annotation({'monomers': monomers, 'families': monomers.families()},
+                            files['base'] if len(settings['limits']) == 1 else f"{files['base']}.L{limit:g}",
+                            settings['out_format'], settings['max_period'], settings['step'])
+        # The families and the positions are already checkpointed by the earlier stages.
+        arrays.update({f"{name}_{limit:g}": analysis[name] for name in ('labels', 'freq', 'frag', 'gap', 'gap_len')})
+        arrays[f"families_{limit:g}"] = np.count_nonzero(monomers.family_sizes() > 1)
+    _save_checkpoint(files['grm'], arrays)
+
+
+_STAGE_TASKS = {'monomers': monomers_stage, 'families': families_stage, 'grm': grm_stage}
+
+
+def grm_summary(files, job, record, limits):
+    """
+    Returns the summary rows of a record from its GRM checkpoint: the job, the record, the limit, the number of
+    monomers, the number of families with more than one member and the most frequent period.
+    """
+    rows = []
+    with np.load(files['grm']) as data:
+        for limit in limits:
+            freq = data[f"freq_{limit:g}"]
+            rows.append((job, record, limit, len(data[f"labels_{limit:g}"]), int(data[f"families_{limit:g}"]),
+                         int(np.argmax(freq)) if freq.any() else 0))
+    return rows
+
+
+def write_batch_summary(file_name, rows):
+    """
+    Writes the summary rows of a batch as a tab-separated file.
+
+    Parameters:
+    - file_name: str - The path to the output file.
+    - rows: List[tuple] - The rows of grm_summary.
+    """
+    with open(file_name, "w") as fp:
+        fp.write("job\trecord\tlimit\tmonomers\tfamilies\ttop_period\n")
+        for job, record, limit, no, families, top_period in rows:
+            fp.write(f"{job}\t{record}\t{limit:g}\t{no}\t{families}\t{top_period}\n")
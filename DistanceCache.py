@@ -0,0 +1,120 @@
+import hashlib
+import sqlite3
+
+
+class DistanceCache:
+    """
+    Persistent, content-addressed store of pairwise edit distances between monomer sequences.
+
+    Distances are keyed by the digests of both sequences, so they are reused by any later run on the same
+    sequences whatever their order, the --start offset or the divergence limit. Rows are stamped with the
+    run (generation) that last used them, and the least recently used rows are evicted once the store holds
+    more than max_entries distances.
+
+    A bounded alignment that stopped early is stored as a negative distance -d, meaning the distance is at least
+    d; a later exact distance or a larger bound replaces it.
+    """
+
+    def __init__(self, file_name, max_entries=20000000):
+        self.max_entries = max_entries
+        self.connection = sqlite3.connect(file_name)
+        self.connection.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            CREATE TABLE IF NOT EXISTS distances (
+                a BLOB NOT NULL, b BLOB NOT NULL, distance INTEGER NOT NULL, used INTEGER NOT NULL,
+                PRIMARY KEY (a, b)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS distances_used ON distances (used);
+            CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            INSERT OR IGNORE INTO meta VALUES ('generation', 0);
+            UPDATE meta SET value = value + 1 WHERE name = 'generation';
+        """)
+        self.generation = self.connection.execute("SELECT value FROM meta WHERE name = 'generation'").fetchone()[0]
+        self.connection.commit()
+        self.distances = {}
+        self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def key(seq):
+        """
+        Returns the content digest of a sequence.
+
+        Parameters:
+        - seq: str - The monomer sequence.
+
+        Returns:
+        - bytes - The 16-byte digest used as cache key.
+        """
+        return hashlib.blake2b(seq.encode('latin-1'), digest_size=16).digest()
+
+    def preload(self, seqs):
+        """
+        Loads every cached distance between the given sequences into memory and marks them as used.
+
+        Parameters:
+        - seqs: List[str] - The monomer sequences of the current run.
+
+        Returns:
+        - List[bytes] - The cache key of every sequence, in the given order.
+        """
+        keys = [self.key(seq) for seq in seqs]
+        cursor = self.connection.cursor()
+        cursor.execute("CREATE TEMP TABLE IF NOT EXISTS run_keys (h BLOB PRIMARY KEY)")
+        cursor.execute("DELETE FROM run_keys")
+        cursor.executemany("INSERT OR IGNORE INTO run_keys VALUES (?)", ((k,) for k in keys))
+        in_run = "a IN (SELECT h FROM run_keys) AND b IN (SELECT h FROM run_keys)"
+        self.distances.update(((a, b), d) for a, b, d in cursor.execute(
+            f"SELECT a, b, distance FROM distances WHERE {in_run}"))
+        cursor.execute(f"UPDATE distances SET used = ? WHERE {in_run}", (self.generation,))
+        self.connection.commit()
+        return keys
+
+    def get(self, a, b):
+        """
+        Returns the cached edit distance between the sequences with keys a and b, or None.
+        """
+        return self.distances.get((a, b) if a <= b else (b, a))
+
+    def put(self, a, b, distance):
+        """
+        Records the edit distance between the sequences with keys a and b (or -d for a distance of at least d);
+        it is written on flush.
+        """
+        pair = (a, b) if a <= b else (b, a)
+        known = self.distances.get(pair)
+        if known is None or (known < 0 and (distance >= 0 or distance < known)):
+            self.distances[pair] = distance
+            self.pending.append((*pair, distance, self.generation))
+
+    def flush(self, b_evict=True):
+        """
+        Writes the new distances and evicts the least recently used ones above max_entries.
+
+        Parameters:
+        - b_evict: bool - Flag to run the eviction; intermediate flushes that only checkpoint the new distances
+          of a running detection skip it.
+        """
+        if self.pending:
+            self.connection.executemany("INSERT OR REPLACE INTO distances VALUES (?, ?, ?, ?)", self.pending)
+            self.pending = []
+        if not b_evict:
+            self.connection.commit()
+            return
+        excess = self.connection.execute("SELECT COUNT(*) FROM distances").fetchone()[0] - self.max_entries
+        if excess > 0:
+            self.connection.execute("DELETE FROM distances WHERE (a, b) IN "
+                                    "(SELECT a, b FROM distances ORDER BY used LIMIT ?)", (excess,))
+        self.connection.commit()
+
+    def close(self):
+        """
+        Flushes the pending distances and closes the store.
+        """
+        self.flush()
+        self.connection.close()
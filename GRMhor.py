@@ -1,288 +1,1084 @@
-import edlib
-from tkinter import Canvas, Tk
-import seaborn as sns
-import colorcet as cc
-import matplotlib.pyplot as plt
-
-
-
-
-class Monomer:
-    """
-    Represents a monomer with properties like position, distance to next, divergence scores, orientation, and sequence.
-    Additional properties include family, row, column positions, and monomer number for internal tracking.
-    """
-
-    def __init__(self, pos, dst, div, div2, ort, seq):
-        self.pos = int(pos)
-        self.dst = int(dst)
-        self.div = float(div)
-        self.div2 = int(div2)
-        self.ort = ort
-        self.seq = seq
-        self.family = []
-        self.row = -1
-        self.col = -1
-        self.colStart = -1
-        self.monNo = -1
-
-    def __str__(self):
-        return f"{self.pos} {self.dst} {self.div:.2f} {self.seq}"
-
-
-def draw_grm_and_mdd(series, monomers, s_file_name, b_block_lines, xmax, ymax, xtics_period, ytics_period):
-    """
-    Draws Genome Repeat Map (GRM) and Monomer Distance Distribution (MDD) based on the analysis of monomer sequences.
-
-    Parameters:
-    - series: List[int] - The sequence of monomer indices for analysis.
-    - monomers: List[Monomer] - The list of Monomer objects.
-    - s_file_name: str - The base name for output files.
-    - b_block_lines: bool - Flag to draw block lines.
-    - xmax: int - Maximum x-axis value for plots.
-    - ymax: int - Maximum y-axis value for plots.
-    - xtics_period: int - X-axis tick period.
-    - ytics_period: int - Y-axis tick period.
-    """
-    freq, frag, gap, gap_len = grm(series, monomers)
-    sorted_freq = sorted(freq, reverse=True)
-
-    fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(12, 12))
-    plt.rcParams['font.serif'] = 'Helvetica'
-    plt.subplots_adjust(hspace=0.23)
-    ax1.tick_params(labelsize=30)
-    ax2.tick_params(labelsize=30)
-
-    ax1.plot(freq, color='black')
-    for i in range(7):
-        idx = freq.index(sorted_freq[i])
-        ax1.text(idx, sorted_freq[i], idx, ha='center', va='bottom', fontsize=20)
-
-    ax1.set_xlabel('Period', fontsize=30)
-    ax1.set_ylabel('Frequency', fontsize=30)
-    ax1.set_xlim(0, xmax)
-    ax1.set_ylim(0, max(freq) + 10 * max(freq) / 100)
-    ax1.set_xticks(range(0, xmax + 1, 5))
-
-    ax2.plot(frag, marker='o', fillstyle='full', markersize=0.4, linestyle='', color='black')
-    if b_block_lines:
-        for i in range(len(gap)):
-            ax2.plot([gap[i], gap[i]], [0, ymax], color='red', linewidth=0.1)
-            ax2.text(gap[i], ymax, gap_len[i], ha='center', va='bottom', fontsize=2)
-
-    ax2.set_xlabel('Index', fontsize=30)
-    ax2.set_ylabel('Period', fontsize=30)
-    ax2.grid(True, which='major', linestyle='dotted', linewidth=0.3, color='gray')
-
-    ax2.set_xlim(0, len(frag))
-    ax2.set_ylim(0, ymax)
-    ax2.set_yticks(range(0, ymax + 1, 10))
-
-    plt.savefig(f"{s_file_name}.GRM_MDD.pdf", format='pdf', bbox_inches='tight', pad_inches=0.01)
-
-
-def grm(series, monomers):
-    """
-    Generates Genome Repeat Map (GRM) data from a series of monomer sequences.
-
-    Parameters:
-    - series: List[int] - The sequence of monomer indices for analysis.
-    - monomers: List[Monomer] - The list of Monomer objects.
-
-    Returns:
-    - Tuple: A tuple containing frequency, fragment distances, gap positions, and gap lengths.
-    """
-    step = 1
-    freq = [0] * 61
-    frag = [0] * len(series)
-    for i in range(len(series) - step - 1):
-        match = series[i:i + step]
-        for j in range(i + step, len(series) - step):
-            subject = series[j:j + step]
-            if match == subject:
-                fragment = j - i
-                frag[i] = fragment
-                if fragment < 61:
-                    freq[fragment] += 1
-                break
-    gap = []
-    gap_len = []
-    for i in range(len(monomers) - 1):
-        if monomers[i + 1].pos - monomers[i].pos > 1000:
-            gap.append(i + 1)
-            gap_len.append(monomers[i + 1].pos - monomers[i].pos)
-
-    return freq, frag, gap, gap_len
-
-
-def draw_hor_structure(monomers, file_name, b_numbers, b_position_marks_blocks, b_mers_marks, b_alpha_positions,
-                       f_cube_proportions):
-    """
-    Visualizes the Higher Order Repeat (HOR) structure of monomers using a graphical representation.
-
-    Parameters:
-    - monomers: List[Monomer] - The list of Monomer objects.
-    - file_name: str - The base name for the output file.
-    - b_numbers: bool - Flag to include monomer sequence numbers.
-    - b_position_marks_blocks: bool - Flag to mark positions with blocks.
-    - b_mers_marks: bool - Flag to include tags at the first occurrence above each monomer.
-    - b_alpha_positions: bool - Flag to include position of the first monomer in the HOR.
-    - f_cube_proportions: float - Factor to adjust the size of each square in the visualization.
-
-    Returns:
-    - List[int] - The series of monomer indices used for the GRM analysis.
-    """
-    x, y = [], []
-    z = {}
-    bx, by, mx, my = [], [], [], []
-    pos_y, pos_pos = [], []
-    j = i = 10
-    pos_y.append(i)
-    pos_pos.append(monomers[0].pos)
-    last = maxlast = -1
-    fill_and_fit_columns(monomers)
-    for alpha in monomers:
-        x.append(alpha.col)
-
-        if alpha.col <= last:
-            i += 1
-            pos_y.append(i)
-            pos_pos.append(alpha.pos)
-
-        if alpha.col > maxlast and len(alpha.family) > 1:
-            maxlast = alpha.col
-            mx.append(alpha.col)
-            my.append(i)
-        last = alpha.col
-        y.append(i)
-        z[(alpha.col, i)] = j
-        j += 1
-
-        if alpha.dst > 1000:
-            bx.append(alpha.col)
-            by.append(i)
-
-    palette = sns.color_palette(cc.palette.glasbey_light, n_colors=10000).as_hex()
-    c = [i if x.count(i) > 1 else 0 for i in x]
-
-    w = h = 0.8 * f_cube_proportions
-    shift = 10 * f_cube_proportions
-    app = Tk()
-    canvas = Canvas(app, width=max(x) * f_cube_proportions + 10 + shift, height=max(y) * f_cube_proportions + 20)
-    canvas.pack()
-
-    for i in range(len(x)):
-        canvas.create_rectangle(x[i] * f_cube_proportions + shift, y[i] * f_cube_proportions,
-                                x[i] * f_cube_proportions + w + shift, y[i] * f_cube_proportions + h, outline='black',
-                                fill=palette[c[i]], width=0.07 * f_cube_proportions)
-        if b_numbers:
-            canvas.create_text(x[i] * f_cube_proportions + shift, y[i] * f_cube_proportions, text=i,
-                               font=("Helvetica", 1))
-
-    for i in range(len(bx)):
-        canvas.create_oval(bx[i] * f_cube_proportions + shift, by[i] * f_cube_proportions,
-                           bx[i] * f_cube_proportions + w + shift, by[i] * f_cube_proportions + h, fill='white',
-                           outline='red', width=0.07 * f_cube_proportions)
-        if b_position_marks_blocks:
-            txt = f"{z[bx[i], by[i]]} ({monomers[z[bx[i], by[i]]].pos})"
-            canvas.create_text(bx[i] * f_cube_proportions + shift, by[i] * f_cube_proportions, text=txt,
-                               font=("Helvetica", 1))
-            if z[bx[i], by[i]] > 0:
-                txt = f"{z[bx[i], by[i]] - 1} ({monomers[z[bx[i], by[i]] - 1].pos})"
-                canvas.create_text(bx[i] * f_cube_proportions + shift, (by[i] - 1) * f_cube_proportions, text=txt,
-                                   font=("Helvetica", 1))
-
-    if b_alpha_positions:
-        for i, pos in enumerate(pos_y):
-            canvas.create_text(shift - 1 * f_cube_proportions, pos * f_cube_proportions + h / 2, text=f"{pos_pos[i]:,}",
-                               font=("Helvetica", 1))
-
-    if b_mers_marks:
-        for i, mx_val in enumerate(mx):
-            canvas.create_text(mx_val * f_cube_proportions + shift + w / 2, my[i] * f_cube_proportions - 1,
-                               text=f"m{i + 1}", font=("Helvetica", 1))
-
-    canvas.update()
-    canvas.postscript(file=f"{file_name}.HORscheme.ps", colormode='color',
-                      width=max(x) * f_cube_proportions + 10 + shift, height=max(y) * f_cube_proportions + 20)
-
-    return x
-
-
-def fill_and_fit_columns(monomers):
-    """
-    Assigns columns to monomers based on their families for visualization purposes.
-
-    Parameters:
-    - monomers: List[Monomer] - The list of Monomer objects.
-    """
-    i = 0
-    for mon in monomers:
-        if mon.family:
-            for mem in mon.family:
-                monomers[mem].col = monomers[mem].colStart = i
-            i += 1
-    if monomers[-1].col < monomers[0].col:
-        monomers[-1].col = i
-
-
-def find_families(monomers, limit):
-    """
-    Groups monomers into families based on sequence similarity.
-
-    Parameters:
-    - monomers: List[Monomer] - The list of Monomer objects to analyze.
-    - limit: int - The maximum divergence percentage allowed for monomers to be considered part of the same family.
-    """
-    no = len(monomers)
-    progress_step = max(no // 20, 1)
-    for i in range(no - 1):
-        if i % progress_step == 0:
-            progress_percentage = i / no * 100
-            print(f"Progress: {progress_percentage:5.1f}%")
-        for j in range(i, no):
-            ed = edlib.align(monomers[i].seq, monomers[j].seq)
-            edp = ed["editDistance"] / len(monomers[i].seq) * 100
-            if edp < limit:
-                monomers[i].family.append(j)
-
-
-def join_families_v03(monomers):
-    """
-    Merges overlapping families of monomers to form larger, unified families.
-
-    Parameters:
-    - monomers: List[Monomer] - The list of Monomer objects to analyze and merge families.
-    """
-    for i in range(len(monomers)):
-        if len(monomers[i].family) > 1:
-            for j in range(len(monomers)):
-                if i == j:
-                    continue
-                if set(monomers[i].family) & set(monomers[j].family):
-                    union = sorted(set(monomers[i].family) | set(monomers[j].family))
-                    monomers[i].family = monomers[j].family = []
-                    monomers[union[0]].family = union
-
-
-def read_monomers_file(file_name, start):
-    """
-    Reads a file containing monomer data and returns a list of Monomer objects.
-
-    Parameters:
-    - file_name: str - The path to the file to read.
-    - start: int - The starting index to begin processing from the file.
-
-    Returns:
-    - List[Monomer] - A list of Monomer objects read from the file.
-    """
-    monomers = []
-    with open(file_name) as file:
-        for i, line in enumerate(file.readlines()):
-            if i >= start:
-                parts = line.split()
-                if len(parts) == 6:
-                    monomers.append(Monomer(*parts))
-                else:
-                    monomers.append(Monomer(i, len(parts[0]), 0, 0, 'd', parts[0].strip()))
-    return monomers
+import os
+from bisect import bisect_left
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+from multiprocessing import shared_memory
+
+import numpy as np
+from Alignment import base_counts, bounded_distances, feasible_partners, max_edit_distance, max_edit_distances
+from HORscheme import hex_to_rgb, write_raster_scheme, write_tile_pyramid, write_vector_scheme
+from Metrics import current_metrics, instrumented
+from MonomerStore import MonomerStore, is_binary_monomers_file, load_binary_monomers
+
+# Above this many monomers the 'auto' MDD mode draws a density histogram instead of individual points.
+MDD_DENSITY_THRESHOLD = 200000
+
+
+@instrumented('draw_grm_and_mdd', lambda args, result: (len(args[1]), 0))
+def draw_grm_and_mdd(series, monomers, s_file_name, b_block_lines, xmax, ymax, xtics_period, ytics_period, step=1,
+                     mdd_mode='auto', density_columns=2000):
+    """
+    Draws Genome Repeat Map (GRM) and Monomer Distance Distribution (MDD) based on the analysis of monomer sequences.
+
+    In density mode the MDD points are binned with numpy into a density_columns x ymax histogram that is embedded
+    as a single raster layer, so the time and size of the PDF depend on the resolution and not on the number
+    of monomers. Gap lines are always drawn as one line collection.
+
+    Parameters:
+    - series: List[int] - The sequence of monomer indices for analysis.
+    - monomers: MonomerStore - The monomers.
+    - s_file_name: str - The base name for output files.
+    - b_block_lines: bool - Flag to draw block lines.
+    - xmax: int - Maximum x-axis value for plots.
+    - ymax: int - Maximum y-axis value for plots.
+    - xtics_period: int - X-axis tick period.
+    - ytics_period: int - Y-axis tick period.
+    - step: int - Number of consecutive family labels compared by the GRM.
+    - mdd_mode: str - 'points' draws every MDD point, 'density' draws the binned histogram and 'auto' switches to
+      density above MDD_DENSITY_THRESHOLD monomers.
+    - density_columns: int - Number of index bins of the density histogram.
+    """
+    # matplotlib is only needed for drawing; the figure is saved without pyplot, so no GUI backend is loaded.
+    import matplotlib
+    from matplotlib.figure import Figure
+
+    freq, frag, gap, gap_len = grm(series, monomers, step, max(60, xmax))
+    b_density = mdd_mode == 'density' or (mdd_mode == 'auto' and len(frag) > MDD_DENSITY_THRESHOLD)
+
+    matplotlib.rcParams['font.serif'] = 'Helvetica'
+    fig = Figure(figsize=(12, 12))
+    ax1, ax2 = fig.subplots(2, 1)
+    fig.subplots_adjust(hspace=0.23)
+    ax1.tick_params(labelsize=30)
+    ax2.tick_params(labelsize=30)
+
+    ax1.plot(freq, color='black')
+    for idx in np.argsort(-np.asarray(freq), kind='stable')[:7]:
+        ax1.text(idx, freq[idx], idx, ha='center', va='bottom', fontsize=20)
+
+    ax1.set_xlabel('Period', fontsize=30)
+    ax1.set_ylabel('Frequency', fontsize=30)
+    ax1.set_xlim(0, xmax)
+    ax1.set_ylim(0, max(freq) + 10 * max(freq) / 100)
+    ax1.set_xticks(range(0, xmax + 1, 5))
+
+    if b_density:
+        frag = np.asarray(frag)
+        columns = max(min(len(frag), density_columns), 1)
+        histogram, _, _ = np.histogram2d(np.arange(len(frag)), frag, bins=[columns, ymax + 1],
+                                         range=[[0, max(len(frag), 1)], [-0.5, ymax + 0.5]])
+        ax2.imshow(np.log1p(histogram.T), cmap='Greys', origin='lower', aspect='auto', interpolation='nearest',
+                   extent=(0, len(frag), -0.5, ymax + 0.5), vmin=0, rasterized=True)
+    else:
+        ax2.plot(frag, marker='o', fillstyle='full', markersize=0.4, linestyle='', color='black')
+    if b_block_lines and len(gap):
+        ax2.vlines(gap, 0, ymax, colors='red', linewidth=0.1)
+        if not b_density:
+            for i in range(len(gap)):
+                ax2.text(gap[i], ymax, gap_len[i], ha='center', va='bottom', fontsize=2)
+
+    ax2.set_xlabel('Index', fontsize=30)
+    ax2.set_ylabel('Period', fontsize=30)
+    ax2.grid(True, which='major', linestyle='dotted', linewidth=0.3, color='gray')
+
+    ax2.set_xlim(0, len(frag))
+    ax2.set_ylim(0, ymax)
+    ax2.set_yticks(range(0, ymax + 1, 10))
+
+    fig.savefig(f"{s_file_name}.GRM_MDD.pdf", format='pdf', bbox_inches='tight', pad_inches=0.01, dpi=300)
+
+
+@instrumented('grm', lambda args, result: (len(args[0]), 0))
+def grm(series, monomers, step=1, max_period=60):
+    """
+    Generates Genome Repeat Map (GRM) data from a series of monomer sequences.
+
+    For every position the next occurrence of the same step-long word of family labels is found with a hash map
+    of the nearest later occurrences, so the whole series is processed in linear time.
+
+    Parameters:
+    - series: List[int] - The sequence of monomer indices for analysis.
+    - monomers: MonomerStore - The monomers.
+    - step: int - Number of consecutive family labels compared at a time (k-mer length).
+    - max_period: int - The largest period counted in the frequency histogram.
+
+    Returns:
+    - Tuple: A tuple containing frequency, fragment distances, gap positions, and gap lengths.
+    """
+    freq, frag = grm_frequencies(series, step, max_period)
+    distances = np.diff(monomers.pos)
+    gap = np.flatnonzero(distances > 1000)
+
+    return freq.tolist(), frag.tolist(), (gap + 1).tolist(), distances[gap].tolist()
+
+
+def grm_frequencies(series, step=1, max_period=60):
+    """
+    Computes the GRM fragment distances and their frequency histogram from a series of family labels.
+
+    Parameters:
+    - series: List[int] - The family label of every monomer.
+    - step: int - Number of consecutive family labels compared at a time (k-mer length).
+    - max_period: int - The largest period counted in the frequency histogram.
+
+    Returns:
+    - tuple: The frequency of every period up to max_period and the fragment distance of every monomer
+      (0 where the word does not recur), as numpy arrays.
+    """
+    no = len(series)
+    frag = np.zeros(no, dtype=np.int64)
+    words = series if step == 1 else [tuple(series[i:i + step]) for i in range(max(no - step + 1, 0))]
+    next_occurrence = {}
+    for i in range(no - step - 2, -1, -1):
+        # Only words starting at j in [i + step, no - step) may match the word starting at i.
+        j = i + step
+        if j < no - step:
+            next_occurrence[words[j]] = j
+        j = next_occurrence.get(words[i])
+        if j is not None:
+            frag[i] = j - i
+    freq = np.bincount(frag[(frag > 0) & (frag <= max_period)], minlength=max_period + 1)
+    return freq, frag
+
+
+@instrumented('draw_hor_structure', lambda args, result: (len(args[0]), 0))
+def draw_hor_structure(monomers, file_name, b_numbers, b_position_marks_blocks, b_mers_marks, b_alpha_positions,
+                       f_cube_proportions, out_format='ps', raster_scale=4):
+    """
+    Visualizes the Higher Order Repeat (HOR) structure of monomers using a graphical representation.
+
+    The scheme is written without a display: vector formats are streamed shape by shape and PNG is rendered
+    into a numpy pixel buffer, both in time linear in the number of monomers.
+
+    Parameters:
+    - monomers: MonomerStore - The monomers.
+    - file_name: str - The base name for the output file.
+    - b_numbers: bool - Flag to include monomer sequence numbers.
+    - b_position_marks_blocks: bool - Flag to mark positions with blocks.
+    - b_mers_marks: bool - Flag to include tags at the first occurrence above each monomer.
+    - b_alpha_positions: bool - Flag to include position of the first monomer in the HOR.
+    - f_cube_proportions: float - Factor to adjust the size of each square in the visualization.
+    - out_format: str - Output format: 'ps', 'svg', 'pdf', 'png' (labels are not drawn in PNG) or 'tiles'
+      (a directory with a PNG tile pyramid for zooming and panning large arrays).
+    - raster_scale: float - Pixels per canvas unit of the PNG output.
+
+    Returns:
+    - List[int] - The series of monomer indices used for the GRM analysis.
+    """
+    import colorcet as cc
+
+    layout = hor_layout(monomers)
+    rgb = hex_to_rgb(cc.palette.glasbey_light)[np.asarray(layout['colour']) % len(cc.palette.glasbey_light)]
+    out_name = f"{file_name}.HORscheme.{out_format}"
+    if out_format == 'png':
+        write_raster_scheme(out_name, layout, rgb, f_cube_proportions, raster_scale)
+    elif out_format == 'tiles':
+        write_tile_pyramid(out_name, layout, rgb)
+    else:
+        write_vector_scheme(out_name, out_format, layout, rgb, f_cube_proportions, b_numbers,
+                            b_position_marks_blocks, b_mers_marks, b_alpha_positions)
+    return layout['x']
+
+
+def hor_layout(monomers):
+    """
+    Computes the row/column layout of the HOR scheme: a new row starts whenever the column does not increase.
+
+    Parameters:
+    - monomers: MonomerStore - The monomers.
+
+    Returns:
+    - dict - The column ('x'), row ('y'), genomic position ('pos') and colour index ('colour') of every monomer,
+      and the monomer indices of gap blocks ('blocks'), of row starts ('row_starts') and of the first
+      occurrence of each multi-member family column ('mers').
+    """
+    fill_and_fit_columns(monomers)
+    x = monomers.col
+    # A new row starts whenever the column does not increase.
+    b_new_row = x <= np.concatenate(([-1], x[:-1]))
+    y = 10 + np.cumsum(b_new_row)
+    # The first occurrence of a family column: a multi-member family whose column exceeds all earlier ones.
+    b_multi = monomers.family_sizes() > 1
+    previous_max = np.concatenate(([-1], np.maximum.accumulate(np.where(b_multi, x, -1))[:-1]))
+    mers = np.flatnonzero(b_multi & (x > previous_max))
+    blocks = np.flatnonzero(monomers.dst > 1000)
+
+    _, inverse, counts = np.unique(x, return_inverse=True, return_counts=True)
+    colour = np.where(counts[inverse] > 1, x, 0)
+    return {'x': x.tolist(), 'y': y.tolist(), 'pos': monomers.pos.tolist(), 'colour': colour.tolist(),
+            'blocks': blocks.tolist(), 'row_starts': [0] + np.flatnonzero(b_new_row).tolist(), 'mers': mers.tolist()}
+
+
+def analysis_arrays(monomers, step=1, max_period=60):
+    """
+    Computes the HOR layout and the GRM of monomers whose families are set, as compact arrays ready for np.savez.
+
+    Parameters:
+    - monomers: MonomerStore - The monomers, with their merged families.
+    - step: int - Number of consecutive family labels compared by the GRM.
+    - max_period: int - The largest period counted in the GRM frequencies.
+
+    Returns:
+    - dict - 'pos' (genomic position of every monomer), 'family_offsets' and 'family_members' (the families, see
+      MonomerStore), 'labels' (HOR scheme column of every monomer), 'freq' (GRM frequency of every period),
+      'frag' (MDD: period of every monomer), 'gap' and 'gap_len' (monomer index and length in bp of the gaps).
+    """
+    layout = hor_layout(monomers)
+    freq, frag, gap, gap_len = grm(layout['x'], monomers, step, max_period)
+    return {'pos': monomers.pos, 'family_offsets': monomers.family_offsets, 'family_members': monomers.family_members,
+            'labels': np.asarray(layout['x'], dtype=np.int32), 'freq': np.asarray(freq, dtype=np.int64),
+            'frag': np.asarray(frag, dtype=np.int32), 'gap': np.asarray(gap, dtype=np.int64),
+            'gap_len': np.asarray(gap_len, dtype=np.int64)}
+
+
+def fill_and_fit_columns(monomers):
+    """
+    Assigns columns to monomers based on their families for visualization purposes.
+
+    Every monomer with a non-empty family opens the next column, and all members of that family are placed in it.
+
+    Parameters:
+    - monomers: MonomerStore - The monomers.
+    """
+    if len(monomers) == 0:
+        return
+    members, columns = family_columns(monomers.family_offsets, monomers.family_members)
+    monomers.col[members] = monomers.colStart[members] = columns
+    if monomers.col[-1] < monomers.col[0]:
+        monomers.col[-1] = np.count_nonzero(monomers.family_sizes())
+
+
+def family_columns(family_offsets, family_members):
+    """
+    Numbers the non-empty families in monomer order and returns the column of every family member.
+
+    Parameters:
+    - family_offsets: np.ndarray - CSR offsets of the families (see MonomerStore).
+    - family_members: np.ndarray - CSR members of the families.
+
+    Returns:
+    - tuple: The sorted member indices and their columns, as numpy arrays.
+    """
+    sizes = np.diff(family_offsets)
+    columns = np.repeat(np.cumsum(sizes > 0) - 1, sizes)
+    # When families overlap, the last family containing a monomer sets its column.
+    members, last = np.unique(family_members[::-1], return_index=True)
+    return members, columns[::-1][last]
+
+
+@instrumented('find_families', lambda args, stats: (len(args[0]), int(args[0].seq_offsets[-1])))
+def find_families(monomers, limit, pruning='exact', q=8, family_sets=None, cache=None, distances=None,
+                  b_dedup=True):
+    """
+    Groups monomers into families based on sequence similarity: the family of monomer i is set to the monomers
+    j >= i within the divergence limit.
+
+    Parameters:
+    - monomers: MonomerStore - The monomers to analyze.
+    - limit: int - The maximum divergence percentage allowed for monomers to be considered part of the same family.
+    - pruning: str - Candidate generation before alignment: 'exact' (q-gram lemma, no pair under limit is lost),
+      'minhash' (MinHash LSH, faster but may miss pairs close to limit) or None (only the exact length and
+      base composition bounds). Candidates are aligned with edlib bounded to the largest distance below limit.
+    - q: int - The q-gram length used by the candidate generation.
+    - family_sets: FamilySets - Optional union-find that receives every family edge as it is found.
+    - cache: DistanceCache - Optional persistent distance cache consulted before aligning a pair.
+    - distances: list - Optional list that receives (i, j, divergence) for every family edge.
+    - b_dedup: bool - Align every distinct sequence only once and expand the result to its copies (see
+      duplicate_classes); the families are the same as without it.
+
+    Returns:
+    - dict - Counters with the number of pairs considered, aligned, taken from the cache and pruned, and the
+      number of distinct sequences.
+    """
+    return _family_detection(_align_families, monomers, limit, family_sets, distances, b_dedup,
+                             pruning=pruning, q=q, cache=cache)
+
+
+@instrumented('find_families', lambda args, stats: (len(args[0]), int(args[0].seq_offsets[-1])))
+def find_families_parallel(monomers, limit, processes=None, tile_size=512, pruning='exact', q=8,
+                           family_sets=None, cache=None, distances=None, b_dedup=True):
+    """
+    Groups monomers into families like find_families, aligning tiles of the pair matrix in a process pool.
+
+    The upper triangle of the pair matrix is cut into tile_size x tile_size tiles. The monomer sequences are
+    copied once into shared memory, so a task only carries its tile bounds and its candidate pairs. Family
+    members are sorted after all tiles are merged, which makes the result identical to find_families whatever
+    order the tiles finish in.
+
+    Parameters:
+    - monomers: MonomerStore - The monomers to analyze.
+    - limit: int - The maximum divergence percentage allowed for monomers to be considered part of the same family.
+    - processes: int - Number of worker processes (None uses all available cores).
+    - tile_size: int - Number of rows and columns of a tile.
+    - pruning: str - Candidate pruning mode, as in find_families.
+    - q: int - The q-gram length used by the candidate generation.
+    - family_sets: FamilySets - Optional union-find that receives the family edges as tiles are merged.
+    - cache: DistanceCache - Optional persistent distance cache; cached pairs are resolved before dispatch.
+    - distances: list - Optional list that receives (i, j, divergence) for every family edge.
+    - b_dedup: bool - Align every distinct sequence only once, as in find_families.
+
+    Returns:
+    - dict - Counters with the number of pairs considered, aligned, taken from the cache and pruned, and the
+      number of distinct sequences.
+    """
+    return _family_detection(_align_families_parallel, monomers, limit, family_sets, distances, b_dedup,
+                             processes=processes, tile_size=tile_size, pruning=pruning, q=q, cache=cache)
+
+
+def _family_detection(align, monomers, limit, family_sets, distances, b_dedup, cache=None, **options):
+    """
+    Runs a family alignment (on the distinct sequences when b_dedup is set) and records the family edges.
+    """
+    no = len(monomers)
+    stats = {'pairs': (no - 1) * (no + 2) // 2 if no > 1 else 0, 'aligned': 0, 'cached': 0, 'pruned': 0,
+             'unique': no}
+    class_of, representatives = duplicate_classes(monomers) if b_dedup else (None, None)
+    if representatives is None or len(representatives) == no:
+        edges = align(monomers, limit, stats, cache=cache, **options)
+    else:
+        stats['unique'] = len(representatives)
+        unique_edges = align(monomers.take(representatives), limit, stats, cache=cache, **options)
+        edges = expand_family_edges(unique_edges, class_of, monomers.seq_lengths(), limit)
+
+    lengths = monomers.seq_lengths().tolist()
+    families = [[] for _ in range(no)]
+    for i, j, distance in edges:
+        families[i].append(j)
+        if family_sets is not None:
+            family_sets.add(i, j)
+        if distances is not None:
+            distances.append((i, j, distance / lengths[i] * 100))
+    monomers.set_families(families)
+    if cache is not None:
+        cache.flush()
+        print(f"Cached distances used for {stats['cached']} pairs")
+    stats['pruned'] = stats['pairs'] - stats['aligned'] - stats['cached']
+    _count_family_stats(stats)
+    if stats['unique'] < no:
+        print(f"Aligned {stats['unique']} distinct sequences for {no} monomers")
+    print(f"Pruned {stats['pruned']} of {stats['pairs']} pairs")
+    return stats
+
+
+def duplicate_classes(monomers):
+    """
+    Groups the monomers with byte-identical sequences.
+
+    The distinct sequences are ordered by decreasing length (then by first occurrence). Divergences are relative to
+    the earlier monomer of a pair, so aligning each distinct pair once, relative to the longer sequence, finds
+    every pair that is under the limit in either order.
+
+    Parameters:
+    - monomers: MonomerStore - The monomers.
+
+    Returns:
+    - tuple: The class of every monomer (np.ndarray, index into the representatives) and the first monomer of
+      every class (np.ndarray), in the order above.
+    """
+    first = {}
+    class_of = np.fromiter((first.setdefault(seq, k) for k, seq in enumerate(monomers.sequences())),
+                           dtype=np.int64, count=len(monomers))
+    firsts = np.fromiter(first.values(), dtype=np.int64, count=len(first))
+    representatives = firsts[np.lexsort((firsts, -monomers.seq_lengths()[firsts]))]
+    rank = np.empty(len(monomers), dtype=np.int64)
+    rank[representatives] = np.arange(len(representatives))
+    return rank[class_of], representatives
+
+
+def expand_family_edges(unique_edges, class_of, lengths, limit):
+    """
+    Expands the family edges of the distinct sequences (see duplicate_classes) to all their copies.
+
+    Copies of the same sequence are at distance 0; a pair of copies of two distinct sequences gets their
+    distance, and is kept if it is under limit relative to the length of the earlier copy.
+
+    Parameters:
+    - unique_edges: List[tuple] - The (u, v, distance) edges found between distinct sequences.
+    - class_of: np.ndarray - The class of every monomer.
+    - lengths: np.ndarray - The sequence length of every monomer.
+    - limit: int - The maximum divergence percentage of a family.
+
+    Returns:
+    - List[tuple] - The (i, j, distance) family edges of the monomers, sorted, as find_families finds them.
+    """
+    no = len(class_of)
+    class_of = class_of.tolist()
+    copies = [[] for _ in range(max(class_of, default=-1) + 1)]
+    for k, c in enumerate(class_of):
+        copies[c].append(k)
+    neighbours = [[] for _ in copies]
+    for u, v, distance in unique_edges:
+        if u != v:
+            neighbours[u].append((v, distance))
+            neighbours[v].append((u, distance))
+    lengths = lengths.tolist()
+    edges = []
+    for i in range(no - 1):
+        c = class_of[i]
+        row = []
+        for d, members in [(0, copies[c])] + [(distance, copies[v]) for v, distance in neighbours[c]]:
+            if members[-1] >= i and d / lengths[i] * 100 < limit:
+                row.extend((j, d) for j in members[bisect_left(members, i):])
+        row.sort()
+        edges.extend((i, j, d) for j, d in row)
+    return edges
+
+
+@instrumented('find_families', lambda args, stats: (len(args[0]), int(args[0].seq_offsets[-1])))
+def find_representative_families(monomers, limit, family_sets=None, distances=None):
+    """
+    Groups monomers into families by comparing every monomer only with the current family representatives.
+
+    The monomers are visited in array order. A monomer joins the family of the closest representative within the
+    divergence limit (relative to the representative, the earlier monomer; ties go to the earliest one) or becomes
+    the representative of a new family. Copies of a sequence are not aligned again: they join the family of
+    their first copy.
+
+    This is faster than the all-pairs detection of find_families, which merges every pair under the limit
+    (single linkage), but its families can differ:
+    - two monomers under the limit of each other are split if they joined different representatives, and chains
+      of close monomers are not merged, so there can be more, smaller families;
+    - a monomer under the limit of several representatives joins only the closest, where find_families merges
+      their families;
+    - the families depend on the order of the monomers, since the first monomer of a family represents it.
+
+    Parameters:
+    - monomers: MonomerStore - The monomers to analyze.
+    - limit: int - The maximum divergence percentage allowed between a monomer and its representative.
+    - family_sets: FamilySets - Optional union-find that receives every family edge.
+    - distances: list - Optional list that receives (i, j, divergence) for every family edge.
+
+    Returns:
+    - dict - Counters with the number of pairs considered, aligned and pruned, and the number of representatives.
+    """
+    no = len(monomers)
+    stats = {'pairs': (no - 1) * (no + 2) // 2 if no > 1 else 0, 'aligned': 0, 'cached': 0, 'pruned': 0}
+    seqs = monomers.sequences()
+    lengths = monomers.seq_lengths()
+    counts = base_counts(monomers.seq_data, monomers.seq_offsets)
+    max_eds = max_edit_distances(lengths, limit)
+    first = {}
+    representative_of = np.arange(no)
+    edp_of = np.zeros(no)
+    representatives = []
+    progress_step = max(no // 20, 1)
+    for k in range(no):
+        if k % progress_step == 0:
+            current_metrics().progress(f"Progress: {k / no * 100:5.1f}%")
+        copy = first.setdefault(seqs[k], k)
+        if copy != k:
+            representative_of[k], edp_of[k] = representative_of[copy], edp_of[copy]
+            continue
+        candidates = np.array(representatives, dtype=np.int64)
+        candidates = feasible_partners(lengths, counts, k, candidates, max_eds[candidates]).tolist()
+        stats['aligned'] += len(candidates)
+        best = None
+        for r, distance in zip(candidates, bounded_distances(seqs[k], [seqs[r] for r in candidates],
+                                                             max_eds[candidates])):
+            edp = distance / len(seqs[r]) * 100
+            if distance >= 0 and (best is None or edp < edp_of[k]):
+                best, edp_of[k] = r, edp
+        if best is None:
+            representatives.append(k)
+        else:
+            representative_of[k] = best
+
+    members = [[] for _ in range(no)]
+    for k in range(no):
+        if representative_of[k] != k:
+            members[representative_of[k]].append(k)
+    families = [[] for _ in range(no)]
+    for i in range(no):
+        # Like find_families, every monomer but the last is a member of its own family.
+        family = ([(i, 0.0)] if i < no - 1 else []) + [(j, float(edp_of[j])) for j in members[i]]
+        for j, edp in family:
+            families[i].append(j)
+            if family_sets is not None:
+                family_sets.add(i, j)
+            if distances is not None:
+                distances.append((i, j, edp))
+    monomers.set_families(families)
+    stats['pruned'] = stats['pairs'] - stats['aligned']
+    stats['representatives'] = len(representatives)
+    _count_family_stats(stats)
+    print(f"Found {len(representatives)} representatives")
+    print(f"Pruned {stats['pruned']} of {stats['pairs']} pairs")
+    return stats
+
+
+def _align_families(monomers, limit, stats, pruning='exact', q=8, cache=None):
+    """
+    Aligns the candidate pairs of every monomer in this process.
+
+    Returns:
+    - List[tuple] - The (i, j, distance) family edges, sorted.
+    """
+    no = len(monomers)
+    candidates = family_candidates(monomers, limit, pruning, q)
+    seqs = monomers.sequences()
+    keys = cache.preload(seqs) if cache is not None else None
+    edges = []
+    progress_step = max(no // 20, 1)
+    for i, js in candidates:
+        if i % progress_step == 0:
+            progress_percentage = i / no * 100
+            current_metrics().progress(f"Progress: {progress_percentage:5.1f}%")
+            if cache is not None:
+                # The distances aligned so far survive an interrupted run.
+                cache.flush(b_evict=False)
+        js = [int(j) for j in js]
+        max_ed = max_edit_distance(len(seqs[i]), limit)
+        distance_of = {}
+        misses = js
+        if cache is not None:
+            misses = []
+            for j in js:
+                distance = cached_distance(cache, keys[i], keys[j], max_ed)
+                if distance is None:
+                    misses.append(j)
+                else:
+                    distance_of[j] = distance
+            stats['cached'] += len(distance_of)
+        # One batch of bounded alignments per monomer; -1 marks a distance above max_ed.
+        for j, distance in zip(misses, bounded_distances(seqs[i], [seqs[j] for j in misses], max_ed)):
+            distance_of[j] = distance
+            if cache is not None:
+                cache.put(keys[i], keys[j], distance if distance >= 0 else -(max_ed + 1))
+        stats['aligned'] += len(misses)
+        for j in js:
+            distance = distance_of[j]
+            if distance >= 0 and distance / len(seqs[i]) * 100 < limit:
+                edges.append((i, j, distance))
+    return edges
+
+
+def _align_families_parallel(monomers, limit, stats, processes=None, tile_size=512, pruning='exact', q=8,
+                             cache=None):
+    """
+    Aligns the candidate pairs tile by tile in a process pool (see find_families_parallel).
+
+    Returns:
+    - List[tuple] - The (i, j, distance) family edges, sorted.
+    """
+    no = len(monomers)
+    edges = {}
+    keys = None
+    candidates = family_candidates(monomers, limit, pruning, q)
+    if cache is not None:
+        keys = cache.preload(monomers.sequences())
+        candidates = _uncached_candidates(candidates, monomers.seq_lengths(), limit, cache, keys, edges, stats)
+    offsets = monomers.seq_offsets
+    shm = shared_memory.SharedMemory(create=True, size=max(int(offsets[-1]) + offsets.nbytes, 1))
+    try:
+        shm.buf[:offsets.nbytes] = offsets.tobytes()
+        shm.buf[offsets.nbytes: offsets.nbytes + int(offsets[-1])] = monomers.seq_data[:offsets[-1]].tobytes()
+        with ProcessPoolExecutor(max_workers=processes, initializer=_attach_sequences,
+                                 initargs=(shm.name, no)) as executor:
+            pending = set()
+            progress_step = max(no // 20, 1)
+            next_progress = 0
+            for task in _family_tiles(candidates, no, tile_size):
+                while task[0] >= next_progress:
+                    current_metrics().progress(f"Progress: {next_progress / no * 100:5.1f}%")
+                    next_progress += progress_step
+                    if cache is not None:
+                        cache.flush(b_evict=False)
+                pending.add(executor.submit(_align_tile, limit, *task, cache is not None))
+                if len(pending) > 8 * (processes or os.cpu_count()):
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    _merge_tiles(done, edges, stats, cache, keys)
+            _merge_tiles(pending, edges, stats, cache, keys)
+    finally:
+        shm.close()
+        shm.unlink()
+    return [(i, j, distance) for i in range(no - 1) for j, distance in sorted(edges.get(i, ()))]
+
+
+def _count_family_stats(stats):
+    """
+    Reports the pair counters of a family detection to the current metrics.
+    """
+    metrics = current_metrics()
+    metrics.count('edlib_calls', stats['aligned'])
+    metrics.count('candidate_pairs', stats['pairs'] - stats['pruned'])
+    metrics.count('pruned_pairs', stats['pruned'])
+    metrics.count('cached_pairs', stats['cached'])
+
+
+def _family_tiles(candidates, no, tile_size):
+    """
+    Yields the tiles of the upper triangle of the pair matrix that hold candidate pairs, as (row start, row end,
+    column start, column end, candidate pairs sorted by row).
+    """
+    rows, cols = [], []
+    for i, js in candidates:
+        rows.append(np.full(len(js), i, dtype=np.int64))
+        cols.append(np.asarray(js, dtype=np.int64))
+        if (i + 1) % tile_size == 0 or i == no - 2:
+            r0 = i // tile_size * tile_size
+            rows, cols = np.concatenate(rows), np.concatenate(cols)
+            tiles = cols // tile_size
+            for tile in np.unique(tiles):
+                in_tile = tiles == tile
+                c0 = int(tile) * tile_size
+                yield r0, min(r0 + tile_size, no - 1), c0, min(c0 + tile_size, no), \
+                    np.stack((rows[in_tile], cols[in_tile]), axis=1)
+            rows, cols = [], []
+
+
+def _uncached_candidates(candidates, lengths, limit, cache, keys, edges, stats):
+    """
+    Resolves the candidate pairs found in the distance cache and yields only the pairs left to align.
+    """
+    for i, js in candidates:
+        misses = []
+        max_ed = max_edit_distance(lengths[i], limit)
+        for j in js:
+            j = int(j)
+            distance = cached_distance(cache, keys[i], keys[j], max_ed)
+            if distance is None:
+                misses.append(j)
+            elif distance >= 0 and distance / lengths[i] * 100 < limit:
+                edges.setdefault(i, []).append((j, distance))
+        stats['cached'] += len(js) - len(misses)
+        yield i, misses
+
+
+def cached_distance(cache, a, b, max_ed):
+    """
+    Returns the cached edit distance of a pair, or None if the pair must be aligned.
+
+    Bounded alignments store a distance known only to exceed d as -d; such an entry answers the query only if
+    d is above max_ed.
+
+    Parameters:
+    - cache: DistanceCache - The distance cache.
+    - a: bytes - The key of the first sequence.
+    - b: bytes - The key of the second sequence.
+    - max_ed: int - The largest edit distance of interest.
+
+    Returns:
+    - int - The distance, a negative lower bound above max_ed, or None.
+    """
+    distance = cache.get(a, b)
+    if distance is not None and distance < 0 and -distance <= max_ed:
+        return None
+    return distance
+
+
+def _merge_tiles(futures, edges, stats, cache=None, keys=None):
+    """
+    Adds the family edges of finished tiles to the merged adjacency (and their distances to the cache, if any).
+    """
+    for future in futures:
+        tile_edges, no_aligned, distances = future.result()
+        for i, j, distance in tile_edges:
+            edges.setdefault(i, []).append((j, distance))
+        for i, j, distance in distances:
+            cache.put(keys[i], keys[j], distance)
+        stats['aligned'] += no_aligned
+
+
+_shared_sequences = None
+
+
+def _attach_sequences(name, no):
+    """
+    Process pool initializer of find_families_parallel: attaches the shared monomer sequences.
+    """
+    global _shared_sequences
+    shm = shared_memory.SharedMemory(name=name)
+    offsets = np.frombuffer(shm.buf, dtype=np.int64, count=no + 1)
+    _shared_sequences = (shm, offsets, shm.buf[offsets.nbytes:])
+
+
+def _align_tile(limit, r0, r1, c0, c1, pairs, b_distances=False):
+    """
+    Process pool task of find_families_parallel: aligns the pairs of one tile and returns its family edges
+    with their edit distance (and every computed distance when b_distances is set).
+    """
+    shm, offsets, buf = _shared_sequences
+    seqs = {k: bytes(buf[offsets[k]: offsets[k + 1]]) for k in range(r0, c1) if k < r1 or k >= c0}
+    edges = []
+    distances = []
+    rows = pairs[:, 0]
+    starts = np.flatnonzero(np.diff(rows, prepend=-1)).tolist() + [len(rows)]
+    for start, end in zip(starts, starts[1:]):
+        i = int(rows[start])
+        js = pairs[start: end, 1].tolist()
+        max_ed = max_edit_distance(len(seqs[i]), limit)
+        for j, distance in zip(js, bounded_distances(seqs[i], [seqs[j] for j in js], max_ed)):
+            if distance >= 0 and distance / len(seqs[i]) * 100 < limit:
+                edges.append((i, j, distance))
+            if b_distances:
+                distances.append((i, j, distance if distance >= 0 else -(max_ed + 1)))
+    return edges, len(rows), distances
+
+
+def family_candidates(monomers, limit, pruning, q):
+    """
+    Returns the candidate generator of the given pruning mode.
+
+    Parameters:
+    - monomers: MonomerStore - The monomers.
+    - limit: int - The maximum divergence percentage of a family.
+    - pruning: str - 'exact', 'minhash' or None.
+    - q: int - The q-gram length.
+
+    Returns:
+    - Iterator[tuple] - Pairs of a monomer index i and the indices j >= i to align it with.
+    """
+    if pruning == 'exact':
+        return qgram_candidates(monomers, limit, q)
+    if pruning == 'minhash':
+        return minhash_candidates(monomers, limit, q)
+    if pruning is None:
+        return bounded_candidates(monomers, limit)
+    raise ValueError(f"Unknown pruning mode: {pruning}")
+
+
+def bounded_candidates(monomers, limit):
+    """
+    Yields, for every monomer i, the monomers j >= i whose length and base composition allow a divergence below
+    limit; these exact bounds never lose a family member.
+
+    Parameters:
+    - monomers: MonomerStore - The monomers.
+    - limit: int - The maximum divergence percentage of a family.
+
+    Returns:
+    - Iterator[tuple] - Pairs of the monomer index and the sorted array of its candidate partners.
+    """
+    no = len(monomers)
+    lengths = monomers.seq_lengths()
+    counts = base_counts(monomers.seq_data, monomers.seq_offsets)
+    max_eds = max_edit_distances(lengths, limit)
+    for i in range(no - 1):
+        yield i, feasible_partners(lengths, counts, i, np.arange(i, no), max_eds[i])
+
+
+def qgram_profiles(monomers, q):
+    """
+    Encodes the q-grams of every monomer sequence as integers.
+
+    Parameters:
+    - monomers: MonomerStore - The monomers.
+    - q: int - The q-gram length.
+
+    Returns:
+    - List[np.ndarray] - The q-gram codes of each monomer, in sequence order.
+    """
+    data = monomers.seq_data[:monomers.seq_offsets[-1]]
+    alphabet = np.unique(data)
+    if len(alphabet) ** q >= 2 ** 40:
+        raise ValueError(f"q={q} is too large for an alphabet of {len(alphabet)} symbols")
+    lut = np.zeros(256, dtype=np.int64)
+    lut[alphabet] = np.arange(len(alphabet))
+    all_codes = lut[data]
+    offsets = monomers.seq_offsets
+    profiles = []
+    for k in range(len(monomers)):
+        codes = all_codes[offsets[k]: offsets[k + 1]]
+        n = max(len(codes) - q + 1, 0)
+        grams = np.zeros(n, dtype=np.int64)
+        for t in range(q):
+            grams = grams * len(alphabet) + codes[t: t + n]
+        profiles.append(grams)
+    return profiles
+
+
+def qgram_candidates(monomers, limit, q):
+    """
+    Yields, for every monomer i, the monomers j >= i that can be within limit according to the q-gram lemma.
+
+    A sequence of length m within edit distance e of another shares at least m - q + 1 - e * q q-grams with it
+    (counted with multiplicity), so pairs below that bound, or whose lengths differ by more than e, are skipped
+    without losing any family member.
+
+    Parameters:
+    - monomers: MonomerStore - The monomers.
+    - limit: int - The maximum divergence percentage of a family.
+    - q: int - The q-gram length.
+
+    Returns:
+    - Iterator[tuple] - Pairs of the monomer index and the sorted array of its candidate partners.
+    """
+    no = len(monomers)
+    lengths = monomers.seq_lengths()
+    profiles = qgram_profiles(monomers, q)
+
+    # Tag the k-th occurrence of a q-gram within a monomer so that set intersection counts multiplicities.
+    tokens = []
+    for grams in profiles:
+        grams = np.sort(grams)
+        first = np.searchsorted(grams, grams)
+        tokens.append(grams * (lengths.max() + 1) + np.arange(len(grams)) - first)
+    token_ids = np.unique(np.concatenate(tokens), return_inverse=True)[1] if no else np.empty(0, dtype=np.int64)
+    offsets = np.cumsum([0] + [len(t) for t in tokens])
+    owners = np.repeat(np.arange(no), np.diff(offsets))
+    # Posting lists: the owners of every token, in increasing order. A monomer holds each of its tokens once, so
+    # the posting list of a token of monomer i continues after i's own entry with the monomers j > i only.
+    order = np.argsort(token_ids, kind='stable')
+    members = owners[order]
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    bounds = np.searchsorted(token_ids[order], np.arange(token_ids.max() + 2)) if no else np.zeros(1, dtype=np.int64)
+
+    for i in range(no - 1):
+        max_ed = max_edit_distance(lengths[i], limit)
+        if lengths[i] - q + 1 - max_ed * q <= 0:
+            # The lemma bounds nothing for so short a monomer: every partner of a close enough length is feasible.
+            rest = lengths[i:]
+            yield i, np.flatnonzero(np.abs(rest - lengths[i]) <= max_ed) + i
+            continue
+        starts = rank[offsets[i]: offsets[i + 1]]
+        ends = bounds[token_ids[offsets[i]: offsets[i + 1]] + 1]
+        sizes = ends - starts
+        # Gather the tails of the posting lists (i itself included) without a Python loop over the tokens.
+        gather = np.repeat(starts - np.cumsum(sizes) + sizes, sizes) + np.arange(sizes.sum())
+        shared = np.bincount(members[gather] - i)
+        partners = np.flatnonzero(shared) + i
+        needed = np.maximum(lengths[i], lengths[partners]) - q + 1 - max_ed * q
+        feasible = (np.abs(lengths[partners] - lengths[i]) <= max_ed) & (shared[partners - i] >= needed)
+        yield i, partners[feasible]
+
+
+def minhash_candidates(monomers, limit, q, bands=16, rows=4, seed=0):
+    """
+    Yields, for every monomer i, the monomers j >= i sharing a MinHash LSH bucket with it.
+
+    This approximate mode aligns only pairs whose q-gram sets collide in at least one band (with probability
+    1 - (1 - J^rows)^bands for a q-gram Jaccard similarity J) and whose similarity, estimated from the MinHash
+    values, reaches the one the q-gram lemma guarantees at the limit. Pairs close to the limit can be missed, so
+    families may come out smaller than with 'exact'.
+
+    Parameters:
+    - monomers: MonomerStore - The monomers.
+    - limit: int - The maximum divergence percentage of a family.
+    - q: int - The q-gram length.
+    - bands: int - Number of LSH bands.
+    - rows: int - Number of MinHash values per band.
+    - seed: int - Seed of the hash functions, fixed for reproducible results.
+
+    Returns:
+    - Iterator[tuple] - Pairs of the monomer index and the sorted array of its candidate partners.
+    """
+    no = len(monomers)
+    lengths = monomers.seq_lengths()
+    counts = base_counts(monomers.seq_data, monomers.seq_offsets)
+    prime = (1 << 31) - 1
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, prime, bands * rows, dtype=np.int64)[:, None]
+    b = rng.integers(0, prime, bands * rows, dtype=np.int64)[:, None]
+    signatures = np.full((no, bands * rows), prime, dtype=np.int64)
+    for i, grams in enumerate(qgram_profiles(monomers, q)):
+        grams = np.unique(grams) % prime
+        if len(grams):
+            signatures[i] = ((a * grams[None, :] + b) % prime).min(axis=1)
+
+    # Buckets of all the bands, one after the other, each listing its members in increasing order; the bucket of
+    # monomer i continues after i's own entry with the monomers j > i only.
+    members, ranks, ends = [], [], []
+    for band in range(bands):
+        keys = signatures[:, band * rows: (band + 1) * rows]
+        bucket_ids = np.unique(keys, axis=0, return_inverse=True)[1].ravel() if no else np.empty(0, dtype=np.int64)
+        order = np.argsort(bucket_ids, kind='stable')
+        bounds = np.searchsorted(bucket_ids[order], np.arange(bucket_ids.max() + 2)) if no else np.zeros(1)
+        rank = np.empty_like(order)
+        rank[order] = np.arange(no)
+        members.append(order)
+        ranks.append(rank + band * no)
+        ends.append(bounds[bucket_ids + 1] + band * no)
+    members = np.concatenate(members)
+    ranks = np.stack(ranks, axis=1)
+    ends = np.stack(ends, axis=1)
+
+    for i in range(no - 1):
+        sizes = ends[i] - ranks[i]
+        gather = np.repeat(ranks[i] - np.cumsum(sizes) + sizes, sizes) + np.arange(sizes.sum())
+        partners = np.unique(members[gather])
+        max_ed = max_edit_distance(lengths[i], limit)
+        partners = feasible_partners(lengths, counts, i, partners, max_ed)
+        # Keep the pairs whose estimated Jaccard similarity (the fraction of equal MinHash values) reaches the
+        # similarity that the q-gram lemma guarantees at the limit.
+        grams = np.maximum(lengths[i], lengths[partners]) - q + 1
+        bound = (grams - max_ed * q) / (grams + max_ed * q)
+        similarity = (signatures[partners] == signatures[i]).mean(axis=1)
+        yield i, partners[similarity >= bound]
+
+
+@instrumented('join_families_v03', lambda args, result: (len(args[0]), 0))
+def join_families_v03(monomers, family_sets=None):
+    """
+    Merges overlapping families of monomers to form larger, unified families.
+
+    Every merged family is stored, sorted, at its smallest member; the other members get an empty family.
+
+    Parameters:
+    - monomers: MonomerStore - The monomers to analyze and merge families.
+    - family_sets: FamilySets - The union-find filled by find_families, if any; otherwise it is built
+      from the family lists of the monomers.
+    """
+    if family_sets is None:
+        family_sets = FamilySets(len(monomers))
+        for i, family in enumerate(monomers.families()):
+            for j in family:
+                family_sets.add(i, j)
+    monomers.set_families(family_sets.families())
+
+
+def detect_families(monomers, limits, pruning='exact', processes=1, cache=None, clustering='all-pairs',
+                    distances=None):
+    """
+    Runs the family detection once at the largest limit and derives the merged families of every limit.
+
+    With the 'representative' clustering, find_representative_families runs once per limit instead, since its
+    families at a lower limit cannot be derived from those at a higher one; pruning, processes and cache are
+    not used by it.
+
+    Parameters:
+    - monomers: MonomerStore - The monomers to analyze.
+    - limits: List[float] - The divergence limits.
+    - pruning: str - Candidate pruning mode, as in find_families.
+    - processes: int - Number of worker processes (1 runs find_families in this process).
+    - cache: DistanceCache - Optional persistent distance cache.
+    - clustering: str - 'all-pairs' (find_families, exact single linkage) or 'representative'
+      (find_representative_families).
+    - distances: list - Optional list that receives the (i, j, divergence) family edges at the largest limit
+      ('all-pairs' only).
+
+    Returns:
+    - dict - For every limit, the merged family of each monomer (see families_by_limit).
+    """
+    if clustering == 'representative':
+        families = {}
+        for limit in sorted(limits):
+            family_sets = FamilySets(len(monomers))
+            find_representative_families(monomers, limit, family_sets)
+            families[limit] = family_sets.families()
+        return families
+    if clustering != 'all-pairs':
+        raise ValueError(f"Unknown clustering mode: {clustering}")
+    distances = [] if distances is None else distances
+    if processes > 1:
+        find_families_parallel(monomers, max(limits), processes, pruning=pruning, cache=cache, distances=distances)
+    else:
+        find_families(monomers, max(limits), pruning, cache=cache, distances=distances)
+    return families_by_limit(len(monomers), distances, limits)
+
+
+def families_by_limit(no, distances, limits):
+    """
+    Derives the merged families for several divergence limits from one family detection at the largest limit.
+
+    The family edges are sorted by divergence and added to a single union-find in that order, which cuts the
+    single-linkage structure at every limit; each extra limit costs only the families snapshot.
+
+    Parameters:
+    - no: int - The number of monomers.
+    - distances: List[tuple] - The (i, j, divergence) family edges found by find_families at max(limits).
+    - limits: List[float] - The divergence limits.
+
+    Returns:
+    - dict - For every limit, the merged family of each monomer, as join_families_v03 would set it.
+    """
+    family_sets = FamilySets(no)
+    edges = sorted(distances, key=lambda edge: edge[2])
+    k = 0
+    families = {}
+    for limit in sorted(limits):
+        while k < len(edges) and edges[k][2] < limit:
+            family_sets.add(edges[k][0], edges[k][1])
+            k += 1
+        families[limit] = family_sets.families()
+    return families
+
+
+def apply_families(monomers, families):
+    """
+    Sets the merged families of the monomers and clears the column layout left by a previous drawing.
+
+    Parameters:
+    - monomers: MonomerStore - The monomers.
+    - families: List[List[int]] - The family of each monomer.
+    """
+    monomers.set_families(families)
+    monomers.reset_layout()
+
+
+class FamilySets:
+    """
+    Disjoint-set (union-find) structure over monomer indices, with path compression and union by size.
+    Only monomers that took part in a family edge are members of a family.
+    """
+
+    __slots__ = ('parent', 'size', 'member')
+
+    def __init__(self, no):
+        self.parent = list(range(no))
+        self.size = [1] * no
+        self.member = [False] * no
+
+    def find(self, i):
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def add(self, i, j):
+        """
+        Records the family edge i-j, joining the families of both monomers.
+        """
+        self.member[i] = self.member[j] = True
+        ri, rj = self.find(i), self.find(j)
+        if ri != rj:
+            if self.size[ri] < self.size[rj]:
+                ri, rj = rj, ri
+            self.parent[rj] = ri
+            self.size[ri] += self.size[rj]
+
+    def families(self):
+        """
+        Returns, for every monomer, its sorted family if it is the smallest member and an empty list otherwise.
+        """
+        families = [[] for _ in self.parent]
+        first = {}
+        for k, is_member in enumerate(self.member):
+            if is_member:
+                root = self.find(k)
+                if root not in first:
+                    first[root] = k
+                families[first[root]].append(k)
+        return families
+
+
+def read_monomers_file(file_name, start=0, end=None, region=None):
+    """
+    Reads a file containing monomer data and returns the monomers.
+
+    Binary .mon files (see MonomerStore.write_binary_monomers) are memory-mapped and only the requested range
+    is read; text files are streamed line by line up to the end of the range.
+
+    Parameters:
+    - file_name: str - The path to the file to read.
+    - start: int - The starting index to begin processing from the file.
+    - end: int - The index after the last monomer to read (None reads to the end of the file).
+    - region: tuple - Optional (first, last) genomic positions in bp of the monomers to read.
+
+    Returns:
+    - MonomerStore - The monomers read from the file.
+    """
+    start = start or 0
+    if is_binary_monomers_file(file_name):
+        return load_binary_monomers(file_name, start, end, region)
+    records = []
+    with open(file_name) as file:
+        for i, line in enumerate(islice(file, start, end), start):
+            parts = line.split()
+            if len(parts) not in (6, 7):
+                parts = (i, len(parts[0]), 0, 0, 'd', parts[0].strip())
+            if region is None or region[0] <= int(parts[0]) <= region[1]:
+                records.append(parts)
+    return MonomerStore.from_records(records)
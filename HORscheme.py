@@ -0,0 +1,351 @@
+import json
+import os
+import struct
+import zlib
+
+import numpy as np
+
+
+class SchemeWriter:
+    """
+    Streams the shapes of a HOR scheme to a vector file as they are generated.
+    Coordinates are canvas units with the origin in the top left corner, as in the former Tk canvas.
+    """
+
+    binary = False
+
+    def __init__(self, file_name, width, height, line_width):
+        if self.binary:
+            self.file = open(file_name, "wb")
+        else:
+            self.file = open(file_name, "w", encoding="latin-1", errors="replace")
+        self.width = width
+        self.height = height
+        self.line_width = line_width
+
+    def __enter__(self):
+        self.begin()
+        return self
+
+    def __exit__(self, *exc):
+        self.end()
+        self.file.close()
+
+    def begin(self):
+        pass
+
+    def end(self):
+        pass
+
+
+class PostScriptWriter(SchemeWriter):
+    """
+    Writes the scheme as Encapsulated PostScript, with short procedures for squares, circles and labels.
+    """
+
+    def begin(self):
+        self.file.write(f"%!PS-Adobe-3.0 EPSF-3.0\n%%BoundingBox: 0 0 {int(np.ceil(self.width))} "
+                        f"{int(np.ceil(self.height))}\n%%EndComments\n"
+                        f"/r {{ setrgbcolor 4 copy rectfill 0 setgray rectstroke }} bind def\n"
+                        f"/o {{ newpath 0 360 arc gsave 1 setgray fill grestore 1 0 0 setrgbcolor stroke }} bind def\n"
+                        f"/t {{ gsave 0 setgray translate 1 -1 scale dup stringwidth pop -2 div -0.35 moveto show "
+                        f"grestore }} bind def\n/Helvetica findfont 1 scalefont setfont\n"
+                        f"0 {self.height:g} translate 1 -1 scale {self.line_width:g} setlinewidth\n")
+
+    def rectangle(self, x, y, w, h, rgb):
+        self.file.write(f"{x:g} {y:g} {w:g} {h:g} {rgb[0]:.3f} {rgb[1]:.3f} {rgb[2]:.3f} r\n")
+
+    def circle(self, x, y, w, h):
+        self.file.write(f"{x + w / 2:g} {y + h / 2:g} {w / 2:g} o\n")
+
+    def text(self, x, y, txt):
+        txt = str(txt).replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        self.file.write(f"({txt}) {x:g} {y:g} t\n")
+
+    def end(self):
+        self.file.write("showpage\n%%EOF\n")
+
+
+class SvgWriter(SchemeWriter):
+    """
+    Writes the scheme as SVG.
+    """
+
+    def begin(self):
+        self.file.write(f'<svg xmlns="http://www.w3.org/2000/svg" width="{self.width:g}" height="{self.height:g}" '
+                        f'viewBox="0 0 {self.width:g} {self.height:g}">\n'
+                        f'<g stroke="black" stroke-width="{self.line_width:g}" font-family="Helvetica" font-size="1" '
+                        f'text-anchor="middle" dominant-baseline="central">\n')
+
+    def rectangle(self, x, y, w, h, rgb):
+        colour = "#%02x%02x%02x" % tuple(int(round(v * 255)) for v in rgb)
+        self.file.write(f'<rect x="{x:g}" y="{y:g}" width="{w:g}" height="{h:g}" fill="{colour}"/>\n')
+
+    def circle(self, x, y, w, h):
+        self.file.write(f'<circle cx="{x + w / 2:g}" cy="{y + h / 2:g}" r="{w / 2:g}" fill="white" stroke="red"/>\n')
+
+    def text(self, x, y, txt):
+        txt = str(txt).replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+        self.file.write(f'<text x="{x:g}" y="{y:g}" stroke="none">{txt}</text>\n')
+
+    def end(self):
+        self.file.write("</g>\n</svg>\n")
+
+
+class PdfWriter(SchemeWriter):
+    """
+    Writes the scheme as a single-page PDF. The page content is streamed; its length and the cross-reference
+    table are written after it.
+    """
+
+    binary = True
+
+    def begin(self):
+        self.offsets = {}
+        self.file.write(b"%PDF-1.4\n")
+        self._object(1, "<< /Type /Catalog /Pages 2 0 R >>")
+        self._object(2, "<< /Type /Pages /Kids [3 0 R] /Count 1 >>")
+        self._object(3, f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {self.width:g} {self.height:g}] "
+                        f"/Contents 4 0 R /Resources << /Font << /F1 6 0 R >> >> >>")
+        self._object(6, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+        self.offsets[4] = self.file.tell()
+        self.file.write(b"4 0 obj\n<< /Length 5 0 R >>\nstream\n")
+        self.stream_start = self.file.tell()
+        self._write(f"1 0 0 -1 0 {self.height:g} cm {self.line_width:g} w 0 G\n")
+
+    def _object(self, number, body):
+        self.offsets[number] = self.file.tell()
+        self.file.write(f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1"))
+
+    def _write(self, text):
+        self.file.write(text.encode("latin-1", "replace"))
+
+    def rectangle(self, x, y, w, h, rgb):
+        self._write(f"{rgb[0]:.3f} {rgb[1]:.3f} {rgb[2]:.3f} rg {x:g} {y:g} {w:g} {h:g} re B\n")
+
+    def circle(self, x, y, w, h):
+        r = w / 2
+        cx, cy, k = x + r, y + r, 0.5523 * r
+        self._write(f"1 g 1 0 0 RG {cx + r:g} {cy:g} m "
+                    f"{cx + r:g} {cy + k:g} {cx + k:g} {cy + r:g} {cx:g} {cy + r:g} c "
+                    f"{cx - k:g} {cy + r:g} {cx - r:g} {cy + k:g} {cx - r:g} {cy:g} c "
+                    f"{cx - r:g} {cy - k:g} {cx - k:g} {cy - r:g} {cx:g} {cy - r:g} c "
+                    f"{cx + k:g} {cy - r:g} {cx + r:g} {cy - k:g} {cx + r:g} {cy:g} c B 0 G\n")
+
+    def text(self, x, y, txt):
+        txt = str(txt).replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        # Helvetica glyphs average about half an em, which is enough to centre the short labels.
+        self._write(f"0 g BT /F1 1 Tf 1 0 0 -1 {x - 0.25 * len(txt):g} {y + 0.35:g} Tm ({txt}) Tj ET\n")
+
+    def end(self):
+        length = self.file.tell() - self.stream_start
+        self.file.write(b"endstream\nendobj\n")
+        self._object(5, str(length))
+        xref = self.file.tell()
+        self.file.write(b"xref\n0 7\n0000000000 65535 f \n")
+        for number in range(1, 7):
+            self.file.write(f"{self.offsets[number]:010d} 00000 n \n".encode("latin-1"))
+        self.file.write(f"trailer\n<< /Size 7 /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1"))
+
+
+VECTOR_WRITERS = {'ps': PostScriptWriter, 'svg': SvgWriter, 'pdf': PdfWriter}
+
+
+def hex_to_rgb(colours):
+    """
+    Converts '#rrggbb' colours to an array of RGB fractions.
+
+    Parameters:
+    - colours: List[str] - The hex colours.
+
+    Returns:
+    - np.ndarray - An (n, 3) array of floats between 0 and 1.
+    """
+    return np.array([[int(c[k: k + 2], 16) for k in (1, 3, 5)] for c in colours], dtype=np.float64) / 255
+
+
+def write_vector_scheme(file_name, out_format, layout, rgb, f_cube_proportions, b_numbers, b_position_marks_blocks,
+                        b_mers_marks, b_alpha_positions):
+    """
+    Writes a HOR scheme layout as PostScript, SVG or PDF, one shape at a time.
+
+    Parameters:
+    - file_name: str - The output file.
+    - out_format: str - 'ps', 'svg' or 'pdf'.
+    - layout: dict - The scheme layout computed by GRMhor.hor_layout.
+    - rgb: np.ndarray - The fill colour of every monomer as RGB fractions.
+    - f_cube_proportions: float - Factor to adjust the size of each square in the visualization.
+    - b_numbers: bool - Flag to include monomer sequence numbers.
+    - b_position_marks_blocks: bool - Flag to mark positions with blocks.
+    - b_mers_marks: bool - Flag to include tags at the first occurrence above each monomer.
+    - b_alpha_positions: bool - Flag to include position of the first monomer in the HOR.
+    """
+    f = f_cube_proportions
+    w = h = 0.8 * f
+    shift = 10 * f
+    x, y, pos = layout['x'], layout['y'], layout['pos']
+    width = max(x) * f + 10 + shift
+    height = max(y) * f + 20
+    with VECTOR_WRITERS[out_format](file_name, width, height, 0.07 * f) as writer:
+        for i in range(len(x)):
+            writer.rectangle(x[i] * f + shift, y[i] * f, w, h, rgb[i])
+            if b_numbers:
+                writer.text(x[i] * f + shift, y[i] * f, i)
+
+        for k in layout['blocks']:
+            writer.circle(x[k] * f + shift, y[k] * f, w, h)
+            if b_position_marks_blocks:
+                writer.text(x[k] * f + shift, y[k] * f, f"{k} ({pos[k]})")
+                if k > 0:
+                    writer.text(x[k] * f + shift, (y[k] - 1) * f, f"{k - 1} ({pos[k - 1]})")
+
+        if b_alpha_positions:
+            for k in layout['row_starts']:
+                writer.text(shift - 1 * f, y[k] * f + h / 2, f"{pos[k]:,}")
+
+        if b_mers_marks:
+            for n, k in enumerate(layout['mers']):
+                writer.text(x[k] * f + shift + w / 2, y[k] * f - 1, f"m{n + 1}")
+
+
+def write_raster_scheme(file_name, layout, rgb, f_cube_proportions, scale=4):
+    """
+    Writes a HOR scheme layout as a PNG image rendered into a numpy pixel buffer (labels are not drawn).
+
+    Parameters:
+    - file_name: str - The output file.
+    - layout: dict - The scheme layout computed by GRMhor.hor_layout.
+    - rgb: np.ndarray - The fill colour of every monomer as RGB fractions.
+    - f_cube_proportions: float - Factor to adjust the size of each square in the visualization.
+    - scale: float - Pixels per canvas unit.
+    """
+    f = f_cube_proportions * scale
+    x, y = np.asarray(layout['x']), np.asarray(layout['y'])
+    width = int(np.ceil((max(x) * f_cube_proportions + 10 + 10 * f_cube_proportions) * scale))
+    height = int(np.ceil((max(y) * f_cube_proportions + 20) * scale))
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+
+    cell = max(int(round(0.8 * f)), 1)
+    x0 = np.round(x * f + 10 * f).astype(np.int64)
+    y0 = np.round(y * f).astype(np.int64)
+    is_block = np.zeros(len(x), dtype=bool)
+    is_block[np.asarray(layout['blocks'], dtype=np.int64)] = True
+    draw_cells(image, x0, y0, cell, np.round(rgb * 255).astype(np.uint8), is_block)
+    write_png(file_name, image)
+
+
+def draw_cells(image, x0, y0, cell, colours, is_block):
+    """
+    Fills square cells into a pixel buffer, with a black border (red and a white inside for gap blocks)
+    once the cells are at least 4 pixels wide.
+
+    Parameters:
+    - image: np.ndarray - The (height, width, 3) uint8 pixel buffer.
+    - x0: np.ndarray - The left pixel of every cell.
+    - y0: np.ndarray - The top pixel of every cell.
+    - cell: int - The cell size in pixels.
+    - colours: np.ndarray - The (n, 3) uint8 fill colour of every cell.
+    - is_block: np.ndarray - Flags of the cells that start a block after a gap.
+    """
+    colours = colours.copy()
+    border = cell >= 4
+    if border:
+        colours[is_block] = 255
+    for dy in range(cell):
+        for dx in range(cell):
+            edge = border and (dy in (0, cell - 1) or dx in (0, cell - 1))
+            image[y0 + dy, x0 + dx] = 0 if edge else colours
+            if edge and is_block.any():
+                image[y0[is_block] + dy, x0[is_block] + dx] = (255, 0, 0)
+
+
+def write_tile_pyramid(directory, layout, rgb, cell_px=8, tile_size=256):
+    """
+    Writes the HOR scheme as a pyramid of PNG tiles with a JSON index, so that a viewer only loads visible tiles.
+
+    Level 0 is the coarsest level, which fits in a single tile; every following level doubles the resolution,
+    up to cell_px pixels per monomer. Where a monomer is smaller than one pixel, the pixel shows the mean colour
+    of the monomers it covers, so coarse levels aggregate family colours instead of drawing every cell.
+    Tiles are rendered one at a time from the rows they cover, which keeps memory bounded by the tile size.
+
+    Parameters:
+    - directory: str - The output directory.
+    - layout: dict - The scheme layout computed by GRMhor.hor_layout.
+    - rgb: np.ndarray - The fill colour of every monomer as RGB fractions.
+    - cell_px: int - Monomer size in pixels at the finest level (a power of two).
+    - tile_size: int - Tile width and height in pixels.
+    """
+    x = np.maximum(np.asarray(layout['x'], dtype=np.int64), 0)
+    y = np.asarray(layout['y'], dtype=np.int64)
+    y = y - y.min() if len(y) else y
+    colours = np.round(rgb * 255).astype(np.uint8)
+    is_block = np.zeros(len(x), dtype=bool)
+    is_block[np.asarray(layout['blocks'], dtype=np.int64)] = True
+    cols = int(x.max()) + 1 if len(x) else 1
+    rows = int(y.max()) + 1 if len(y) else 1
+
+    no_levels = 1
+    while max(cols, rows) * cell_px / 2 ** (no_levels - 1) > tile_size:
+        no_levels += 1
+    os.makedirs(directory, exist_ok=True)
+    index = {'tile_size': tile_size, 'columns': cols, 'rows': rows, 'monomers': len(x), 'levels': []}
+    for level in range(no_levels):
+        scale = cell_px / 2 ** (no_levels - 1 - level)
+        width, height = int(np.ceil(cols * scale)), int(np.ceil(rows * scale))
+        tiles = []
+        for ty in range(-(-height // tile_size)):
+            # The layout is row-ordered, so the monomers of a tile row are one contiguous slice.
+            first = np.searchsorted(y, int(ty * tile_size / scale), side='left')
+            last = np.searchsorted(y, int(np.ceil((ty + 1) * tile_size / scale)) - 1, side='right')
+            for tx in range(-(-width // tile_size)):
+                part = slice(first, last)
+                px = x[part] * scale - tx * tile_size
+                py = y[part] * scale - ty * tile_size
+                size = max(int(scale), 1)
+                inside = (px + size > 0) & (px < tile_size) & (py + size > 0) & (py < tile_size)
+                if not inside.any():
+                    continue
+                image = np.full((tile_size, tile_size, 3), 255, dtype=np.uint8)
+                if scale >= 1:
+                    big = np.zeros((tile_size + 2 * size, tile_size + 2 * size, 3), dtype=np.uint8)
+                    big[:] = 255
+                    draw_cells(big, px[inside].astype(np.int64) + size, py[inside].astype(np.int64) + size,
+                               int(scale), colours[part][inside], is_block[part][inside])
+                    image = big[size: size + tile_size, size: size + tile_size]
+                else:
+                    pixel = (py[inside].astype(np.int64) * tile_size + px[inside].astype(np.int64))
+                    sums = np.zeros((tile_size * tile_size, 3), dtype=np.float64)
+                    np.add.at(sums, pixel, colours[part][inside])
+                    counts = np.bincount(pixel, minlength=tile_size * tile_size)
+                    filled = counts > 0
+                    image.reshape(-1, 3)[filled] = np.round(sums[filled] / counts[filled, None]).astype(np.uint8)
+                os.makedirs(os.path.join(directory, str(level)), exist_ok=True)
+                write_png(os.path.join(directory, str(level), f"{tx}_{ty}.png"), image)
+                tiles.append([tx, ty])
+        index['levels'].append({'level': level, 'pixels_per_monomer': scale, 'width': width, 'height': height,
+                                'tiles': tiles})
+    with open(os.path.join(directory, "index.json"), "w") as file:
+        json.dump(index, file)
+
+
+def write_png(file_name, image):
+    """
+    Writes an (height, width, 3) uint8 array as an RGB PNG file.
+
+    Parameters:
+    - file_name: str - The output file.
+    - image: np.ndarray - The pixel buffer.
+    """
+    height, width = image.shape[:2]
+    rows = np.empty((height, width * 3 + 1), dtype=np.uint8)
+    rows[:, 0] = 0
+    rows[:, 1:] = image.reshape(height, width * 3)
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    with open(file_name, "wb") as file:
+        file.write(b"\x89PNG\r\n\x1a\n")
+        file.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        file.write(chunk(b"IDAT", zlib.compress(rows.tobytes(), 6)))
+        file.write(chunk(b"IEND", b""))
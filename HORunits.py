@@ -0,0 +1,176 @@
+import numpy as np
+from Metrics import instrumented
+
+UNIT_KINDS = ('canonical', 'deletion', 'insertion', 'variant')
+
+
+@instrumented('hor_units', lambda args, result: (len(args[0]), 0))
+def hor_units(labels, monomers, max_period=60):
+    """
+    Extracts the HOR copies of an array from its family-label series, with numpy only.
+
+    The copies are built from the rows of the HOR scheme, which break where the column does not increase (see
+    hor_layout). The main period is the most frequent distance between consecutive monomers with the same label
+    (the GRM peak for step 1), and the anchor is the column starting the most rows. A row starting with another
+    column is joined to the rows before it, back to an anchor row, when together they span at most the main
+    period, so a HOR repeating one of its families (cascading HORs) stays a single copy.
+
+    The canonical HOR is the most frequent copy (as a sequence of columns) among the copies of the main period, or
+    among all copies if none has that length; ties go to the copy seen first. Every copy is compared with it as a
+    multiset of columns: a 'deletion' lacks canonical monomers, an 'insertion' has other ones and a 'variant' both.
+
+    Parameters:
+    - labels: List[int] - The HOR scheme column of every monomer (see hor_layout).
+    - monomers: MonomerStore - The monomers.
+    - max_period: int - The largest period considered for the main period.
+
+    Returns:
+    - dict - One array per field, with one value per copy: 'start' and 'end' (monomer indices, end excluded),
+      'start_pos' and 'end_pos' (direct-strand interval covering the monomers of the copy, in bp, end excluded),
+      'period' (number of monomers), 'reverse' (most monomers in reverse complement orientation), 'shared'
+      (monomers matching the canonical HOR), 'missing' and 'extra' (canonical monomers absent from the copy and
+      monomers of the copy absent from the canonical HOR), 'kind' (index into UNIT_KINDS), 'gap' (the copy spans
+      a gap of more than 1000 bp) and 'edge' (first or last copy of the array); and 'labels', 'canonical' (the
+      columns of the canonical HOR) and 'main_period'.
+    """
+    labels = np.asarray(labels, dtype=np.int64)
+    no = len(labels)
+    if not no:
+        empty = np.empty(0, dtype=np.int64)
+        return {'start': empty, 'end': empty, 'start_pos': empty, 'end_pos': empty, 'period': empty,
+                'reverse': empty.astype(bool), 'shared': empty, 'missing': empty, 'extra': empty,
+                'kind': empty.astype(np.int8), 'gap': empty.astype(bool), 'edge': empty.astype(bool),
+                'labels': labels, 'canonical': empty, 'main_period': 0}
+    columns = int(labels.max()) + 1
+
+    # The main period: the most frequent distance to the next monomer with the same label.
+    order = np.argsort(labels, kind='stable')
+    steps = (order[1:] - order[:-1])[labels[order[1:]] == labels[order[:-1]]]
+    freq = np.bincount(steps[steps <= max_period], minlength=max_period + 1)
+    main_period = int(np.argmax(freq)) if freq.any() else 0
+
+    # Rows of the HOR scheme, grouped from one anchor row to the next; short enough groups become single copies.
+    b_new_row = np.ones(no, dtype=bool)
+    b_new_row[1:] = labels[1:] <= labels[:-1]
+    row_starts = np.flatnonzero(b_new_row)
+    anchor = np.argmax(np.bincount(labels[row_starts]))
+    b_anchor = labels[row_starts] == anchor
+    b_anchor[0] = True
+    group = np.cumsum(b_anchor) - 1
+    group_starts = row_starts[b_anchor]
+    group_lengths = np.diff(np.append(group_starts, no))
+    b_copy = b_anchor | (group_lengths[group] > main_period)
+    starts = row_starts[b_copy]
+    ends = np.append(starts[1:], no)
+    lengths = ends - starts
+
+    # Copies are identified by an order-sensitive hash of their columns, with random 64-bit keys per column.
+    copy_of = np.repeat(np.arange(len(starts)), lengths)
+    offsets = np.arange(no) - starts[copy_of]
+    keys = np.random.default_rng(0).integers(0, np.iinfo(np.int64).max, columns, dtype=np.int64).astype(np.uint64)
+    copy_keys = np.add.reduceat(keys[labels] * (2 * offsets.astype(np.uint64) + 1), starts)
+    candidates = np.flatnonzero(lengths == main_period)
+    if not len(candidates):
+        candidates = np.arange(len(starts))
+    _, first, counts = np.unique(copy_keys[candidates], return_index=True, return_counts=True)
+    best = candidates[first[np.lexsort((first, -counts))[0]]]
+    canonical = labels[starts[best]: ends[best]]
+
+    # Monomers in common with the canonical HOR: per copy and column, the smaller of the two counts.
+    canonical_counts = np.bincount(canonical, minlength=columns)
+    pairs, pair_counts = np.unique(copy_of * columns + labels, return_counts=True)
+    shared = np.bincount(pairs // columns, np.minimum(pair_counts, canonical_counts[pairs % columns]),
+                         minlength=len(starts)).astype(np.int64)
+    missing = len(canonical) - shared
+    extra = lengths - shared
+    kind = (missing > 0).astype(np.int8) + 2 * (extra > 0).astype(np.int8)
+    b_gap = monomers.dst > 1000
+    b_gap[starts] = False
+    edge = np.zeros(len(starts), dtype=bool)
+    edge[[0, -1]] = True
+    # The position of a reverse complement monomer is its (excluded) right end on the direct strand.
+    b_reverse = monomers.ort == 'r'
+    seq_lengths = monomers.seq_lengths()
+    left = np.where(b_reverse, monomers.pos - seq_lengths, monomers.pos)
+    return {'start': starts, 'end': ends, 'start_pos': np.minimum.reduceat(left, starts),
+            'end_pos': np.maximum.reduceat(left + seq_lengths, starts), 'period': lengths,
+            'reverse': np.add.reduceat(b_reverse, starts) * 2 > lengths, 'shared': shared,
+            'missing': missing, 'extra': extra, 'kind': kind, 'gap': np.add.reduceat(b_gap, starts) > 0,
+            'edge': edge, 'labels': labels, 'canonical': canonical, 'main_period': main_period}
+
+
+def unit_compositions(units):
+    """
+    Returns the composition of every HOR copy as its columns, with runs of consecutive columns written as
+    first-last (e.g. "0-8,11").
+
+    Parameters:
+    - units: dict - The HOR copies (see hor_units).
+
+    Returns:
+    - List[str] - The composition of every copy.
+    """
+    labels, starts = units['labels'], units['start']
+    no = len(labels)
+    b_run = np.ones(no, dtype=bool)
+    b_run[1:] = labels[1:] != labels[:-1] + 1
+    b_run[starts] = True
+    run_starts = np.flatnonzero(b_run)
+    run_ends = np.append(run_starts[1:], no) - 1
+    runs = [f"{a}" if a == b else f"{a}-{b}" for a, b in zip(labels[run_starts].tolist(), labels[run_ends].tolist())]
+    bounds = np.searchsorted(run_starts, np.append(starts, no)).tolist()
+    return [",".join(runs[bounds[u]: bounds[u + 1]]) for u in range(len(starts))]
+
+
+def unit_flags(units):
+    """
+    Returns the flags of every HOR copy: its kind (see UNIT_KINDS), followed by ',gap' and ',edge' when they apply.
+    """
+    return [UNIT_KINDS[kind] + (",gap" if gap else "") + (",edge" if edge else "")
+            for kind, gap, edge in zip(units['kind'].tolist(), units['gap'].tolist(), units['edge'].tolist())]
+
+
+def write_hor_units_tsv(file_name, units):
+    """
+    Writes the HOR copies as a tab-separated table, after a header line describing the canonical HOR.
+
+    Parameters:
+    - file_name: str - The path to the output file.
+    - units: dict - The HOR copies (see hor_units).
+    """
+    canonical = {'labels': units['canonical'], 'start': np.zeros(1, dtype=np.int64)}
+    with open(file_name, "w") as fp:
+        fp.write(f"# canonical HOR: {len(units['canonical'])} monomers, columns "
+                 f"{unit_compositions(canonical)[0] if len(units['canonical']) else '-'}; "
+                 f"main period {units['main_period']}\n")
+        fp.write("start\tend\tstart_pos\tend_pos\tperiod\tstrand\tcomposition\tshared\tmissing\textra\tflags\n")
+        fields = zip(units['start'].tolist(), units['end'].tolist(), units['start_pos'].tolist(),
+                     units['end_pos'].tolist(), units['period'].tolist(), units['reverse'].tolist(),
+                     unit_compositions(units), units['shared'].tolist(), units['missing'].tolist(),
+                     units['extra'].tolist(), unit_flags(units))
+        for start, end, start_pos, end_pos, period, reverse, composition, shared, missing, extra, flags in fields:
+            fp.write(f"{start}\t{end}\t{start_pos}\t{end_pos}\t{period}\t{'-' if reverse else '+'}\t{composition}\t"
+                     f"{shared}\t{missing}\t{extra}\t{flags}\n")
+
+
+def write_hor_units_bed(file_name, units, chrom):
+    """
+    Writes the HOR copies as a BED6 track for genome browsers.
+
+    Every copy is named <period>mer_<kind> and scored by the fraction of the canonical HOR it contains (1000 for a
+    complete copy). Monomer positions are 0-based, so the copies are written as they are.
+
+    Parameters:
+    - file_name: str - The path to the output file.
+    - units: dict - The HOR copies (see hor_units).
+    - chrom: str - The chromosome (sequence) name of the array.
+    """
+    score = np.minimum(units['shared'] * 1000 // max(len(units['canonical']), 1), 1000)
+    with open(file_name, "w") as fp:
+        fp.write(f'track name="{chrom} HOR copies" description="HOR copies ({len(units["canonical"])}-monomer '
+                 f'canonical HOR)" useScore=1\n')
+        fields = zip(units['start_pos'].tolist(), units['end_pos'].tolist(), units['period'].tolist(),
+                     units['kind'].tolist(), score.tolist(), units['reverse'].tolist())
+        for start_pos, end_pos, period, kind, unit_score, reverse in fields:
+            fp.write(f"{chrom}\t{start_pos}\t{end_pos}\t{period}mer_{UNIT_KINDS[kind]}\t{unit_score}\t"
+                     f"{'-' if reverse else '+'}\n")
@@ -0,0 +1,144 @@
+import csv
+import functools
+import json
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class Metrics:
+    """
+    Per-stage instrumentation of a run: wall and CPU time, peak RSS, monomer and base throughput and event
+    counters (edlib calls, candidate and pruned pairs...).
+
+    The library functions report to the current Metrics object (see current_metrics), which a caller can replace
+    with set_metrics. Hooks registered with add_hook are called with ('start', record) and ('end', record) around
+    every stage, and quiet mode turns off the progress prints.
+    """
+
+    def __init__(self, quiet=False):
+        self.quiet = quiet
+        self.stages = []
+        self.counters = Counter()
+        self.hooks = []
+
+    def add_hook(self, hook):
+        """
+        Registers a callback hook(event, record) called at the start and at the end of every stage.
+        """
+        self.hooks.append(hook)
+
+    def progress(self, message):
+        """
+        Prints a progress message unless the metrics are quiet.
+        """
+        if not self.quiet:
+            print(message)
+
+    def count(self, name, value=1):
+        """
+        Adds value to the event counter name.
+        """
+        self.counters[name] += value
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Measures the enclosed block as a stage; the caller may set 'monomers' and 'bases' in the yielded record.
+        """
+        record = {'stage': name, 'monomers': 0, 'bases': 0}
+        counters = Counter(self.counters)
+        for hook in self.hooks:
+            hook('start', record)
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_s'] = time.perf_counter() - wall
+            record['cpu_s'] = time.process_time() - cpu
+            record['peak_rss_mb'] = peak_rss_mb()
+            record['monomers_per_s'] = record['monomers'] / record['wall_s'] if record['wall_s'] > 0 else 0
+            record['bases_per_s'] = record['bases'] / record['wall_s'] if record['wall_s'] > 0 else 0
+            record['counters'] = dict(self.counters - counters)
+            self.stages.append(record)
+            for hook in self.hooks:
+                hook('end', record)
+
+    def summary(self):
+        """
+        Returns the recorded stages and the total counters as a JSON-serializable dict.
+        """
+        return {'stages': self.stages, 'counters': dict(self.counters), 'peak_rss_mb': peak_rss_mb()}
+
+    def write(self, file_name):
+        """
+        Writes the metrics to a JSON file, or to a CSV file (one line per stage) if the name ends with .csv.
+        """
+        if file_name.endswith('.csv'):
+            counter_names = sorted({name for record in self.stages for name in record['counters']})
+            columns = ['stage', 'wall_s', 'cpu_s', 'peak_rss_mb', 'monomers', 'bases', 'monomers_per_s',
+                       'bases_per_s']
+            with open(file_name, "w", newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(columns + counter_names)
+                for record in self.stages:
+                    writer.writerow([record[column] for column in columns] +
+                                    [record['counters'].get(name, 0) for name in counter_names])
+        else:
+            with open(file_name, "w") as file:
+                json.dump(self.summary(), file, indent=1)
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size of this process and its finished children in MB (0 where unsupported).
+    """
+    if resource is None:
+        return 0
+    # ru_maxrss is in KB on Linux.
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024
+
+
+_current = Metrics()
+
+
+def current_metrics():
+    """
+    Returns the Metrics object the library functions report to.
+    """
+    return _current
+
+
+def set_metrics(metrics):
+    """
+    Makes metrics the object the library functions report to, and returns the previous one.
+    """
+    global _current
+    previous, _current = _current, metrics
+    return previous
+
+
+def instrumented(name, measure=None):
+    """
+    Decorator recording every call of a function as the stage name of the current metrics.
+
+    Parameters:
+    - name: str - The stage name.
+    - measure: callable - Optional measure(args, result) returning the (monomers, bases) processed by the call.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with current_metrics().stage(name) as record:
+                result = function(*args, **kwargs)
+                if measure is not None:
+                    record['monomers'], record['bases'] = measure(args, result)
+            return result
+        return wrapper
+    return decorate
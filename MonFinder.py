@@ -1,265 +1,710 @@
-
-import edlib
-
-
-class Monomer:
-    """
-    Represents a monomer with properties like position, distance to next, divergence scores, orientation, and sequence.
-    Additional properties include family, row, column positions, and monomer number for internal tracking.
-    """
-
-    def __init__(self, pos, dst, div, div2, ort, seq):
-        self.pos = int(pos)
-        self.dst = int(dst)
-        self.div = float(div)
-        self.div2 = int(div2)
-        self.ort = ort
-        self.seq = seq
-        self.family = []
-        self.row = -1
-        self.col = -1
-        self.colStart = -1
-        self.monNo = -1
-
-    def __str__(self):
-        return f"{self.pos} {self.dst} {self.div:.2f} {self.seq}"
-
-
-def join_direct_and_reverse_complement(monomers1, monomers2):
-    """
-    Merges two lists of Monomer objects, sorting them by position and removing duplicates based on orientation rules.
-
-    Parameters:
-    - monomers1: List[Monomer] - The first list of monomers.
-    - monomers2: List[Monomer] - The second list of monomers, typically the reverse complement monomers.
-
-    Returns:
-    - List[Monomer] - The merged and processed list of monomers.
-    """
-    monomers1.extend(monomers2)
-    monomers1.sort(key=lambda x: x.pos)
-
-    monomers = []
-    skip = False
-    for i in range(len(monomers1) - 2):
-        if skip:
-            skip = False
-        else:
-            monomers.append(monomers1[i])
-            if monomers1[i].ort != monomers1[i + 1].ort and monomers1[i].ort == monomers1[i + 2].ort:
-                skip = True
-
-    monomers.append(monomers1[-2])
-    monomers.append(monomers1[-1])
-    set_distances(monomers)
-    return monomers
-
-
-def find_monomers(seq, monomer_cons, ort):
-    """
-    Identifies and returns a list of Monomer objects found in a given sequence.
-
-    Parameters:
-    - seq: str - The sequence in which to find monomers.
-    - monomer_cons: str - The consensus sequence of the monomer.
-    - ort: str - The orientation ('d' for direct, 'r' for reverse complement).
-
-    Returns:
-    - List[Monomer] - A list of identified Monomer objects.
-    """
-    monomers = []
-    if ort == "r":
-        seq = revcom(seq)
-
-    progress_step = max((len(seq) - len(monomer_cons) - 1) // 20, 1)
-    for i in range(len(seq) - len(monomer_cons) - 1):
-        if i % progress_step == 0:
-            progress_percentage = i / (len(seq) - len(monomer_cons) - 1) * 100
-            print(f"Progress: {progress_percentage:5.1f}%")
-        ed = edlib.align(monomer_cons, seq[i: i + len(monomer_cons)])
-        edp = ed["editDistance"] / len(monomer_cons) * 100
-        if edp < 30:
-            ed = edlib.align(monomer_cons[:10], seq[i: i + 10])
-            monomers.append(Monomer(i, 0, edp, ed["editDistance"], ort, seq[i: i + 10]))
-    monomers = find_min_alphas(monomers)
-    set_distances(monomers)
-    monomers = remove_small_distances(monomers)
-    set_distances(monomers)
-    set_sequences(monomers, seq)
-    if ort == "r":
-        set_back_rc_positions(monomers, len(seq))
-        monomers.sort(key=lambda x: x.pos)
-    return monomers
-
-
-def set_back_rc_positions(monomers, seq_len):
-    """
-    Adjusts the positions of monomers to their original locations in the reverse complement sequence.
-
-    Parameters:
-    - monomers: List[Monomer] - The list of monomers to adjust.
-    - seq_len: int - The length of the original sequence.
-    """
-    for monomer in monomers:
-        monomer.pos = seq_len - monomer.pos
-
-
-def find_min_alphas(monomers):
-    """
-    Filters a list of monomers to include only those with minimum divergence scores compared to their immediate neighbors.
-
-    Parameters:
-    - monomers: List[Monomer] - The original list of monomers.
-
-    Returns:
-    - List[Monomer] - The filtered list of monomers.
-    """
-    monomers_min = []
-    for i in range(1, len(monomers) - 1):
-        if monomers[i].div <= monomers[i - 1].div and monomers[i].div <= monomers[i + 1].div:
-            monomers_min.append(monomers[i])
-    return monomers_min
-
-
-def set_sequences(monomers, seq):
-    """
-    Sets the sequence for each monomer based on its position and the distance to the next monomer.
-
-    Parameters:
-    - monomers: List[Monomer] - The list of monomers to update.
-    - seq: str - The original sequence from which the monomers were identified.
-    """
-    for i in range(len(monomers) - 1):
-        if monomers[i + 1].dst < 180:
-            monomers[i].seq = seq[monomers[i].pos: monomers[i + 1].pos]
-        else:
-            monomers[i].seq = seq[monomers[i].pos: monomers[i].pos + 171]
-    if monomers:
-        monomers[-1].seq = seq[monomers[-1].pos: monomers[-1].pos + 171]
-
-
-def remove_small_distances(monomers):
-    """
-    Filters out monomers that are too close to each other, based on a distance threshold.
-
-    Parameters:
-    - monomers: List[Monomer] - The list of monomers to filter.
-
-    Returns:
-    - List[Monomer] - The filtered list of monomers.
-    """
-    groups = []
-    group = []
-    for monomer in monomers:
-        if monomer.dst > 20:
-            if group: groups.append(group)
-            group = []
-        group.append(monomer)
-    if group: groups.append(group)
-    mons = [find_alpha_smallest_div10(g) for g in groups if g]
-    return mons
-
-
-def find_alpha_smallest_div10(group):
-    """
-    Finds the monomer with the smallest divergence score in a group of monomers.
-
-    Parameters:
-    - group: List[Monomer] - The group of monomers to evaluate.
-
-    Returns:
-    - Monomer - The monomer with the smallest divergence score.
-    """
-    best_score = 10
-    best_monomer = group[0]  # Default to first monomer if no better found
-    for monomer in group:
-        if monomer.div2 <= best_score:
-            best_monomer = monomer
-            best_score = monomer.div2
-    return best_monomer
-
-
-def set_distances(monomers):
-    """
-    Calculates and sets the distance to the next monomer for each monomer in a list.
-
-    Parameters:
-    - monomers: List[Monomer] - The list of monomers to update.
-    """
-    last_pos = 0
-    for monomer in monomers:
-        monomer.dst = monomer.pos - last_pos
-        last_pos = monomer.pos
-
-
-def read_fasta_file(file_name):
-    """
-    Reads a FASTA file and returns the sequence title and the sequence itself.
-
-    Parameters:
-    - file_name: str - The path to the FASTA file.
-
-    Returns:
-    - tuple: A tuple containing the sequence title and the sequence.
-    """
-    with open(file_name, 'r') as file:
-        title = file.readline().strip()
-        name = title.split('|')[3] if '|' in title else title
-        genome = file.read().replace('\r', '').replace('\n', '')
-    return name, genome
-
-
-def write_monomers_file(file_name, monomers):
-    """
-    Writes a list of monomers to a file.
-
-    Parameters:
-    - file_name: str - The path to the output file.
-    - monomers: List[Monomer] - The list of monomers to write.
-    """
-    if monomers:
-        with open(file_name, "w") as fp:
-            for mon in monomers:
-                fp.write(f"{mon.pos} {mon.dst} {mon.div:.2f} {mon.div2} {mon.ort} {mon.seq}\n")
-
-
-def complement(base):
-    """
-    Returns the complement of a nucleotide base.
-
-    Parameters:
-    - base: str - The nucleotide base.
-
-    Returns:
-    - str - The complement of the base.
-    """
-    return {'A': 'T', 'T': 'A', 'C': 'G', 'G': 'C', 'N': 'N', 'X': 'X'}.get(base, 'N')
-
-
-def revcom(s):
-    """
-    Returns the reverse complement of a DNA sequence.
-
-    Parameters:
-    - s: str - The DNA sequence.
-
-    Returns:
-    - str - The reverse complement of the sequence.
-    """
-    return "".join(complement(base) for base in reversed(s))
-
-
-def analyse_chromosome(seq):
-    """
-    Prints the count of each nucleotide in a given sequence.
-
-    Parameters:
-    - seq: str - The DNA sequence to analyze.
-    """
-    print('A:', seq.count('A'))
-    print('C:', seq.count('C'))
-    print('G:', seq.count('G'))
-    print('T:', seq.count('T'))
-    print('N:', seq.count('N'))
-    print("Sequence Length:", len(seq))
-
+import gzip
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import edlib
+import numpy as np
+from Alignment import bounded_distance, max_edit_distance
+from Metrics import current_metrics, instrumented
+from MonomerStore import MonomerStore
+
+
+def join_direct_and_reverse_complement(monomers1, monomers2):
+    """
+    Merges two monomer arrays, sorting them by position and removing duplicates based on orientation rules.
+
+    Parameters:
+    - monomers1: MonomerStore - The first monomer array.
+    - monomers2: MonomerStore - The second monomer array, typically the reverse complement monomers.
+
+    Returns:
+    - MonomerStore - The merged and processed monomer array.
+    """
+    monomers = MonomerStore.concatenate([monomers1, monomers2])
+    monomers = monomers.take(np.argsort(monomers.pos, kind='stable'))
+    no = len(monomers)
+    if no < 2:
+        set_distances(monomers)
+        return monomers
+
+    ort = monomers.ort
+    # A monomer between two monomers of the other orientation is dropped, unless the one before it was dropped.
+    b_skip_next = ((ort[:-2] != ort[1:-1]) & (ort[:-2] == ort[2:])).tolist()
+    keep = []
+    skip = False
+    for i in range(no - 2):
+        if skip:
+            skip = False
+        else:
+            keep.append(i)
+            skip = b_skip_next[i]
+
+    monomers = monomers.take(keep + [no - 2, no - 1])
+    set_distances(monomers)
+    return monomers
+
+
+# Consensus of the human alpha satellite monomer searched for by default.
+ALPHA_CONSENSUS = "TCAGAAACTTCTTTGTGATGTGTGCATTCAACTCACAGAGTTGAACCTTCCTTTTGATAGAGCAGTTTTGAAACACTCTTTTTGTAGAATCTGCAAGTGGATATTTGGAGCGCTTTGAGGCCTTCGGTGGAAAAGGAAATATCTTCACATAAAAACTAGACAGAAGCATTC"
+
+
+def find_record_monomers(seq, monomer_cons=ALPHA_CONSENSUS, processes=1):
+    """
+    Finds the monomers of one sequence in both orientations and merges them.
+
+    Parameters:
+    - seq: str | bytes - The sequence in which to find monomers.
+    - monomer_cons: str | dict - The consensus sequence of the monomer, or several consensuses by name (see
+      load_consensuses).
+    - processes: int - Number of worker processes (1 searches both orientations serially).
+
+    Returns:
+    - MonomerStore - The merged monomers, sorted by position.
+    """
+    if processes > 1:
+        print(f"Searching for monomers in both orientations on {processes} processes")
+        monomers_d, monomers_r = find_monomers_parallel(seq, monomer_cons, processes)
+    else:
+        print("Searching for monomers in direct orientation")
+        monomers_d = find_monomers(seq, monomer_cons, 'd')
+        print("Searching for monomers in reverse complement orientation")
+        monomers_r = find_monomers(seq, monomer_cons, 'r')
+    return join_direct_and_reverse_complement(monomers_d, monomers_r)
+
+
+@instrumented('find_monomers', lambda args, monomers: (len(monomers), len(args[0])))
+def find_monomers(seq, monomer_cons, ort, seed_k=3):
+    """
+    Identifies and returns the monomers found in a given sequence.
+
+    With several consensuses the sequence is scanned once (see scan_consensuses) and every monomer is labelled
+    with the name of its best-matching consensus.
+
+    Parameters:
+    - seq: str - The sequence in which to find monomers.
+    - monomer_cons: str | dict - The consensus sequence of the monomer, or several consensuses by name.
+    - ort: str - The orientation ('d' for direct, 'r' for reverse complement).
+    - seed_k: int - Length of the k-mer seeds used to skip offsets that cannot reach the divergence cutoff
+      (0 or None aligns at every offset); not used with several consensuses.
+
+    Returns:
+    - MonomerStore - The identified monomers.
+    """
+    if ort == "r":
+        seq = revcom(seq)
+
+    no_offsets = max(len(seq) - min_consensus_length(monomer_cons) - 1, 0)
+    if isinstance(monomer_cons, str):
+        monomers, no_aligned = scan_offsets(seq, monomer_cons, ort, seed_k, b_progress=True)
+    else:
+        monomers, no_aligned = scan_consensuses(seq, monomer_cons, ort, b_progress=True)
+    _count_scan(no_offsets, no_aligned, len(monomers))
+    if seed_k and isinstance(monomer_cons, str):
+        current_metrics().progress(f"Seeding pruned {no_offsets - no_aligned} of {no_offsets} offsets")
+    return select_monomers(monomers, seq, ort, monomer_cons)
+
+
+def _count_scan(no_offsets, no_aligned, no_hits):
+    """
+    Reports the offsets and edlib calls of a scan to the current metrics (every hit is aligned a second time).
+    """
+    metrics = current_metrics()
+    metrics.count('edlib_calls', no_aligned + no_hits)
+    metrics.count('candidate_offsets', no_aligned)
+    metrics.count('pruned_offsets', no_offsets - no_aligned)
+
+
+@instrumented('find_monomers', lambda args, result: (len(result[0]) + len(result[1]), 2 * len(args[0])))
+def find_monomers_parallel(seq, monomer_cons, processes=None, chunk_size=1000000, seed_k=3):
+    """
+    Identifies monomers in both orientations at once by scanning overlapping chunks of the sequence in a process pool.
+
+    Each chunk covers a disjoint range of offsets and carries len(monomer_cons) + 1 extra bases, so every window
+    is aligned exactly once. The raw hits are concatenated in offset order before the local-minimum and distance
+    filtering, which makes the result identical to two serial find_monomers calls.
+
+    Parameters:
+    - seq: str - The sequence in which to find monomers.
+    - monomer_cons: str | dict - The consensus sequence of the monomer, or several consensuses by name.
+    - processes: int - Number of worker processes (None uses all available cores).
+    - chunk_size: int - Number of offsets scanned by a single task.
+    - seed_k: int - Length of the k-mer seeds, as in find_monomers.
+
+    Returns:
+    - tuple: The monomers (MonomerStore) found in direct and in reverse complement orientation.
+    """
+    seqs = {'d': seq, 'r': revcom(seq)}
+    no_offsets = max(len(seq) - min_consensus_length(monomer_cons) - 1, 0)
+    overlap = max_consensus_length(monomer_cons) + 1
+    starts = range(0, no_offsets, chunk_size)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        futures = {ort: [executor.submit(_scan_chunk, s[start: start + chunk_size + overlap], monomer_cons, ort,
+                                         start, seed_k, min(chunk_size, no_offsets - start)) for start in starts]
+                   for ort, s in seqs.items()}
+        results = {}
+        for ort, chunk_futures in futures.items():
+            chunks = []
+            no_aligned = 0
+            for k, future in enumerate(chunk_futures):
+                chunk_monomers, chunk_aligned = future.result()
+                chunks.append(chunk_monomers)
+                no_aligned += chunk_aligned
+                current_metrics().progress(f"Progress ({ort}): {(k + 1) / len(chunk_futures) * 100:5.1f}%")
+            monomers = MonomerStore.concatenate(chunks)
+            _count_scan(no_offsets, no_aligned, len(monomers))
+            if seed_k and isinstance(monomer_cons, str):
+                current_metrics().progress(f"Seeding pruned {no_offsets - no_aligned} of {no_offsets} offsets "
+                                           f"({ort})")
+            results[ort] = select_monomers(monomers, seqs[ort], ort, monomer_cons)
+    return results['d'], results['r']
+
+
+def _scan_chunk(chunk, monomer_cons, ort, start, seed_k, no_offsets):
+    """
+    Process pool task of find_monomers_parallel: scans the first no_offsets offsets of one chunk and shifts the
+    hits to sequence coordinates.
+    """
+    if isinstance(monomer_cons, str):
+        monomers, no_aligned = scan_offsets(chunk, monomer_cons, ort, seed_k)
+    else:
+        monomers, no_aligned = scan_consensuses(chunk, monomer_cons, ort, no_offsets=no_offsets)
+    monomers.pos += start
+    return monomers, no_aligned
+
+
+def scan_offsets(seq, monomer_cons, ort, seed_k=3, b_progress=False):
+    """
+    Aligns the consensus at every offset of a sequence and collects the raw hits below 30% divergence.
+
+    Parameters:
+    - seq: str - The sequence to scan (already reverse complemented for 'r').
+    - monomer_cons: str - The consensus sequence of the monomer.
+    - ort: str - The orientation recorded in the hits.
+    - seed_k: int - Length of the k-mer seeds, as in find_monomers.
+    - b_progress: bool - Flag to print the scan progress.
+
+    Returns:
+    - tuple: The raw hits (MonomerStore without sequences) and the number of offsets that were aligned.
+    """
+    pos, div, div2 = [], [], []
+    no_offsets = max(len(seq) - len(monomer_cons) - 1, 0)
+    max_ed = max_edit_distance(len(monomer_cons), 30)
+    # With seeding, distances up to twice the cutoff are computed exactly to drive the skip below; without it a
+    # distance above the cutoff is never used.
+    bound = 2 * max_ed + 1 if seed_k else max_ed
+    if seed_k:
+        offsets = seed_candidate_offsets(seq, monomer_cons, 30, seed_k)
+    else:
+        offsets = range(no_offsets)
+
+    progress_step = max(no_offsets // 20, 1)
+    next_progress = 0 if b_progress else no_offsets
+    next_offset = 0
+    no_aligned = 0
+    for i in offsets:
+        i = int(i)
+        if i < next_offset:
+            continue
+        while i >= next_progress:
+            progress_percentage = next_progress / no_offsets * 100
+            current_metrics().progress(f"Progress: {progress_percentage:5.1f}%")
+            next_progress += progress_step
+        distance = bounded_distance(monomer_cons, seq[i: i + len(monomer_cons)], bound)
+        no_aligned += 1
+        edp = distance / len(monomer_cons) * 100
+        if 0 <= distance and edp < 30:
+            ed = edlib.align(monomer_cons[:10], seq[i: i + 10])
+            pos.append(i)
+            div.append(edp)
+            div2.append(ed["editDistance"])
+        elif seed_k:
+            # Neighbouring windows differ by one deletion and one insertion, so the edit distance
+            # can drop by at most 2 per offset; skip offsets that still cannot reach the cutoff.
+            # A distance beyond the bound is at least bound + 1.
+            next_offset = i + ((distance if distance >= 0 else bound + 1) - max_ed - 1) // 2 + 1
+    return MonomerStore(pos, np.zeros(len(pos)), div, div2, np.full(len(pos), ort)), no_aligned
+
+
+def scan_consensuses(seq, consensuses, ort, b_progress=False, no_offsets=None):
+    """
+    Aligns several consensuses at every offset of a sequence in a single pass and collects the raw hits below 30%
+    divergence from at least one of them, each labelled with its best-matching consensus.
+
+    Every consensus keeps a lower bound of its edit distance to the current window. The bound of an aligned
+    consensus is its distance, and it drops by at most 2 per offset (neighbouring windows differ by one deletion
+    and one insertion). Aligning one consensus also bounds all the others through the triangle inequality with
+    the precomputed distances between consensuses, less their length difference (the windows of two consensuses of
+    unequal lengths differ by that many bases). At each offset the consensuses are aligned in increasing order
+    of their bound, and only while a bound can still beat the best hit. An offset where every bound exceeds the
+    cutoff is skipped until the first bound can reach it again. Similar consensuses (monomer types,
+    suprachromosomal families) therefore prune each other, and most offsets cost one or two alignments whatever
+    their number. Unrelated consensuses are each aligned as in separate scans. The hits and labels are exactly
+    those of aligning every consensus at every offset (ties go to the first consensus).
+
+    Parameters:
+    - seq: str - The sequence to scan (already reverse complemented for 'r').
+    - consensuses: dict - The consensus sequences by name.
+    - ort: str - The orientation recorded in the hits.
+    - b_progress: bool - Flag to print the scan progress.
+    - no_offsets: int - Optional number of offsets to scan (default: every offset a consensus fits in).
+
+    Returns:
+    - tuple: The raw hits (MonomerStore without sequences, with labels) and the number of alignments.
+    """
+    names = list(consensuses)
+    cons = [consensuses[name] for name in names]
+    no_cons = len(cons)
+    lengths = [len(c) for c in cons]
+    max_eds = [max_edit_distance(length, 30) for length in lengths]
+    between = [[edlib.align(a, b)["editDistance"] for b in cons] for a in cons]
+    # The windows of two consensuses start at the same offset, so they differ by their length difference at the end.
+    shifts = [[abs(a - b) for b in lengths] for a in lengths]
+    # Distances up to this bound are computed exactly, which keeps every pruning and skip of an exact distance.
+    bound = 2 * max(max_eds) + 1 + max(map(max, between)) + max(map(max, shifts))
+    # A consensus fits at the offsets before its end, as in scan_offsets.
+    ends = [len(seq) - length - 1 for length in lengths]
+    if no_offsets is None:
+        no_offsets = max(max(ends), 0)
+
+    pos, div, div2, label = [], [], [], []
+    # Lower bound of the distance of every consensus, valid at offset lower_at and dropping by 2 per offset,
+    # and the first offset at which it can reach the cutoff again.
+    lower = [0] * no_cons
+    lower_at = [0] * no_cons
+    ready = [0] * no_cons
+    others = [[(e, between[c][e], shifts[c][e]) for e in range(no_cons) if e != c] for c in range(no_cons)]
+    guess = 0
+    progress_step = max(no_offsets // 20, 1)
+    next_progress = 0 if b_progress else no_offsets
+    no_aligned = 0
+    i = 0
+    while i < no_offsets:
+        while i >= next_progress:
+            current_metrics().progress(f"Progress: {next_progress / no_offsets * 100:5.1f}%")
+            next_progress += progress_step
+        bounds = {c: lower[c] - 2 * (i - lower_at[c]) for c in range(no_cons) if ready[c] <= i < ends[c]}
+        best, best_edp = None, None
+        while bounds:
+            candidates = [c for c in bounds if best is None or (bounds[c] / lengths[c] * 100, c) < (best_edp, best)]
+            if not candidates:
+                break
+            c = min(candidates, key=lambda c: (bounds[c] / lengths[c] * 100, c != guess, c))
+            del bounds[c]
+            distance = bounded_distance(cons[c], seq[i: i + lengths[c]], bound)
+            no_aligned += 1
+            exact = distance if distance >= 0 else bound + 1
+            lower[c], lower_at[c] = exact, i
+            ready[c] = i + max((exact - max_eds[c] - 1) // 2 + 1, 1)
+            for e, between_ce, shift_ce in others[c]:
+                bound_e = exact - between_ce - shift_ce
+                if 0 <= distance < between_ce - shift_ce - bound_e:
+                    bound_e = between_ce - distance - shift_ce
+                if bound_e > lower[e] - 2 * (i - lower_at[e]):
+                    lower[e], lower_at[e] = bound_e, i
+                    if bound_e > max_eds[e]:
+                        ready[e] = max(ready[e], i + (bound_e - max_eds[e] - 1) // 2 + 1)
+                        bounds.pop(e, None)
+                    elif e in bounds:
+                        bounds[e] = bound_e
+            edp = distance / lengths[c] * 100
+            if 0 <= distance and edp < 30 and (best is None or (edp, c) < (best_edp, best)):
+                best, best_edp = c, edp
+        if best is not None:
+            guess = best
+            pos.append(i)
+            div.append(best_edp)
+            div2.append(edlib.align(cons[best][:10], seq[i: i + 10])["editDistance"])
+            label.append(names[best])
+            i += 1
+        else:
+            # Skip the offsets at which no consensus can reach the cutoff yet.
+            i = min((ready[c] for c in range(no_cons) if i < ends[c]), default=no_offsets)
+    return MonomerStore(pos, np.zeros(len(pos)), div, div2, np.full(len(pos), ort), label=label), no_aligned
+
+
+def load_consensuses(file_name):
+    """
+    Reads the consensus sequences to search for from a FASTA file.
+
+    Parameters:
+    - file_name: str - The path to the FASTA file (plain or gzip/bgzip compressed).
+
+    Returns:
+    - dict - The upper-case consensus sequence of every record, by record name, in file order.
+    """
+    return {name: seq.decode('latin-1').upper() for name, seq in iter_fasta_records(file_name)}
+
+
+def min_consensus_length(monomer_cons):
+    """
+    Returns the length of the consensus, or of the shortest one when several are searched.
+    """
+    return len(monomer_cons) if isinstance(monomer_cons, str) else min(map(len, monomer_cons.values()))
+
+
+def max_consensus_length(monomer_cons):
+    """
+    Returns the length of the consensus, or of the longest one when several are searched.
+    """
+    return len(monomer_cons) if isinstance(monomer_cons, str) else max(map(len, monomer_cons.values()))
+
+
+def select_monomers(monomers, seq, ort, monomer_cons=ALPHA_CONSENSUS):
+    """
+    Reduces the raw hits of a scan to the final monomers and sets their distances and sequences.
+
+    Parameters:
+    - monomers: MonomerStore - The raw hits in offset order.
+    - seq: str - The scanned sequence (reverse complemented for 'r').
+    - ort: str - The orientation ('d' for direct, 'r' for reverse complement).
+    - monomer_cons: str | dict - The consensus sequence of the monomer, or several consensuses by name (the hits
+      being labelled with theirs), which give the lengths of the monomers.
+
+    Returns:
+    - MonomerStore - The final monomers, in direct-strand positions.
+    """
+    monomers = find_min_alphas(monomers)
+    set_distances(monomers)
+    monomers = remove_small_distances(monomers)
+    set_distances(monomers)
+    set_sequences(monomers, seq, consensus_lengths(monomers, monomer_cons))
+    if ort == "r":
+        set_back_rc_positions(monomers, len(seq))
+        monomers = monomers.take(np.argsort(monomers.pos, kind='stable'))
+    return monomers
+
+
+def encode_kmers(seq, alphabet, k):
+    """
+    Encodes every k-mer of a sequence as an integer over the given alphabet.
+
+    Parameters:
+    - seq: str - The sequence to encode.
+    - alphabet: str - The symbols that can be part of a valid k-mer.
+    - k: int - The k-mer length.
+
+    Returns:
+    - np.ndarray - One code per k-mer start; k-mers containing a symbol outside the alphabet are -1.
+    """
+    data = seq.encode('latin-1') if isinstance(seq, str) else seq
+    lut = np.full(256, len(alphabet), dtype=np.int64)
+    for code, base in enumerate(alphabet):
+        lut[ord(base)] = code
+    codes = lut[np.frombuffer(data, dtype=np.uint8)]
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.int64)
+    kmers = np.zeros(n, dtype=np.int64)
+    invalid = np.zeros(n, dtype=bool)
+    for t in range(k):
+        kmers = kmers * len(alphabet) + codes[t: t + n]
+        invalid |= codes[t: t + n] == len(alphabet)
+    kmers[invalid] = -1
+    return kmers
+
+
+def seed_candidate_offsets(seq, monomer_cons, max_div, k=3, chunk_size=1 << 20):
+    """
+    Returns the offsets whose window shares enough k-mers with the consensus to possibly be within max_div.
+
+    Uses the q-gram lemma: a window within edit distance e of the consensus shares at least
+    len(monomer_cons) - k + 1 - e * k k-mers with it, so offsets scoring below that bound are pruned
+    without losing any hit of the exhaustive scan.
+
+    Parameters:
+    - seq: str - The sequence in which to find monomers.
+    - monomer_cons: str - The consensus sequence of the monomer.
+    - max_div: float - The divergence cutoff in percent.
+    - k: int - The k-mer (seed) length.
+    - chunk_size: int - Number of offsets scored at once, bounding the memory used.
+
+    Returns:
+    - np.ndarray - The sorted candidate offsets.
+    """
+    cons_len = len(monomer_cons)
+    no_offsets = max(len(seq) - cons_len - 1, 0)
+    needed = cons_len - k + 1 - max_edit_distance(cons_len, max_div) * k
+    if needed <= 0 or k > cons_len:
+        return np.arange(no_offsets)
+
+    alphabet = "".join(sorted(set(monomer_cons)))
+    cons_kmers, cons_counts = np.unique(encode_kmers(monomer_cons, alphabet, k), return_counts=True)
+    width = cons_len - k + 1
+    candidates = []
+    for start in range(0, no_offsets, chunk_size):
+        stop = min(start + chunk_size, no_offsets)
+        kmers = encode_kmers(seq[start: stop + cons_len - 1], alphabet, k)
+        shared = np.zeros(stop - start, dtype=np.int64)
+        for kmer, count in zip(cons_kmers, cons_counts):
+            if kmer < 0:
+                continue
+            cumulative = np.concatenate(([0], np.cumsum(kmers == kmer)))
+            shared += np.minimum(cumulative[width:] - cumulative[:-width], count)
+        candidates.append(np.flatnonzero(shared >= needed) + start)
+    return np.concatenate(candidates) if candidates else np.empty(0, dtype=np.int64)
+
+
+def set_back_rc_positions(monomers, seq_len):
+    """
+    Adjusts the positions of monomers to their original locations in the reverse complement sequence.
+
+    Parameters:
+    - monomers: MonomerStore - The monomers to adjust.
+    - seq_len: int - The length of the original sequence.
+    """
+    monomers.pos = seq_len - monomers.pos
+
+
+def find_min_alphas(monomers):
+    """
+    Filters monomers to include only those with minimum divergence scores compared to their immediate neighbors.
+
+    Parameters:
+    - monomers: MonomerStore - The original monomers.
+
+    Returns:
+    - MonomerStore - The filtered monomers.
+    """
+    div = monomers.div
+    b_min = (div[1:-1] <= div[:-2]) & (div[1:-1] <= div[2:])
+    return monomers.take(np.flatnonzero(b_min) + 1)
+
+
+def set_sequences(monomers, seq, lengths=None):
+    """
+    Sets the sequence for each monomer based on its position and the distance to the next monomer: a monomer
+    extends to the next one if it starts less than 9 bp after the end of its consensus, and over the length of
+    its consensus otherwise.
+
+    Parameters:
+    - monomers: MonomerStore - The monomers to update.
+    - seq: str | bytes - The original sequence from which the monomers were identified.
+    - lengths: np.ndarray - The length of the matched consensus of every monomer (default: the alpha satellite
+      consensus length).
+    """
+    pos = monomers.pos
+    if lengths is None:
+        lengths = np.full(len(pos), len(ALPHA_CONSENSUS))
+    ends = pos + lengths
+    if len(pos):
+        ends[:-1] = np.where(monomers.dst[1:] < lengths[:-1] + 9, pos[1:], ends[:-1])
+    monomers.set_sequences(seq, pos, ends)
+
+
+def consensus_lengths(monomers, monomer_cons):
+    """
+    Returns the length of the matched consensus of every monomer.
+
+    Parameters:
+    - monomers: MonomerStore - The monomers, labelled with their consensus if there are several.
+    - monomer_cons: str | dict - The consensus sequence of the monomer, or several consensuses by name.
+
+    Returns:
+    - np.ndarray - The consensus length of every monomer.
+    """
+    if isinstance(monomer_cons, str):
+        return np.full(len(monomers), len(monomer_cons), dtype=np.int64)
+    names, inverse = np.unique(monomers.label, return_inverse=True)
+    return np.array([len(monomer_cons[name]) for name in names], dtype=np.int64)[inverse]
+
+
+def remove_small_distances(monomers):
+    """
+    Filters out monomers that are too close to each other, based on a distance threshold.
+
+    The monomers are split into groups that start at every distance above 20, and the best monomer of each
+    group is kept (see find_alpha_smallest_div10).
+
+    Parameters:
+    - monomers: MonomerStore - The monomers to filter.
+
+    Returns:
+    - MonomerStore - The filtered monomers.
+    """
+    no = len(monomers)
+    if no == 0:
+        return monomers
+    b_start = monomers.dst > 20
+    b_start[0] = True
+    starts = np.flatnonzero(b_start)
+    group = np.cumsum(b_start) - 1
+    return monomers.take(find_alpha_smallest_div10(monomers.div2, starts, group))
+
+
+def find_alpha_smallest_div10(div2, starts, group):
+    """
+    Finds, in every group of monomers, the last monomer with the smallest div2 score if that score is at most 10,
+    and the first monomer of the group otherwise.
+
+    Parameters:
+    - div2: np.ndarray - The div2 score of every monomer.
+    - starts: np.ndarray - The index of the first monomer of every group.
+    - group: np.ndarray - The group of every monomer.
+
+    Returns:
+    - np.ndarray - The index of the chosen monomer of every group.
+    """
+    best_score = np.minimum.reduceat(div2, starts)
+    b_best = (div2 == best_score[group]) & (best_score[group] <= 10)
+    last_best = np.maximum.reduceat(np.where(b_best, np.arange(len(div2)), -1), starts)
+    return np.where(last_best >= 0, last_best, starts)
+
+
+def set_distances(monomers):
+    """
+    Calculates and sets the distance to the previous monomer for each monomer.
+
+    Parameters:
+    - monomers: MonomerStore - The monomers to update.
+    """
+    monomers.dst = np.diff(monomers.pos, prepend=0)
+
+
+def read_fasta_file(file_name):
+    """
+    Reads the first record of a FASTA file and returns the sequence title and the sequence itself.
+
+    Parameters:
+    - file_name: str - The path to the FASTA file.
+
+    Returns:
+    - tuple: A tuple containing the sequence title and the sequence.
+    """
+    name, seq = next(iter_fasta_records(file_name), ("", b""))
+    return name, seq.decode('latin-1')
+
+
+def iter_fasta_records(file_name, skip=None):
+    """
+    Iterates over the records of a FASTA file, one record in memory at a time.
+
+    Plain files are memory-mapped and each record is cut out of the mapping in a single pass;
+    files ending in .gz (gzip or bgzip) are streamed line by line.
+
+    Parameters:
+    - file_name: str - The path to the FASTA file.
+    - skip: callable - Optional skip(name) telling whether the sequence of a record is not needed; such records
+      are yielded with a None sequence, which is never read from a plain file nor assembled from a gzip stream.
+
+    Returns:
+    - Iterator[tuple] - The name and the sequence (bytes, without line breaks) of every record.
+    """
+    if file_name.endswith('.gz'):
+        with gzip.open(file_name, 'rb') as file:
+            yield from _iter_fasta_lines(file, skip)
+        return
+
+    with open(file_name, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            start = 0
+            while start != -1:
+                eol = mm.find(b'\n', start)
+                eol = len(mm) if eol == -1 else eol
+                end = mm.find(b'\n>', eol)
+                stop = len(mm) if end == -1 else end
+                name = fasta_record_name(mm[start: eol])
+                yield name, None if skip and skip(name) else mm[eol + 1: stop].translate(None, b'\r\n')
+                start = -1 if end == -1 else end + 1
+
+
+def _iter_fasta_lines(file, skip=None):
+    """
+    Iterates over the records of a FASTA stream opened in binary mode (see iter_fasta_records).
+    """
+    name = None
+    seq = bytearray()
+    b_skip = False
+    for line in file:
+        if name is None or line.startswith(b'>'):
+            if name is not None:
+                yield name, None if b_skip else bytes(seq)
+            name = fasta_record_name(line)
+            b_skip = bool(skip and skip(name))
+            seq = bytearray()
+        elif not b_skip:
+            seq += line.rstrip(b'\r\n')
+    if name is not None:
+        yield name, None if b_skip else bytes(seq)
+
+
+def fasta_record_name(title):
+    """
+    Returns the record name from a FASTA header line (the fourth '|' field, or the first word).
+
+    Parameters:
+    - title: bytes - The header line.
+
+    Returns:
+    - str - The record name.
+    """
+    title = title.decode('latin-1').strip().lstrip('>')
+    if '|' in title:
+        return title.split('|')[3]
+    return title.split()[0] if title else title
+
+
+def write_monomers_file(file_name, monomers):
+    """
+    Writes monomers to a file.
+
+    Parameters:
+    - file_name: str - The path to the output file.
+    - monomers: MonomerStore - The monomers to write.
+    """
+    if len(monomers):
+        # The consensus label is a seventh column, written only when several consensuses were searched.
+        labels = [f" {label}" for label in monomers.label.tolist()] if (monomers.label != '').any() \
+            else [""] * len(monomers)
+        with open(file_name, "w") as fp:
+            for pos, dst, div, div2, ort, seq, label in zip(monomers.pos.tolist(), monomers.dst.tolist(),
+                                                            monomers.div.tolist(), monomers.div2.tolist(),
+                                                            monomers.ort.tolist(), monomers.sequences(), labels):
+                fp.write(f"{pos} {dst} {div:.2f} {div2} {ort} {seq}{label}\n")
+
+
+def complement(base):
+    """
+    Returns the complement of a nucleotide base.
+
+    Parameters:
+    - base: str - The nucleotide base.
+
+    Returns:
+    - str - The complement of the base.
+    """
+    return {'A': 'T', 'T': 'A', 'C': 'G', 'G': 'C', 'N': 'N', 'X': 'X'}.get(base, 'N')
+
+
+COMPLEMENT_TABLE = bytes(ord(complement(chr(code))) for code in range(256))
+
+
+def revcom(s):
+    """
+    Returns the reverse complement of a DNA sequence.
+
+    Parameters:
+    - s: str | bytes - The DNA sequence.
+
+    Returns:
+    - str | bytes - The reverse complement of the sequence, of the same type as s.
+    """
+    if isinstance(s, str):
+        return s.encode('latin-1', 'replace').translate(COMPLEMENT_TABLE)[::-1].decode('latin-1')
+    return bytes(s).translate(COMPLEMENT_TABLE)[::-1]
+
+
+def analyse_chromosome(seq):
+    """
+    Prints the count of each nucleotide in a given sequence.
+
+    Parameters:
+    - seq: str | bytes - The DNA sequence to analyze.
+    """
+    data = seq.encode('latin-1', 'replace') if isinstance(seq, str) else seq
+    counts = np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256)
+    for base in 'ACGTN':
+        print(f"{base}:", counts[ord(base)])
+    print("Sequence Length:", len(seq))
@@ -0,0 +1,334 @@
+import struct
+
+import numpy as np
+
+# Binary .mon files: magic, number of monomers, number of sequence bytes and the byte offset of each section.
+# Version 2 adds the consensus label of every monomer; version 1 files are still read.
+BINARY_MAGIC = b"GRMMON2\0"
+BINARY_SECTIONS = ('pos', 'dst', 'div', 'div2', 'ort', 'label', 'label_names', 'seq_offsets', 'seq_data')
+BINARY_FORMATS = {b"GRMMON1\0": ('pos', 'dst', 'div', 'div2', 'ort', 'seq_offsets', 'seq_data'),
+                  BINARY_MAGIC: BINARY_SECTIONS}
+BINARY_HEADER = struct.Struct(f"<8sQQ{len(BINARY_SECTIONS)}Q")
+
+
+class MonomerStore:
+    """
+    Columnar store of a monomer array shared by MonFinder and GRMhor.
+
+    Every monomer property is one numpy array indexed by the monomer number. The sequences are kept in a single
+    uint8 buffer addressed by seq_offsets, and the families in CSR form: the family of monomer k is
+    family_members[family_offsets[k]: family_offsets[k + 1]]. label holds the name of the consensus a monomer was
+    found with, or '' when a single consensus was searched. Indexing the store with an integer returns a
+    lightweight Monomer view; indexing it with a slice or an index array returns a new store.
+    """
+
+    def __init__(self, pos, dst, div, div2, ort, seq_data=None, seq_offsets=None, label=None):
+        no = len(pos)
+        self.pos = np.asarray(pos, dtype=np.int64)
+        self.dst = np.asarray(dst, dtype=np.int64)
+        self.div = np.asarray(div, dtype=np.float64)
+        self.div2 = np.asarray(div2, dtype=np.int64)
+        self.ort = np.asarray(ort, dtype='U1')
+        self.label = np.full(no, '', dtype='U1') if label is None else np.asarray(label, dtype=str)
+        self.seq_data = np.empty(0, dtype=np.uint8) if seq_data is None else np.asarray(seq_data, dtype=np.uint8)
+        self.seq_offsets = np.zeros(no + 1, dtype=np.int64) if seq_offsets is None \
+            else np.asarray(seq_offsets, dtype=np.int64)
+        self.row = np.full(no, -1, dtype=np.int64)
+        self.col = np.full(no, -1, dtype=np.int64)
+        self.colStart = np.full(no, -1, dtype=np.int64)
+        self.monNo = np.full(no, -1, dtype=np.int64)
+        self.family_offsets = np.zeros(no + 1, dtype=np.int64)
+        self.family_members = np.empty(0, dtype=np.int64)
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Builds a store from (pos, dst, div, div2, ort, seq[, label]) records, as found in a text .mon file.
+
+        Parameters:
+        - records: Iterable[tuple] - The monomer records; numeric fields may be strings.
+
+        Returns:
+        - MonomerStore - The store holding the records in the given order.
+        """
+        columns = ([], [], [], [], [], [])
+        labels = []
+        for record in records:
+            for column, value in zip(columns, record):
+                column.append(value)
+            labels.append(record[6] if len(record) > 6 else '')
+        pos, dst, div, div2, ort, seqs = columns
+        data = [seq.encode('latin-1') if isinstance(seq, str) else bytes(seq) for seq in seqs]
+        offsets = np.cumsum([0] + [len(seq) for seq in data], dtype=np.int64)
+        return cls(np.array(pos, dtype=np.float64).astype(np.int64), np.array(dst, dtype=np.float64).astype(np.int64),
+                   np.array(div, dtype=np.float64), np.array(div2, dtype=np.float64).astype(np.int64), ort,
+                   np.frombuffer(b"".join(data), dtype=np.uint8), offsets, labels if any(labels) else None)
+
+    @classmethod
+    def concatenate(cls, stores):
+        """
+        Joins several stores into one, in the given order. Families and the column layout are not kept.
+
+        Parameters:
+        - stores: List[MonomerStore] - The stores to join.
+
+        Returns:
+        - MonomerStore - The joined store.
+        """
+        stores = list(stores)
+        if not stores:
+            return cls.empty()
+        seq_offsets = [stores[0].seq_offsets[:1]]
+        shift = 0
+        for store in stores:
+            seq_offsets.append(store.seq_offsets[1:] + shift)
+            shift += int(store.seq_offsets[-1])
+        return cls(*(np.concatenate([getattr(store, name) for store in stores])
+                     for name in ('pos', 'dst', 'div', 'div2', 'ort', 'seq_data')),
+                   np.concatenate(seq_offsets), np.concatenate([store.label for store in stores]))
+
+    @classmethod
+    def empty(cls):
+        return cls([], [], [], [], [])
+
+    def __len__(self):
+        return len(self.pos)
+
+    def __iter__(self):
+        return (Monomer(self, k) for k in range(len(self)))
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)):
+            if key < 0:
+                key += len(self)
+            if not 0 <= key < len(self):
+                raise IndexError("monomer index out of range")
+            return Monomer(self, int(key))
+        return self.take(np.arange(len(self))[key] if isinstance(key, slice) else key)
+
+    def take(self, indices):
+        """
+        Returns a new store with the monomers at the given indices, in that order.
+        Families are dropped, since they refer to indices of this store.
+
+        Parameters:
+        - indices: np.ndarray - The monomer indices (or a boolean mask).
+
+        Returns:
+        - MonomerStore - The selected monomers.
+        """
+        indices = np.asarray(indices)
+        if indices.dtype == bool:
+            indices = np.flatnonzero(indices)
+        indices = indices.astype(np.int64)
+        starts = self.seq_offsets[indices]
+        lengths = self.seq_offsets[indices + 1] - starts
+        offsets = np.zeros(len(indices) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        gather = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return MonomerStore(self.pos[indices], self.dst[indices], self.div[indices], self.div2[indices],
+                            self.ort[indices], self.seq_data[gather], offsets, self.label[indices])
+
+    def set_sequences(self, data, starts, ends):
+        """
+        Cuts the sequence of every monomer out of a genome sequence.
+
+        Parameters:
+        - data: str | bytes - The genome sequence.
+        - starts: np.ndarray - The first base of every monomer.
+        - ends: np.ndarray - The end (exclusive) of every monomer; it is clipped to the sequence like a slice.
+        """
+        buffer = np.frombuffer(data.encode('latin-1') if isinstance(data, str) else data, dtype=np.uint8)
+        starts = np.clip(np.asarray(starts, dtype=np.int64), 0, len(buffer))
+        lengths = np.clip(np.asarray(ends, dtype=np.int64), 0, len(buffer)) - starts
+        lengths = np.maximum(lengths, 0)
+        self.seq_offsets = np.zeros(len(starts) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.seq_offsets[1:])
+        self.seq_data = buffer[np.repeat(starts - self.seq_offsets[:-1], lengths) + np.arange(self.seq_offsets[-1])]
+
+    def seq(self, k):
+        return self.seq_bytes(k).decode('latin-1')
+
+    def seq_bytes(self, k):
+        return self.seq_data[self.seq_offsets[k]: self.seq_offsets[k + 1]].tobytes()
+
+    def sequences(self):
+        """
+        Returns the sequences of all monomers as a list of strings.
+        """
+        text = self.seq_data.tobytes().decode('latin-1')
+        offsets = self.seq_offsets.tolist()
+        return [text[offsets[k]: offsets[k + 1]] for k in range(len(self))]
+
+    def seq_lengths(self):
+        return np.diff(self.seq_offsets)
+
+    def family(self, k):
+        return self.family_members[self.family_offsets[k]: self.family_offsets[k + 1]]
+
+    def family_sizes(self):
+        return np.diff(self.family_offsets)
+
+    def families(self):
+        """
+        Returns the family of every monomer as a list of lists of monomer indices.
+        """
+        members = self.family_members.tolist()
+        offsets = self.family_offsets.tolist()
+        return [members[offsets[k]: offsets[k + 1]] for k in range(len(self))]
+
+    def set_families(self, families):
+        """
+        Replaces the families of all monomers.
+
+        Parameters:
+        - families: List[List[int]] - The family (monomer indices) of every monomer.
+        """
+        self.family_offsets = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum([len(family) for family in families], out=self.family_offsets[1:])
+        self.family_members = np.fromiter((j for family in families for j in family), dtype=np.int64,
+                                          count=int(self.family_offsets[-1]))
+
+    def reset_layout(self):
+        """
+        Clears the row and column layout left by a previous drawing.
+        """
+        self.row[:] = -1
+        self.col[:] = -1
+        self.colStart[:] = -1
+
+
+def _column(name):
+    def get(self):
+        return getattr(self.store, name)[self.index].item()
+
+    def set(self, value):
+        getattr(self.store, name)[self.index] = value
+
+    return property(get, set)
+
+
+class Monomer:
+    """
+    View of one monomer of a MonomerStore, for code that works on a single monomer at a time.
+    Reading or writing an attribute reads or writes the corresponding column of the store.
+    """
+
+    __slots__ = ('store', 'index')
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    pos = _column('pos')
+    dst = _column('dst')
+    div = _column('div')
+    div2 = _column('div2')
+    ort = _column('ort')
+    label = _column('label')
+    row = _column('row')
+    col = _column('col')
+    colStart = _column('colStart')
+    monNo = _column('monNo')
+
+    @property
+    def seq(self):
+        return self.store.seq(self.index)
+
+    @property
+    def family(self):
+        return self.store.family(self.index)
+
+    def __str__(self):
+        return f"{self.pos} {self.dst} {self.div:.2f} {self.seq}"
+
+
+def is_binary_monomers_file(file_name):
+    """
+    Tells whether a .mon file is in the binary format written by write_binary_monomers.
+    """
+    with open(file_name, "rb") as file:
+        return file.read(len(BINARY_MAGIC)) in BINARY_FORMATS
+
+
+def write_binary_monomers(file_name, monomers):
+    """
+    Writes monomers to a binary .mon file.
+
+    The file starts with a fixed header followed by one section per column: pos, dst, div2 and seq_offsets as
+    int64, div as float64, ort as one byte per monomer, label as an int32 index into label_names (the distinct
+    labels separated by newlines) and the concatenated sequences. Every section starts at
+    an 8-byte boundary, and seq_offsets is the index of the sequences, so any range of monomers can be read
+    from a memory map without parsing the rest of the file.
+
+    Parameters:
+    - file_name: str - The path to the output file.
+    - monomers: MonomerStore - The monomers to write.
+    """
+    o0, o1 = int(monomers.seq_offsets[0]), int(monomers.seq_offsets[-1])
+    label_names, label = np.unique(monomers.label, return_inverse=True)
+    sections = {'pos': monomers.pos.astype('<i8'), 'dst': monomers.dst.astype('<i8'),
+                'div': monomers.div.astype('<f8'), 'div2': monomers.div2.astype('<i8'),
+                'ort': np.char.encode(monomers.ort, 'latin-1').view(np.uint8) if len(monomers)
+                else np.empty(0, dtype=np.uint8),
+                'label': label.ravel().astype('<i4'),
+                'label_names': np.frombuffer("\n".join(label_names.tolist()).encode('latin-1'), dtype=np.uint8),
+                'seq_offsets': (monomers.seq_offsets - o0).astype('<i8'), 'seq_data': monomers.seq_data[o0: o1]}
+    offsets = []
+    position = BINARY_HEADER.size
+    for name in BINARY_SECTIONS:
+        offsets.append(position)
+        position += -(-sections[name].nbytes // 8) * 8
+    with open(file_name, "wb") as file:
+        file.write(BINARY_HEADER.pack(BINARY_MAGIC, len(monomers), o1 - o0, *offsets))
+        for name, offset in zip(BINARY_SECTIONS, offsets):
+            file.seek(offset)
+            file.write(np.ascontiguousarray(sections[name]).tobytes())
+        file.truncate(position)
+
+
+def load_binary_monomers(file_name, start=0, end=None, region=None):
+    """
+    Loads a range of monomers from a binary .mon file through a memory map.
+
+    Only the pages of the requested records are read, so the cost does not depend on the size of the file
+    (a genomic region adds a binary search over the positions).
+
+    Parameters:
+    - file_name: str - The path to the binary .mon file.
+    - start: int - The first monomer to load.
+    - end: int - The monomer after the last one to load (None loads up to the end of the file).
+    - region: tuple - Optional (first, last) genomic positions in bp; only monomers starting in this interval
+      are loaded, within the start/end range.
+
+    Returns:
+    - MonomerStore - The loaded monomers. The columns are copy-on-write views of the file.
+    """
+    data = np.memmap(file_name, dtype=np.uint8, mode='c')
+    names = BINARY_FORMATS.get(data[:len(BINARY_MAGIC)].tobytes())
+    if names is None:
+        raise ValueError(f"{file_name} is not a binary monomers file")
+    header = struct.Struct(f"<8sQQ{len(names)}Q")
+    magic, no, seq_bytes, *offsets = header.unpack(data[:header.size].tobytes())
+    sections = dict(zip(names, offsets))
+
+    def section(name, dtype, first, last):
+        size = np.dtype(dtype).itemsize
+        return data[sections[name] + first * size: sections[name] + last * size].view(dtype)
+
+    start, end = slice(start, end).indices(no)[:2]
+    end = max(start, end)
+    if region is not None:
+        pos = section('pos', '<i8', start, end)
+        start, end = start + int(np.searchsorted(pos, region[0], side='left')), \
+            start + int(np.searchsorted(pos, region[1], side='right'))
+    seq_offsets = section('seq_offsets', '<i8', start, end + 1)
+    seq_data = section('seq_data', np.uint8, int(seq_offsets[0]), int(seq_offsets[-1]))
+    label = None
+    if 'label' in sections:
+        label_names = data[sections['label_names']: sections['seq_offsets']].tobytes().rstrip(b"\0")
+        label = np.array(label_names.decode('latin-1').split("\n"))[section('label', '<i4', start, end)]
+    return MonomerStore(section('pos', '<i8', start, end), section('dst', '<i8', start, end),
+                        section('div', '<f8', start, end), section('div2', '<i8', start, end),
+                        section('ort', 'S1', start, end).astype('U1'), seq_data, seq_offsets - seq_offsets[0],
+                        label)
@@ -0,0 +1,151 @@
+import os
+import re
+
+from GRMhor import apply_families, detect_families, draw_grm_and_mdd, draw_hor_structure, grm, hor_layout
+from MonFinder import ALPHA_CONSENSUS, find_record_monomers, iter_fasta_records, write_monomers_file
+from MonomerStore import write_binary_monomers
+
+
+def run_pipeline(fasta_file, limits=(5,), monomer_cons=ALPHA_CONSENSUS, processes=1, pruning='exact', cache=None,
+                 step=1, max_period=60, out_dir=None, b_binary=False, clustering='all-pairs'):
+    """
+    Annotates the HOR structure of every record of a FASTA file in one process, without intermediate text files.
+
+    The stages are chained generators: a record is read, searched for monomers, grouped into families and
+    annotated before the next record is read, so only one record and its monomers are in memory at a time.
+
+        for annotation in run_pipeline("assembly.fa.gz", limits=[2, 5]):
+            print(annotation['record'], annotation['limit'], annotation['freq'][:20])
+
+    Parameters:
+    - fasta_file: str - Path to the FASTA file (plain or gzip/bgzip compressed).
+    - limits: List[float] - Divergence limits of the family detection.
+    - monomer_cons: str | dict - The consensus sequence of the monomer, or several consensuses by name.
+    - processes: int - Number of worker processes of the monomer search and the family detection.
+    - pruning: str - Candidate pruning mode, as in find_families.
+    - cache: DistanceCache - Optional persistent distance cache.
+    - step: int - Number of consecutive family labels compared by the GRM.
+    - max_period: int - The largest period counted in the GRM frequencies.
+    - out_dir: str - Optional directory receiving the monomers of every record as a .mon file.
+    - b_binary: bool - Flag to write the .mon files in the binary format instead of text.
+    - clustering: str - Family detection mode, as in detect_families.
+
+    Returns:
+    - Iterator[dict] - One annotation per record and limit (see hor_annotations).
+    """
+    records = record_monomers(fasta_file, monomer_cons, processes)
+    if out_dir is not None:
+        records = save_monomers(records, out_dir, b_binary)
+    records = record_families(records, limits, pruning, processes, cache, clustering)
+    return hor_annotations(records, step, max_period)
+
+
+def record_monomers(fasta_file, monomer_cons=ALPHA_CONSENSUS, processes=1):
+    """
+    Pipeline stage: finds the monomers of every FASTA record, reading the next record only when asked for it.
+
+    Parameters:
+    - fasta_file: str - Path to the FASTA file.
+    - monomer_cons: str | dict - The consensus sequence of the monomer, or several consensuses by name.
+    - processes: int - Number of worker processes of the monomer search.
+
+    Returns:
+    - Iterator[tuple] - The record name and its monomers (MonomerStore).
+    """
+    for name, seq in iter_fasta_records(fasta_file):
+        print(f"Record {name}")
+        yield name, find_record_monomers(seq, monomer_cons, processes)
+
+
+def save_monomers(records, out_dir, b_binary=False):
+    """
+    Optional pipeline stage: writes the monomers of every record to <out_dir>/<record>.mon and passes them on.
+
+    Parameters:
+    - records: Iterator[tuple] - Record names and monomers, as yielded by record_monomers.
+    - out_dir: str - The output directory.
+    - b_binary: bool - Flag to write the binary format instead of text.
+
+    Returns:
+    - Iterator[tuple] - The records, unchanged.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    for name, monomers in records:
+        file_name = os.path.join(out_dir, f"{record_file_name(name)}.mon")
+        if b_binary:
+            write_binary_monomers(file_name, monomers)
+        else:
+            write_monomers_file(file_name, monomers)
+        yield name, monomers
+
+
+def record_file_name(name):
+    """
+    Returns a FASTA record name with the characters that are unsafe in file names replaced by '_'.
+    """
+    return re.sub(r'[^\w.-]', '_', name)
+
+
+def record_families(records, limits=(5,), pruning='exact', processes=1, cache=None, clustering='all-pairs'):
+    """
+    Pipeline stage: detects the families of every record at each divergence limit.
+
+    Parameters:
+    - records: Iterator[tuple] - Record names and monomers.
+    - limits: List[float] - Divergence limits of the family detection.
+    - pruning: str - Candidate pruning mode, as in find_families.
+    - processes: int - Number of worker processes of the family detection.
+    - cache: DistanceCache - Optional persistent distance cache.
+    - clustering: str - Family detection mode, as in detect_families.
+
+    Returns:
+    - Iterator[tuple] - The record name, its monomers and the merged families of every limit.
+    """
+    for name, monomers in records:
+        yield name, monomers, detect_families(monomers, list(limits), pruning, processes, cache, clustering)
+
+
+def hor_annotations(records, step=1, max_period=60):
+    """
+    Pipeline stage: computes the HOR layout and the GRM of every record and limit.
+
+    The families of the limit are applied to the monomers of the record while its annotation is being consumed,
+    so draw_annotation can be called on it before asking for the next one.
+
+    Parameters:
+    - records: Iterator[tuple] - Record names, monomers and families, as yielded by record_families.
+    - step: int - Number of consecutive family labels compared by the GRM.
+    - max_period: int - The largest period counted in the GRM frequencies.
+
+    Returns:
+    - Iterator[dict] - Annotations with the keys 'record', 'limit', 'monomers', 'families', 'layout' (see
+      hor_layout), 'freq', 'frag', 'gap' and 'gap_len' (see grm).
+    """
+    for name, monomers, families_of_limit in records:
+        for limit, families in families_of_limit.items():
+            apply_families(monomers, families)
+            layout = hor_layout(monomers)
+            freq, frag, gap, gap_len = grm(layout['x'], monomers, step, max_period)
+            yield {'record': name, 'limit': limit, 'monomers': monomers, 'families': families, 'layout': layout,
+                   'freq': freq, 'frag': frag, 'gap': gap, 'gap_len': gap_len}
+
+
+def draw_annotation(annotation, file_name, out_format='ps', pmax=60, step=1, mdd_mode='auto'):
+    """
+    Draws the HOR scheme and the GRM/MDD diagrams of an annotation, as main_GRMhor does for a .mon file.
+
+    Parameters:
+    - annotation: dict - An annotation yielded by hor_annotations.
+    - file_name: str - The base name of the output files.
+    - out_format: str - Format of the HOR scheme.
+    - pmax: int - Maximum displayed period.
+    - step: int - Number of consecutive family labels compared by the GRM.
+    - mdd_mode: str - Rendering of the MDD diagram.
+    """
+    monomers = annotation['monomers']
+    apply_families(monomers, annotation['families'])
+    series = draw_hor_structure(monomers, file_name, b_numbers=False, b_position_marks_blocks=False,
+                                b_mers_marks=False, b_alpha_positions=False, f_cube_proportions=1,
+                                out_format=out_format)
+    draw_grm_and_mdd(series, monomers, file_name, b_block_lines=False, xmax=pmax, ymax=pmax, xtics_period=2000,
+                     ytics_period=5, step=step, mdd_mode=mdd_mode)
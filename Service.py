@@ -0,0 +1,368 @@
+import json
+import os
+import socketserver
+import tempfile
+import threading
+import traceback
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+from GRMhor import apply_families, detect_families, draw_grm_and_mdd, draw_hor_structure, grm_frequencies, \
+    hor_layout
+from SlidingWindow import window_labels
+
+IMAGE_TYPES = {'svg': 'image/svg+xml', 'png': 'image/png', 'pdf': 'application/pdf', 'ps': 'application/postscript'}
+
+
+class MonomerArray:
+    """
+    A monomer array held in memory by the query service.
+
+    The family detection runs once, at the detection limit, and its family edges are kept sorted by their later
+    monomer. The families of any window and any lower limit are rebuilt from these edges without aligning, exactly
+    as find_families and join_families_v03 would find them on the window alone.
+    """
+
+    def __init__(self, name, monomers, limit=5, pruning='exact', processes=1, cache=None, max_cached_limits=8):
+        self.name = name
+        self.monomers = monomers
+        self.limit = limit
+        self.max_cached_limits = max_cached_limits
+        distances = []
+        detect_families(monomers, [limit], pruning, processes, cache, distances=distances)
+        i = np.fromiter((edge[0] for edge in distances), dtype=np.int64, count=len(distances))
+        j = np.fromiter((edge[1] for edge in distances), dtype=np.int64, count=len(distances))
+        edp = np.fromiter((edge[2] for edge in distances), dtype=np.float64, count=len(distances))
+        order = np.argsort(j, kind='stable')
+        order = order[i[order] != j[order]]
+        self.edge_from, self.edge_to, self.edge_edp = i[order], j[order], edp[order]
+        self.edge_offsets = np.searchsorted(self.edge_to, np.arange(len(monomers) + 1))
+        # The direct-strand interval of every monomer, sorted by its left end; the position of a reverse complement
+        # monomer is its (excluded) right end.
+        seq_lengths = monomers.seq_lengths()
+        left = np.where(monomers.ort == 'r', monomers.pos - seq_lengths, monomers.pos)
+        self.left_order = np.argsort(left, kind='stable')
+        self.left_sorted = left[self.left_order]
+        self.right_sorted = self.left_sorted + seq_lengths[self.left_order]
+        self.max_length = int(seq_lengths.max()) if len(monomers) else 0
+        self.whole = {}
+        # The whole-array results are computed once, whichever request thread asks first.
+        self.whole_lock = threading.Lock()
+
+    def window_families(self, start, end, limit):
+        """
+        Returns the merged families of the monomers start..end-1 at a divergence limit, in window indices.
+
+        Parameters:
+        - start: int - The first monomer of the window.
+        - end: int - The monomer after the last one of the window.
+        - limit: float - The divergence limit, at most the detection limit.
+
+        Returns:
+        - List[List[int]] - The family of every monomer of the window, as join_families_v03 sets it.
+        """
+        if limit > self.limit:
+            raise ValueError(f"Limit {limit:g} is above the detection limit {self.limit:g} of {self.name}")
+        lo, hi = self.edge_offsets[start], self.edge_offsets[end]
+        a, b = self.edge_from[lo: hi], self.edge_to[lo: hi]
+        keep = (a >= start) & (self.edge_edp[lo: hi] < limit)
+        a, b = a[keep] - start, b[keep] - start
+        no = end - start
+        root = edge_components(no, a, b)
+        # Like find_families, every monomer but the last is a member of its own family.
+        member = np.arange(no) < no - 1
+        member[a] = member[b] = True
+        families = [[] for _ in range(no)]
+        for k, r in zip(np.flatnonzero(member).tolist(), root[member].tolist()):
+            families[r].append(k)
+        return families
+
+    def array_families(self, limit):
+        """
+        Returns the families of the whole array at a limit, the family (smallest member) of every monomer and its
+        HOR scheme column; the results of the last max_cached_limits limits are kept.
+        """
+        with self.whole_lock:
+            if limit not in self.whole:
+                families = self.window_families(0, len(self.monomers), limit)
+                family_of = np.full(len(self.monomers), -1, dtype=np.int64)
+                for k, family in enumerate(families):
+                    family_of[family] = k
+                if len(self.whole) >= self.max_cached_limits:
+                    del self.whole[next(iter(self.whole))]
+                self.whole[limit] = (families, family_of, np.asarray(window_labels(families)))
+            return self.whole[limit]
+
+    def window(self, params):
+        """
+        Returns the monomer range selected by the query parameters: 'start' and 'end' (monomer indices) or 'first'
+        and 'last' (genomic positions in bp), the whole array by default.
+        """
+        no = len(self.monomers)
+        if 'first' in params or 'last' in params:
+            start = int(np.searchsorted(self.monomers.pos, int(params.get('first', 0)), 'left'))
+            end = int(np.searchsorted(self.monomers.pos, int(params['last']), 'right')) if 'last' in params else no
+        else:
+            start, end = int(params.get('start', 0)), int(params.get('end', no))
+        if not 0 <= start < end <= no:
+            raise ValueError(f"Empty or invalid monomer range {start}-{end} of {self.name} ({no} monomers)")
+        return start, end
+
+    def monomer_at(self, params):
+        """
+        Returns the monomer selected by the query parameters: 'index', or 'pos', a genomic position in bp that
+        must fall inside a monomer on the direct strand (the last one starting before it if monomers overlap).
+        """
+        if 'index' in params:
+            k = int(params['index'])
+            if not 0 <= k < len(self.monomers):
+                raise ValueError(f"No monomer {k} in {self.name}")
+            return k
+        if 'pos' not in params:
+            raise ValueError("A monomer is selected by its index or its pos")
+        pos = int(params['pos'])
+        # Only the monomers starting at most max_length bp before pos can cover it.
+        first = int(np.searchsorted(self.left_sorted, pos - self.max_length, 'right'))
+        last = int(np.searchsorted(self.left_sorted, pos, 'right'))
+        covering = np.flatnonzero(self.right_sorted[first: last] > pos)
+        if not len(covering):
+            raise LookupError(f"No monomer of {self.name} at position {pos}")
+        return int(self.left_order[first + covering[-1]])
+
+    @staticmethod
+    def grm_params(params):
+        """
+        Returns the GRM 'step' and 'pmax' of the query parameters (default 1 and 60), which must be positive.
+        """
+        step, pmax = int(params.get('step', 1)), int(params.get('pmax', 60))
+        if step < 1 or pmax < 1:
+            raise ValueError(f"The step ({step}) and pmax ({pmax}) must be positive")
+        return step, pmax
+
+    def info(self):
+        """
+        Answers /arrays: the name, size, genomic span, detection limit and number of family edges of the array.
+        """
+        no = len(self.monomers)
+        return {'name': self.name, 'monomers': no, 'first_pos': int(self.monomers.pos[0]) if no else None,
+                'last_pos': int(self.monomers.pos[-1]) if no else None, 'limit': self.limit,
+                'edges': len(self.edge_to)}
+
+    def range_query(self, params):
+        """
+        Answers /monomers: the monomers of a range with their family and HOR column in the whole array.
+        """
+        start, end = self.window(params)
+        _, family_of, columns = self.array_families(float(params.get('limit', self.limit)))
+        m = self.monomers
+        return {'start': start, 'end': end, 'monomers': [
+            {'index': k, 'pos': int(m.pos[k]), 'dst': int(m.dst[k]), 'div': float(m.div[k]), 'ort': str(m.ort[k]),
+             'label': str(m.label[k]), 'family': int(family_of[k]), 'column': int(columns[k])}
+            for k in range(start, end)]}
+
+    def family_query(self, params):
+        """
+        Answers /family: the family of a monomer in the whole array, with its members and HOR column.
+        """
+        k = self.monomer_at(params)
+        limit = float(params.get('limit', self.limit))
+        families, family_of, columns = self.array_families(limit)
+        family = families[family_of[k]] if family_of[k] >= 0 else []
+        return {'index': k, 'pos': int(self.monomers.pos[k]), 'limit': limit, 'family': int(family_of[k]),
+                'column': int(columns[k]), 'size': len(family), 'members': family}
+
+    def grm_query(self, params):
+        """
+        Answers /grm: the GRM frequencies and the most frequent period of a window analyzed on its own.
+        """
+        start, end = self.window(params)
+        limit = float(params.get('limit', self.limit))
+        families = self.window_families(start, end, limit)
+        step, pmax = self.grm_params(params)
+        freq, _ = grm_frequencies(window_labels(families), step, pmax)
+        return {'start': start, 'end': end, 'limit': limit, 'families': sum(len(family) > 1 for family in families),
+                'top_period': int(np.argmax(freq)) if freq.any() else 0, 'freq': freq.tolist()}
+
+    def render(self, params):
+        """
+        Draws the HOR scheme ('image=hor', in the requested 'format') or the GRM/MDD diagram ('image=grm', PDF)
+        of a window, and returns its content type and bytes.
+        """
+        start, end = self.window(params)
+        limit = float(params.get('limit', self.limit))
+        image = params.get('image', 'hor')
+        out_format = params.get('format', 'svg') if image == 'hor' else 'pdf'
+        if image not in ('hor', 'grm') or out_format not in IMAGE_TYPES:
+            raise ValueError(f"Unknown image {image} or format {out_format}")
+        step, pmax = self.grm_params(params)
+        monomers = self.monomers.take(np.arange(start, end))
+        apply_families(monomers, self.window_families(start, end, limit))
+        with tempfile.TemporaryDirectory() as out_dir:
+            base = os.path.join(out_dir, "window")
+            if image == 'hor':
+                draw_hor_structure(monomers, base, b_numbers=False, b_position_marks_blocks=False, b_mers_marks=False,
+                                   b_alpha_positions=False, f_cube_proportions=1, out_format=out_format)
+                file_name = f"{base}.HORscheme.{out_format}"
+            else:
+                draw_grm_and_mdd(hor_layout(monomers)['x'], monomers, base, b_block_lines=False, xmax=pmax,
+                                 ymax=pmax, xtics_period=2000, ytics_period=5, step=step)
+                file_name = f"{base}.GRM_MDD.pdf"
+            with open(file_name, "rb") as file:
+                return IMAGE_TYPES[out_format], file.read()
+
+
+def edge_components(no, a, b):
+    """
+    Labels the connected components of a graph with their smallest node, by vectorized label propagation.
+
+    Parameters:
+    - no: int - The number of nodes.
+    - a: np.ndarray - The first node of every edge.
+    - b: np.ndarray - The second node of every edge.
+
+    Returns:
+    - np.ndarray - The smallest node of the component of every node.
+    """
+    root = np.arange(no)
+    while True:
+        low = np.minimum(root[a], root[b])
+        new = root.copy()
+        np.minimum.at(new, a, low)
+        np.minimum.at(new, b, low)
+        # Pointer jumping: every node takes the label of its label.
+        new = new[new]
+        if np.array_equal(new, root):
+            return root
+        root = new
+
+
+class QueryService:
+    """
+    Answers the queries on the loaded monomer arrays. Every query is a path and a dict of parameters, and every
+    parameter but 'array' (the array name, optional if a single array is loaded) is optional:
+    - /arrays: the loaded arrays;
+    - /monomers (start, end or first, last; limit): the monomers of a range with their family and HOR column;
+    - /family (index or pos; limit): the family of a monomer in the whole array;
+    - /grm (start, end or first, last; limit, step, pmax): the GRM frequencies of a window;
+    - /render (start, end or first, last; limit, image=hor|grm, format, step, pmax): a diagram of a window.
+    """
+
+    def __init__(self, arrays):
+        self.arrays = {array.name: array for array in arrays}
+        self.render_lock = threading.Lock()
+
+    def query(self, path, params):
+        """
+        Answers a query.
+
+        Parameters:
+        - path: str - The query path.
+        - params: dict - The query parameters.
+
+        Returns:
+        - tuple: The content type and the body (bytes) of the answer.
+        """
+        if path == '/arrays':
+            return self._json([array.info() for array in self.arrays.values()])
+        handlers = {'/monomers': MonomerArray.range_query, '/family': MonomerArray.family_query,
+                    '/grm': MonomerArray.grm_query}
+        if path not in handlers and path != '/render':
+            raise LookupError(f"Unknown query {path}")
+        array = self.array(params.get('array'))
+        if path == '/render':
+            # matplotlib is not thread-safe.
+            with self.render_lock:
+                return array.render(params)
+        return self._json(handlers[path](array, params))
+
+    def array(self, name):
+        """
+        Returns the array of a query, by name or the only loaded one.
+        """
+        if name is None and len(self.arrays) == 1:
+            return next(iter(self.arrays.values()))
+        if name not in self.arrays:
+            raise LookupError(f"Unknown array {name}; loaded arrays: {', '.join(self.arrays)}")
+        return self.arrays[name]
+
+    @staticmethod
+    def _json(result):
+        return 'application/json', json.dumps(result).encode()
+
+
+def make_handler(service, b_quiet=False):
+    """
+    Returns the HTTP request handler class answering GET requests with the service; errors are answered with a
+    JSON {"error": ...} body and the status 404 (unknown query, array or monomer), 400 (invalid parameters) or 500
+    (any other failure, logged with its traceback).
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            params = {name: values[-1] for name, values in parse_qs(url.query).items()}
+            try:
+                content_type, body = service.query(url.path, params)
+                status = 200
+            except LookupError as error:
+                status, content_type, body = 404, 'application/json', json.dumps({'error': str(error)}).encode()
+            except ValueError as error:
+                status, content_type, body = 400, 'application/json', json.dumps({'error': str(error)}).encode()
+            except Exception as error:
+                self.log_error("%s", traceback.format_exc())
+                status, content_type = 500, 'application/json'
+                body = json.dumps({'error': f"{type(error).__name__}: {error}"}).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            if not b_quiet:
+                super().log_message(format, *args)
+
+    return Handler
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    HTTP server listening on a Unix socket.
+    """
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # The request handlers expect a (host, port) client address.
+        return request, ('local', 0)
+
+
+def serve(service, host='127.0.0.1', port=8642, socket_path=None, b_quiet=False):
+    """
+    Serves the queries over HTTP on host:port, or on a Unix socket if socket_path is given, until interrupted.
+
+    Parameters:
+    - service: QueryService - The service answering the queries.
+    - host: str - The address to listen on (localhost by default).
+    - port: int - The TCP port.
+    - socket_path: str - Optional path of a Unix socket to listen on instead.
+    - b_quiet: bool - Flag to turn off the request log.
+    """
+    handler = make_handler(service, b_quiet)
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, handler)
+        print(f"Serving on {socket_path}")
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        print(f"Serving on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
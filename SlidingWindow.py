@@ -0,0 +1,164 @@
+import numpy as np
+
+from Alignment import base_counts, bounded_distances, feasible_partners, max_edit_distances
+from GRMhor import FamilySets, family_columns, grm_frequencies
+
+
+def window_starts(no, window, step):
+    """
+    Returns the first monomer of every window; the last window is aligned with the end of the array.
+
+    Parameters:
+    - no: int - The number of monomers.
+    - window: int - The number of monomers in a window.
+    - step: int - The number of monomers between the starts of consecutive windows.
+
+    Returns:
+    - List[int] - The window starts.
+    """
+    starts = list(range(0, max(no - window, 0) + 1, step))
+    if starts[-1] + window < no:
+        starts.append(no - window)
+    return starts
+
+
+def sliding_windows(monomers, limits, window=2000, step=500, grm_step=1, max_period=60):
+    """
+    Analyzes the local HOR structure of a long monomer array window by window, incrementally.
+
+    A monomer is aligned, with a bounded edlib alignment, only against the monomers already in the window it enters,
+    so every pair is aligned once whatever the overlap of the windows. The family edges of each monomer are kept
+    while its partners are in the window; the families and the GRM labels of a window are rebuilt from these edges
+    (exactly as find_families, join_families_v03 and hor_layout would on the window alone), and the GRM histogram
+    in linear time from the labels.
+
+    Parameters:
+    - monomers: MonomerStore - The monomers to analyze.
+    - limits: List[float] - The divergence limits of the families.
+    - window: int - The number of monomers in a window.
+    - step: int - The number of monomers between the starts of consecutive windows.
+    - grm_step: int - Number of consecutive family labels compared by the GRM.
+    - max_period: int - The largest period counted in the GRM frequencies.
+
+    Returns:
+    - Iterator[dict] - One result per window with the keys 'start' and 'end' (monomer indices), 'first_pos' and
+      'last_pos' (bp), and 'limits', mapping each limit to the window's 'families' (number of families with more
+      than one member), 'labels' (GRM series) and 'freq' (GRM frequencies).
+    """
+    no = len(monomers)
+    if no == 0:
+        return
+    seqs = monomers.sequences()
+    lengths = monomers.seq_lengths()
+    counts = base_counts(monomers.seq_data, monomers.seq_offsets)
+    max_eds = max_edit_distances(lengths, max(limits))
+    partners = [[] for _ in range(no)]
+    no_aligned = 0
+    entered = 0
+    left = 0
+    for start in window_starts(no, window, step):
+        end = min(start + window, no)
+        # Monomers that left the window are never needed again.
+        for j in range(left, start):
+            partners[j] = []
+        left = start
+        for j in range(entered, end):
+            # Divergences are relative to the earlier monomer, as in find_families.
+            earlier = feasible_partners(lengths, counts, j, np.arange(start, j), max_eds[start: j])
+            distances = bounded_distances(seqs[j], [seqs[i] for i in earlier.tolist()], max_eds[earlier])
+            no_aligned += len(earlier)
+            for i, distance in zip(earlier.tolist(), distances):
+                if distance >= 0:
+                    partners[j].append((i, distance / int(lengths[i]) * 100))
+        entered = max(entered, end)
+
+        result = {'start': start, 'end': end, 'first_pos': int(monomers.pos[start]),
+                  'last_pos': int(monomers.pos[end - 1]), 'limits': {}}
+        for limit in limits:
+            families = window_families(partners, start, end, limit)
+            labels = window_labels(families)
+            freq, _ = grm_frequencies(labels, grm_step, max_period)
+            result['limits'][limit] = {'families': sum(len(family) > 1 for family in families),
+                                       'labels': labels, 'freq': freq}
+        yield result
+    print(f"Aligned {no_aligned} pairs")
+
+
+def window_families(partners, start, end, limit):
+    """
+    Returns the merged families of a window from the family edges of its monomers.
+
+    Like find_families, every monomer but the last is a member of its own family.
+
+    Parameters:
+    - partners: List[List[tuple]] - For every monomer j, the earlier monomers i and the divergence of the pair i-j.
+    - start: int - The first monomer of the window.
+    - end: int - The monomer after the last one of the window.
+    - limit: float - The divergence limit of the families.
+
+    Returns:
+    - List[List[int]] - The family of every monomer of the window, in window indices.
+    """
+    family_sets = FamilySets(end - start)
+    for k in range(end - start - 1):
+        family_sets.add(k, k)
+    for j in range(start, end):
+        for i, edp in partners[j]:
+            if i >= start and edp < limit:
+                family_sets.add(i - start, j - start)
+    return family_sets.families()
+
+
+def window_labels(families):
+    """
+    Returns the GRM series of a window: the HOR scheme column of every monomer, as in hor_layout.
+
+    Parameters:
+    - families: List[List[int]] - The family of every monomer of the window.
+
+    Returns:
+    - List[int] - The column of every monomer.
+    """
+    offsets = np.zeros(len(families) + 1, dtype=np.int64)
+    np.cumsum([len(family) for family in families], out=offsets[1:])
+    members = np.fromiter((j for family in families for j in family), dtype=np.int64, count=int(offsets[-1]))
+    col = np.full(len(families), -1, dtype=np.int64)
+    members, columns = family_columns(offsets, members)
+    col[members] = columns
+    if col[-1] < col[0]:
+        col[-1] = np.count_nonzero(np.diff(offsets))
+    return col.tolist()
+
+
+def write_window_tracks(file_names, windows):
+    """
+    Writes the per-window GRM profile of every limit as a tab-separated track, streaming the windows.
+
+    Every line holds the window bounds (monomer indices and bp), the number of families with more than one member,
+    the most frequent period and the GRM frequency of every period from 1 to max_period.
+
+    Parameters:
+    - file_names: dict - The output file of every divergence limit.
+    - windows: Iterator[dict] - The window results of sliding_windows.
+
+    Returns:
+    - int - The number of windows written.
+    """
+    files = {limit: open(file_name, "w") for limit, file_name in file_names.items()}
+    no_windows = 0
+    try:
+        for result in windows:
+            for limit, fp in files.items():
+                freq = result['limits'][limit]['freq']
+                if no_windows == 0:
+                    periods = "\t".join(f"p{period}" for period in range(1, len(freq)))
+                    fp.write(f"start\tend\tfirst_pos\tlast_pos\tfamilies\ttop_period\t{periods}\n")
+                top_period = int(np.argmax(freq)) if freq.any() else 0
+                fp.write(f"{result['start']}\t{result['end']}\t{result['first_pos']}\t{result['last_pos']}\t"
+                         f"{result['limits'][limit]['families']}\t{top_period}\t"
+                         + "\t".join(map(str, freq[1:].tolist())) + "\n")
+            no_windows += 1
+    finally:
+        for fp in files.values():
+            fp.close()
+    return no_windows
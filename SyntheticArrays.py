@@ -0,0 +1,129 @@
+import edlib
+import numpy as np
+
+from MonFinder import ALPHA_CONSENSUS
+from MonomerStore import MonomerStore
+
+ARRAY_KINDS = ('canonical', 'variant', 'cascading', 'random')
+BASES = np.frombuffer(b"ACGT", dtype=np.uint8)
+
+
+def synthetic_array(kind, no_monomers, hor_length=10, divergence=1.0, family_divergence=16.0, seed=0):
+    """
+    Generates a synthetic monomer array modelled on the four case studies in data/.
+
+    Every family has a prototype derived from the alpha satellite consensus with family_divergence percent of
+    substitutions and deletions, and every monomer is a copy of its family prototype with divergence percent of
+    them. The family order follows the kind of array:
+    - 'canonical': a HOR of hor_length families repeated head to tail (case study 1);
+    - 'variant': canonical HOR copies, every other one missing the two families before its last (case study 2);
+    - 'cascading': HOR copies in which the second family appears twice (case study 3);
+    - 'random': families drawn uniformly at random (case study 4).
+
+    Parameters:
+    - kind: str - One of ARRAY_KINDS.
+    - no_monomers: int - The number of monomers.
+    - hor_length: int - The number of families of the HOR.
+    - divergence: float - Percentage of mutated bases of a monomer relative to its family prototype.
+    - family_divergence: float - Percentage of mutated bases of a family prototype relative to the consensus.
+    - seed: int - Seed of the random generator, fixed for reproducible arrays.
+
+    Returns:
+    - tuple: The monomers (MonomerStore, positions in the returned sequence, div set to the divergence of the
+      family prototype from the consensus) and the genomic sequence containing them, with random flanks.
+    """
+    rng = np.random.default_rng(seed)
+    consensus = np.frombuffer(ALPHA_CONSENSUS.encode('latin-1'), dtype=np.uint8)
+    prototypes, prototype_offsets = mutate(np.tile(consensus, (hor_length, 1)), family_divergence, rng)
+    families = family_order(kind, no_monomers, hor_length, rng)
+
+    copies = np.empty((no_monomers, len(consensus)), dtype=np.uint8)
+    prototype_lengths = np.diff(prototype_offsets)
+    copies[:] = BASES[0]
+    for family in range(hor_length):
+        copies[families == family, :prototype_lengths[family]] = \
+            prototypes[prototype_offsets[family]: prototype_offsets[family + 1]]
+    seq_data, seq_offsets = mutate(copies, divergence, rng, prototype_lengths[families])
+
+    flank = 500
+    pos = flank + seq_offsets[:-1]
+    monomers = MonomerStore(pos, np.diff(pos, prepend=0), np.zeros(no_monomers), np.zeros(no_monomers),
+                            np.full(no_monomers, 'd'), seq_data, seq_offsets)
+    prototype_div = np.array([edlib.align(ALPHA_CONSENSUS, prototypes[prototype_offsets[family]:
+                                                                      prototype_offsets[family + 1]].tobytes()
+                                          )["editDistance"] / len(consensus) * 100 for family in range(hor_length)])
+    monomers.div = np.round(prototype_div[families], 2)
+    sequence = np.concatenate((rng.choice(BASES, flank), seq_data, rng.choice(BASES, flank)))
+    return monomers, sequence.tobytes().decode('latin-1')
+
+
+def family_order(kind, no_monomers, hor_length, rng):
+    """
+    Returns the family of every monomer of a synthetic array of the given kind (see synthetic_array).
+    """
+    hor = np.arange(hor_length)
+    if kind == 'canonical':
+        units = [hor]
+    elif kind == 'variant':
+        cut = max(hor_length - 3, 1)
+        units = [hor, np.concatenate((hor[:cut], hor[-1:]))]
+    elif kind == 'cascading':
+        units = [np.insert(hor, min(6, hor_length), 1)]
+    elif kind == 'random':
+        return rng.integers(0, hor_length, no_monomers)
+    else:
+        raise ValueError(f"Unknown array kind: {kind}")
+    cycle = np.concatenate(units)
+    return np.resize(cycle, no_monomers)
+
+
+def mutate(sequences, divergence, rng, lengths=None, chunk_size=1 << 16):
+    """
+    Applies random substitutions and deletions to a batch of equally long sequences.
+
+    Parameters:
+    - sequences: np.ndarray - The (n, length) uint8 sequences.
+    - divergence: float - Percentage of mutated bases; one mutation in ten is a deletion.
+    - rng: np.random.Generator - The random generator.
+    - lengths: np.ndarray - Optional number of valid bases of every row (the rest is ignored).
+    - chunk_size: int - Number of rows mutated at once, bounding the memory used.
+
+    Returns:
+    - tuple: The concatenated mutated sequences (uint8) and their offsets.
+    """
+    n, length = sequences.shape
+    rate = divergence / 100
+    codes = np.zeros(256, dtype=np.uint8)
+    codes[BASES] = np.arange(4)
+    data, counts = [], []
+    for start in range(0, n, chunk_size):
+        rows = sequences[start: start + chunk_size]
+        draw = rng.random(rows.shape, dtype=np.float32)
+        substitute = draw < 0.9 * rate
+        shift = rng.integers(1, 4, rows.shape, dtype=np.uint8)
+        mutated = np.where(substitute, BASES[(codes[rows] + shift) % 4], rows)
+        keep = (draw >= rate) | substitute
+        if lengths is not None:
+            keep &= np.arange(length) < np.asarray(lengths[start: start + chunk_size])[:, None]
+        data.append(mutated[keep])
+        counts.append(keep.sum(axis=1))
+    offsets = np.zeros(n + 1, dtype=np.int64)
+    if n:
+        np.cumsum(np.concatenate(counts), out=offsets[1:])
+    return (np.concatenate(data) if data else np.empty(0, dtype=np.uint8)), offsets
+
+
+def write_fasta_file(file_name, name, sequence, width=60):
+    """
+    Writes a single-record FASTA file.
+
+    Parameters:
+    - file_name: str - The path to the output file.
+    - name: str - The record name.
+    - sequence: str - The sequence.
+    - width: int - The number of bases per line.
+    """
+    with open(file_name, "w") as fp:
+        fp.write(f">{name}\n")
+        for start in range(0, len(sequence), width):
+            fp.write(sequence[start: start + width] + "\n")
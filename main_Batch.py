@@ -0,0 +1,69 @@
+import argparse
+import sys
+import time
+from Batch import run_batch
+from MonFinder import ALPHA_CONSENSUS, load_consensuses
+
+
+def main(manifest_file, out_dir, processes=1, limits=None, pruning='exact', clustering='all-pairs', step=1, pmax=60,
+         b_draw=False, out_format='ps', consensus_file=None, b_quiet=False):
+    """
+    Runs MonFinder and GRMhor on every input of a manifest, resuming from the checkpoints of a previous run.
+
+    Parameters:
+    - manifest_file: str - Path to the manifest: one FASTA or monomers file per line, optionally followed by a
+      tab and a job name.
+    - out_dir: str - Directory receiving the checkpoints, the diagrams and summary.tsv.
+    - processes: int - Number of worker processes.
+    - limits: List[float] - Divergence limits of the family detection (default [5]).
+    - pruning: str - Candidate pruning mode of find_families ('exact', 'minhash' or None).
+    - clustering: str - Family detection: 'all-pairs' or 'representative'.
+    - step: int - Number of consecutive monomers compared by the GRM.
+    - pmax: int - The largest period of the GRM.
+    - b_draw: bool - Flag to draw the HOR scheme and the GRM/MDD diagrams of every record.
+    - out_format: str - Format of the HOR scheme.
+    - consensus_file: str - Optional FASTA file of the consensuses searched for in the FASTA inputs.
+    - b_quiet: bool - Flag to turn off the progress messages.
+
+    Returns:
+    - int - The number of failed tasks.
+    """
+    start_time = time.time()
+    monomer_cons = load_consensuses(consensus_file) if consensus_file else ALPHA_CONSENSUS
+    summary, failed = run_batch(manifest_file, out_dir, limits or [5], monomer_cons, processes, pruning, clustering,
+                                step, pmax, b_draw, out_format, b_quiet)
+    print(f"{len(summary)} annotations written to {out_dir}/summary.tsv, {len(failed)} failed tasks")
+    for job, record, stage, error in failed:
+        print(f"  {job}/{record or ''} {stage}: {error}")
+    print(f"--- {time.time() - start_time} seconds ---")
+    return len(failed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Runs MonFinder and GRMhor over the inputs of a manifest, with resumable checkpoints')
+    parser.add_argument('manifest_file', help='Manifest: one FASTA or .mon file per line, optionally a tab and a name')
+    parser.add_argument('out_dir', help='Directory of the checkpoints and results')
+    parser.add_argument('--processes', type=int, default=1, help='Number of worker processes (default=1)')
+    parser.add_argument('--limits', type=lambda text: [float(limit) for limit in text.split(',')], default=[5],
+                        help='Comma-separated divergence limits in percent, e.g. 2,3,5,8 (default=5)')
+    parser.add_argument('--pruning', choices=['exact', 'minhash', 'none'], default='exact',
+                        help='Pair pruning before alignment: exact q-gram filter, approximate MinHash or none')
+    parser.add_argument('--clustering', choices=['all-pairs', 'representative'], default='all-pairs',
+                        help='Family detection: every pair under the limit (exact) or comparison with family '
+                             'representatives only (faster, families may differ)')
+    parser.add_argument('--step', type=int, default=1,
+                        help='Number of consecutive monomers compared by the GRM (default=1)')
+    parser.add_argument('--pmax', type=int, default=60, help='Maximum period of the GRM (default=60)')
+    parser.add_argument('--draw', action='store_true', default=False,
+                        help='Draw the HOR scheme and the GRM/MDD diagrams of every record')
+    parser.add_argument('--format', choices=['ps', 'svg', 'pdf', 'png', 'tiles'], default='ps',
+                        help='Format of the HOR scheme (default=ps)')
+    parser.add_argument('--consensus', default=None,
+                        help='FASTA file of the consensuses to search for (default: alpha satellite consensus)')
+    parser.add_argument('--quiet', action='store_true', default=False, help='Do not print the progress messages')
+    args = parser.parse_args()
+
+    sys.exit(1 if main(args.manifest_file, args.out_dir, args.processes, args.limits,
+                       None if args.pruning == 'none' else args.pruning, args.clustering, args.step, args.pmax,
+                       args.draw, args.format, args.consensus, args.quiet) else 0)
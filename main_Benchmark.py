@@ -0,0 +1,185 @@
+import argparse
+import contextlib
+import copy
+import io
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+from GRMhor import draw_grm_and_mdd, draw_hor_structure, find_families, grm, hor_layout, join_families_v03
+from MonFinder import find_record_monomers, write_monomers_file
+from SyntheticArrays import ARRAY_KINDS, synthetic_array, write_fasta_file
+
+STAGES = ('find_monomers', 'find_families', 'join_families', 'grm', 'hor_scheme', 'grm_mdd')
+
+
+def run_stages(kind, size, stages, out_dir, max_family_size, b_memory=True):
+    """
+    Generates a synthetic array and measures the time and peak memory of every stage on it.
+
+    Each stage is timed on its own; when b_memory is set it is then run a second time under tracemalloc for its
+    peak memory, so the tracing overhead does not distort the times. The stages set the families and columns of
+    the monomers, so the second run works on a copy of the monomers as they were before the timed run.
+
+    Parameters:
+    - kind: str - The kind of synthetic array (see SyntheticArrays.ARRAY_KINDS).
+    - size: int - The number of monomers.
+    - stages: List[str] - The stages to run, in pipeline order.
+    - out_dir: str - Directory for the generated inputs and the drawings.
+    - max_family_size: int - Arrays above this size skip find_families and join_families (quadratic stages).
+    - b_memory: bool - Flag to measure the peak memory.
+
+    Returns:
+    - dict - For every stage, its 'seconds' and 'peak_mb', or 'skipped'.
+    """
+    monomers, sequence = synthetic_array(kind, size)
+    base_name = os.path.join(out_dir, f"{kind}_{size}")
+    write_fasta_file(f"{base_name}.fa", f"{kind}_{size}", sequence)
+    write_monomers_file(f"{base_name}.mon", monomers)
+    state = {}
+
+    def find_families_stage(monomers):
+        find_families(monomers, 5)
+
+    def grm_stage(monomers):
+        state['series'] = hor_layout(monomers)['x']
+        grm(state['series'], monomers)
+
+    actions = {
+        'find_monomers': lambda monomers: find_record_monomers(sequence),
+        'find_families': find_families_stage,
+        'join_families': lambda monomers: join_families_v03(monomers),
+        'grm': grm_stage,
+        'hor_scheme': lambda monomers: draw_hor_structure(monomers, base_name, False, False, False, False, 1,
+                                                          out_format='png'),
+        'grm_mdd': lambda monomers: draw_grm_and_mdd(state.get('series') or hor_layout(monomers)['x'], monomers,
+                                                     base_name, False, 60, 60, 2000, 5),
+    }
+    results = {}
+    for stage in stages:
+        if stage in ('find_families', 'join_families') and size > max_family_size:
+            results[stage] = {'skipped': True}
+            continue
+        with contextlib.redirect_stdout(io.StringIO()):
+            before = copy.deepcopy(monomers) if b_memory else None
+            start = time.perf_counter()
+            actions[stage](monomers)
+            results[stage] = {'seconds': round(time.perf_counter() - start, 4)}
+            if b_memory:
+                tracemalloc.start()
+                actions[stage](before)
+                results[stage]['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 2)
+                tracemalloc.stop()
+    return results
+
+
+def compare(results, baseline, tolerance, min_seconds=0.05):
+    """
+    Compares benchmark results with a stored baseline.
+
+    Parameters:
+    - results: dict - The results, keyed by '<kind>:<size>' and stage.
+    - baseline: dict - The baseline results, in the same layout.
+    - tolerance: float - Largest accepted ratio of time or peak memory to the baseline.
+    - min_seconds: float - Stages faster than this in both runs are not checked for time, being dominated by noise.
+
+    Returns:
+    - List[str] - A description of every regression.
+    """
+    regressions = []
+    for case, stages in results.items():
+        for stage, result in stages.items():
+            reference = baseline.get(case, {}).get(stage)
+            if not reference or 'skipped' in result or 'skipped' in reference:
+                continue
+            seconds = result['seconds'] / max(reference['seconds'], 1e-9)
+            if max(result['seconds'], reference['seconds']) >= min_seconds and seconds > tolerance:
+                regressions.append(f"{case} {stage}: {result['seconds']:.3f} s vs {reference['seconds']:.3f} s "
+                                   f"({seconds:.2f}x)")
+            if 'peak_mb' in result and 'peak_mb' in reference and result['peak_mb'] >= 1 and \
+                    result['peak_mb'] > tolerance * reference['peak_mb']:
+                regressions.append(f"{case} {stage}: {result['peak_mb']:.1f} MB vs {reference['peak_mb']:.1f} MB")
+    return regressions
+
+
+def main(sizes, kinds, stages, baseline_file, b_update, tolerance, max_family_size, b_memory=True, out_dir=None):
+    """
+    Runs the benchmark on synthetic arrays and checks the results against the stored baseline.
+
+    Parameters:
+    - sizes: List[int] - The array sizes (number of monomers).
+    - kinds: List[str] - The kinds of synthetic array.
+    - stages: List[str] - The stages to measure.
+    - baseline_file: str - Path of the JSON baseline.
+    - b_update: bool - Flag to store the results as the new baseline instead of checking them.
+    - tolerance: float - Largest accepted ratio to the baseline.
+    - max_family_size: int - Largest array on which the quadratic family stages are run.
+    - b_memory: bool - Flag to measure the peak memory of every stage.
+    - out_dir: str - Directory for the generated inputs and drawings (default: a temporary directory).
+
+    Returns:
+    - int - The exit status: 1 if a regression was found, 0 otherwise.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in sizes:
+            for kind in kinds:
+                case = f"{kind}:{size}"
+                results[case] = run_stages(kind, size, stages, out_dir or tmp_dir, max_family_size, b_memory)
+                cells = [f"{stage}={result['seconds']:.3f}s" + (f"/{result['peak_mb']:.1f}MB"
+                                                                  if 'peak_mb' in result else "")
+                         for stage, result in results[case].items() if 'skipped' not in result]
+                print(f"{case:>20} " + " ".join(cells))
+
+    if b_update:
+        baseline = {}
+        if os.path.exists(baseline_file):
+            with open(baseline_file) as file:
+                baseline = json.load(file)['results']
+        baseline.update(results)
+        os.makedirs(os.path.dirname(baseline_file) or ".", exist_ok=True)
+        with open(baseline_file, "w") as file:
+            json.dump({'machine': platform.platform(), 'python': platform.python_version(), 'cpus': os.cpu_count(),
+                       'results': baseline}, file, indent=1, sort_keys=True)
+        print(f"Baseline written to {baseline_file}")
+        return 0
+
+    if not os.path.exists(baseline_file):
+        print(f"No baseline at {baseline_file}; run with --update to create it")
+        return 0
+    with open(baseline_file) as file:
+        stored = json.load(file)
+    regressions = compare(results, stored['results'], tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    print(f"{len(regressions)} regressions against the baseline of {stored['machine']}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark of MonFinder and GRMhor on synthetic HOR arrays')
+    parser.add_argument('--sizes', type=lambda text: [int(float(size)) for size in text.split(',')],
+                        default=[1000, 3000], help='Comma-separated array sizes, e.g. 1e3,1e4,1e5 (default=1000,3000)')
+    parser.add_argument('--kinds', type=lambda text: text.split(','), default=list(ARRAY_KINDS),
+                        help='Comma-separated array kinds (default: all of ' + ", ".join(ARRAY_KINDS) + ')')
+    parser.add_argument('--stages', type=lambda text: text.split(','), default=list(STAGES),
+                        help='Comma-separated stages (default: all of ' + ", ".join(STAGES) + ')')
+    parser.add_argument('--baseline', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                           'benchmarks', 'baseline.json'),
+                        help='JSON file with the stored baseline (default=benchmarks/baseline.json)')
+    parser.add_argument('--update', action='store_true', default=False,
+                        help='Store the results as the new baseline instead of comparing with it')
+    parser.add_argument('--tolerance', type=float, default=1.5,
+                        help='Largest accepted ratio of time or memory to the baseline (default=1.5)')
+    parser.add_argument('--max-family-size', type=int, default=20000,
+                        help='Largest array on which find_families and join_families are run (default=20000)')
+    parser.add_argument('--no-memory', action='store_true', default=False,
+                        help='Skip the peak memory measurement (halves the run time)')
+    parser.add_argument('--out-dir', default=None,
+                        help='Keep the generated FASTA, .mon and drawings in this directory')
+    args = parser.parse_args()
+
+    raise SystemExit(main(args.sizes, args.kinds, args.stages, args.baseline, args.update, args.tolerance,
+                          args.max_family_size, not args.no_memory, args.out_dir))
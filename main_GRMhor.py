@@ -1,40 +1,140 @@
-import argparse
-import time
-from GRMhor import read_monomers_file,find_families,join_families_v03,draw_hor_structure,draw_grm_and_mdd
-def main(input_file, start=None, pmax=None, horpos=None):
-    """
-    The main function to process the input file and generate visualization of monomers and their structures.
-
-    Parameters:
-    - input_file: str - Path to the input file containing monomer data.
-    - start: int - Starting index for processing monomers.
-    - pmax: int - Maximum period to be considered for analysis.
-    - horpos: bool - Flag to include position of the first monomer in the HOR in the output.
-    """
-    start_time = time.time()
-
-    monomers = read_monomers_file(input_file, start)
-    print(f"{input_file} -> No monomers = {len(monomers)}")
-
-    find_families(monomers, 5)
-    join_families_v03(monomers)
-
-    series = draw_hor_structure(monomers, input_file, b_numbers=False, b_position_marks_blocks=False,
-                                b_mers_marks=False, b_alpha_positions=horpos, f_cube_proportions=1)
-    draw_grm_and_mdd(series, monomers, input_file, b_block_lines=False, xmax=pmax, ymax=pmax, xtics_period=2000,
-                     ytics_period=5)
-
-    print(f"--- {time.time() - start_time} seconds ---")
-
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(
-        description='GRMhor: a tool for automatic annotation of genome monomer higher order structure')
-    parser.add_argument('input_file', help='Required input file name')
-    parser.add_argument('--start', type=int, default=0, help='Starting monomer in the sequence (default=0)')
-    parser.add_argument('--pmax', type=int, default=60, help='Maximum value of the displayed period')
-    parser.add_argument('--horpos', action='store_true', default=False,
-                        help='Prints the position of the first monomer in the HOR')
-    args = parser.parse_args()
-
-    main(args.input_file, args.start, args.pmax, args.horpos)
-
+import argparse
+import os
+import time
+import numpy as np
+from DistanceCache import DistanceCache
+from Metrics import Metrics, set_metrics
+from GRMhor import read_monomers_file,detect_families,apply_families,draw_hor_structure,draw_grm_and_mdd,analysis_arrays
+from HORunits import hor_units, write_hor_units_tsv, write_hor_units_bed
+from SlidingWindow import sliding_windows, write_window_tracks
+def main(input_file, start=None, pmax=None, horpos=None, pruning='exact', processes=1, step=1, cache_file=None,
+         limits=None, out_format='ps', mdd_mode='auto', end=None, region=None, window=None, window_step=None,
+         metrics_file=None, b_quiet=False, clustering='all-pairs', b_analysis_only=False, b_hor_units=False, chrom=None):
+    """
+    The main function to process the input file and generate visualization of monomers and their structures.
+
+    Parameters:
+    - input_file: str - Path to the input file containing monomer data.
+    - start: int - Starting index for processing monomers.
+    - pmax: int - Maximum period to be considered for analysis.
+    - horpos: bool - Flag to include position of the first monomer in the HOR in the output.
+    - pruning: str - Candidate pruning mode of find_families ('exact', 'minhash' or None).
+    - processes: int - Number of worker processes for the family detection.
+    - step: int - Number of consecutive monomers compared by the GRM (k-mer length).
+    - cache_file: str - Path of the persistent pairwise distance cache (None disables it).
+    - limits: List[float] - Divergence limits of the family detection (default [5]); with several limits the
+      distances are computed once and the outputs of each limit get an .L<limit> suffix.
+    - out_format: str - Format of the HOR scheme ('ps', 'svg', 'pdf', 'png' or 'tiles').
+    - mdd_mode: str - Rendering of the MDD diagram ('auto', 'points' or 'density').
+    - end: int - Index after the last monomer to process (None processes to the end of the file).
+    - region: tuple - Optional (first, last) genomic positions in bp of the monomers to process.
+    - window: int - Number of monomers of a sliding window; when set, the per-window GRM profile is written to
+      <input>.windows.tsv instead of the whole-array diagrams.
+    - window_step: int - Number of monomers between consecutive windows (default window // 4).
+    - metrics_file: str - Optional JSON (or .csv) file receiving the per-stage metrics of the run.
+    - b_quiet: bool - Flag to turn off the progress messages.
+    - clustering: str - Family detection: 'all-pairs' (exact) or 'representative' (faster, see
+      find_representative_families).
+    - b_analysis_only: bool - Flag to write the families, the HOR columns and the GRM/MDD data of every limit to
+      <input>.GRM.npz (see analysis_arrays) instead of drawing the diagrams.
+    - b_hor_units: bool - Flag to write the HOR copies of every limit to <input>.HORunits.tsv and <input>.HORunits.bed
+      (see hor_units).
+    - chrom: str - Chromosome name of the BED track (default: the input file name up to its first dot).
+    """
+    start_time = time.time()
+    metrics = Metrics(b_quiet)
+    set_metrics(metrics)
+
+    monomers = read_monomers_file(input_file, start, end, region)
+    print(f"{input_file} -> No monomers = {len(monomers)}")
+
+    limits = limits or [5]
+    if window:
+        suffix = {limit: "" if len(limits) == 1 else f".L{limit:g}" for limit in limits}
+        windows = sliding_windows(monomers, limits, window, window_step or max(window // 4, 1), step, pmax)
+        no_windows = write_window_tracks({limit: f"{input_file}{suffix[limit]}.windows.tsv" for limit in limits},
+                                         windows)
+        print(f"{no_windows} windows of {window} monomers")
+        if metrics_file:
+            metrics.write(metrics_file)
+        print(f"--- {time.time() - start_time} seconds ---")
+        return
+
+    cache = DistanceCache(cache_file) if cache_file else None
+    families_of_limit = detect_families(monomers, limits, pruning, processes, cache, clustering)
+    if cache is not None:
+        cache.close()
+
+    for limit, families in families_of_limit.items():
+        apply_families(monomers, families)
+        out_name = input_file if len(limits) == 1 else f"{input_file}.L{limit:g}"
+        if b_analysis_only:
+            arrays = analysis_arrays(monomers, step, pmax)
+            np.savez_compressed(f"{out_name}.GRM.npz", **arrays)
+            series = arrays['labels']
+        else:
+            series = draw_hor_structure(monomers, out_name, b_numbers=False, b_position_marks_blocks=False,
+                                        b_mers_marks=False, b_alpha_positions=horpos, f_cube_proportions=1,
+                                        out_format=out_format)
+            draw_grm_and_mdd(series, monomers, out_name, b_block_lines=False, xmax=pmax, ymax=pmax,
+                             xtics_period=2000, ytics_period=5, step=step, mdd_mode=mdd_mode)
+        if b_hor_units:
+            units = hor_units(series, monomers, pmax)
+            write_hor_units_tsv(f"{out_name}.HORunits.tsv", units)
+            write_hor_units_bed(f"{out_name}.HORunits.bed", units,
+                                chrom or os.path.basename(input_file).split('.')[0])
+            print(f"{len(units['start'])} HOR copies, canonical HOR of {len(units['canonical'])} monomers")
+
+    if metrics_file:
+        metrics.write(metrics_file)
+    print(f"--- {time.time() - start_time} seconds ---")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='GRMhor: a tool for automatic annotation of genome monomer higher order structure')
+    parser.add_argument('input_file', help='Required input file name')
+    parser.add_argument('--start', type=int, default=0, help='Starting monomer in the sequence (default=0)')
+    parser.add_argument('--end', type=int, default=None,
+                        help='Monomer after the last one to process (default: end of the file)')
+    parser.add_argument('--region', type=lambda text: tuple(int(p) for p in text.replace(',', '').split('-')),
+                        default=None, help='Genomic interval FIRST-LAST in bp of the monomers to process')
+    parser.add_argument('--pmax', type=int, default=60, help='Maximum value of the displayed period')
+    parser.add_argument('--horpos', action='store_true', default=False,
+                        help='Prints the position of the first monomer in the HOR')
+    parser.add_argument('--pruning', choices=['exact', 'minhash', 'none'], default='exact',
+                        help='Pair pruning before alignment: exact q-gram filter, approximate MinHash or none')
+    parser.add_argument('--clustering', choices=['all-pairs', 'representative'], default='all-pairs',
+                        help='Family detection: every pair under the limit (exact) or comparison with family '
+                             'representatives only (faster, families may differ)')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Number of worker processes for the family detection (default=1)')
+    parser.add_argument('--step', type=int, default=1,
+                        help='Number of consecutive monomers compared by the GRM (default=1)')
+    parser.add_argument('--cache', default=None,
+                        help='SQLite file caching pairwise distances between runs (default: no cache)')
+    parser.add_argument('--limits', type=lambda text: [float(limit) for limit in text.split(',')], default=[5],
+                        help='Comma-separated divergence limits in percent, e.g. 2,3,5,8 (default=5)')
+    parser.add_argument('--format', choices=['ps', 'svg', 'pdf', 'png', 'tiles'], default='ps',
+                        help='Format of the HOR scheme (default=ps)')
+    parser.add_argument('--mdd', choices=['auto', 'points', 'density'], default='auto',
+                        help='MDD rendering: every point, a binned density raster, or density for large arrays only')
+    parser.add_argument('--window', type=int, default=None,
+                        help='Analyze sliding windows of this many monomers and write a per-window GRM track')
+    parser.add_argument('--window-step', type=int, default=None,
+                        help='Monomers between consecutive windows (default: a quarter of the window)')
+    parser.add_argument('--analysis-only', action='store_true', default=False,
+                        help='Write the families, HOR columns and GRM/MDD data to <input>.GRM.npz without drawing')
+    parser.add_argument('--hor-units', action='store_true', default=False,
+                        help='Write the HOR copies to <input>.HORunits.tsv and a BED track to <input>.HORunits.bed')
+    parser.add_argument('--chrom', default=None,
+                        help='Chromosome name of the BED track (default: the input file name up to its first dot)')
+    parser.add_argument('--metrics', default=None,
+                        help='Write per-stage time, memory and counters to this JSON file (CSV if it ends in .csv)')
+    parser.add_argument('--quiet', action='store_true', default=False, help='Do not print the progress messages')
+    args = parser.parse_args()
+
+    main(args.input_file, args.start, args.pmax, args.horpos, None if args.pruning == 'none' else args.pruning,
+         args.processes, args.step, args.cache, args.limits, args.format, args.mdd, args.end, args.region,
+         args.window, args.window_step, args.metrics, args.quiet, args.clustering,
+         args.analysis_only, args.hor_units, args.chrom)
+
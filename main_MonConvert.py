@@ -0,0 +1,31 @@
+import argparse
+from GRMhor import read_monomers_file
+from MonFinder import write_monomers_file
+from MonomerStore import is_binary_monomers_file, write_binary_monomers
+
+
+def main(input_file, output_file):
+    """
+    Converts a monomers file between the text format written by MonFinder and the binary, memory-mappable format.
+    The direction follows the format of the input file.
+
+    Parameters:
+    - input_file: str - Path to the text or binary .mon file to convert.
+    - output_file: str - Path of the converted file.
+    """
+    b_binary = is_binary_monomers_file(input_file)
+    monomers = read_monomers_file(input_file, 0)
+    if b_binary:
+        write_monomers_file(output_file, monomers)
+    else:
+        write_binary_monomers(output_file, monomers)
+    print(f"{input_file} -> {output_file}: {len(monomers)} monomers, {'text' if b_binary else 'binary'}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Converts monomers files between the text and the binary format')
+    parser.add_argument('input_file', help='Text or binary .mon file')
+    parser.add_argument('output_file', help='Converted file')
+    args = parser.parse_args()
+
+    main(args.input_file, args.output_file)
@@ -1,33 +1,58 @@
-import sys
-import time
-from MonFinder import read_fasta_file, analyse_chromosome, find_monomers, join_direct_and_reverse_complement, write_monomers_file
-
-
-def main():
-    """
-    The main function to execute the monomer finding process.
-    """
-    start_time = time.time()
-
-    if len(sys.argv) != 2:
-        print("Usage: python3 MonFinder.py path_to_file")
-        sys.exit(1)
-
-    file_name = sys.argv[1]
-    monomer_cons = "TCAGAAACTTCTTTGTGATGTGTGCATTCAACTCACAGAGTTGAACCTTCCTTTTGATAGAGCAGTTTTGAAACACTCTTTTTGTAGAATCTGCAAGTGGATATTTGGAGCGCTTTGAGGCCTTCGGTGGAAAAGGAAATATCTTCACATAAAAACTAGACAGAAGCATTC"
-
-    name, seq = read_fasta_file(file_name)
-    analyse_chromosome(seq)
-
-    print("Searching for monomers in direct orientation")
-    monomers_d = find_monomers(seq, monomer_cons, 'd')
-    print("Searching for monomers in reverse complement orientation")
-    monomers_r = find_monomers(seq, monomer_cons, 'r')
-    monomers = join_direct_and_reverse_complement(monomers_d, monomers_r)
-    write_monomers_file(f"{file_name.split('.', 1)[0]}.mon", monomers)
-
-    print(f"--- {time.time() - start_time} seconds ---")
-
-
-if __name__ == "__main__":
-    main()
+import argparse
+import os
+import time
+from Metrics import Metrics, set_metrics
+from MonFinder import ALPHA_CONSENSUS, iter_fasta_records, analyse_chromosome, find_record_monomers, \
+    load_consensuses, write_monomers_file
+from Pipeline import record_file_name
+
+
+def main(file_name, processes=1, metrics_file=None, b_quiet=False, consensus_file=None):
+    """
+    The main function to execute the monomer finding process on every record of a FASTA file.
+
+    Parameters:
+    - file_name: str - Path to the FASTA file to search (plain or gzip/bgzip compressed).
+    - processes: int - Number of worker processes (1 searches both orientations serially).
+    - metrics_file: str - Optional JSON (or .csv) file receiving the per-stage metrics of the run.
+    - b_quiet: bool - Flag to turn off the progress messages.
+    - consensus_file: str - Optional FASTA file of the consensuses to search for in a single pass, each monomer
+      being labelled with its best-matching consensus (default: the alpha satellite consensus).
+    """
+    start_time = time.time()
+    metrics = Metrics(b_quiet)
+    set_metrics(metrics)
+    monomer_cons = load_consensuses(consensus_file) if consensus_file else ALPHA_CONSENSUS
+
+    base_name = file_name.split('.', 1)[0]
+    out_names = []
+    for name, seq in iter_fasta_records(file_name):
+        print(f"Record {name}")
+        analyse_chromosome(seq)
+        monomers = find_record_monomers(seq, monomer_cons, processes)
+        out_names.append(f"{base_name}.{record_file_name(name)}.mon")
+        write_monomers_file(out_names[-1], monomers)
+
+    # A single-record FASTA keeps the historical output name.
+    if len(out_names) == 1 and os.path.exists(out_names[0]):
+        os.replace(out_names[0], f"{base_name}.mon")
+
+    if metrics_file:
+        metrics.write(metrics_file)
+
+    print(f"--- {time.time() - start_time} seconds ---")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='MonFinder: a tool for finding monomers in a genome sequence')
+    parser.add_argument('file_name', help='Required FASTA file name')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Number of worker processes for the monomer search (default=1)')
+    parser.add_argument('--metrics', default=None,
+                        help='Write per-stage time, memory and counters to this JSON file (CSV if it ends in .csv)')
+    parser.add_argument('--quiet', action='store_true', default=False, help='Do not print the progress messages')
+    parser.add_argument('--consensus', default=None,
+                        help='FASTA file of consensus sequences searched in one pass (default: alpha satellite)')
+    args = parser.parse_args()
+
+    main(args.file_name, args.processes, args.metrics, args.quiet, args.consensus)
@@ -0,0 +1,57 @@
+import argparse
+import os
+from DistanceCache import DistanceCache
+from GRMhor import read_monomers_file
+from Metrics import Metrics, set_metrics
+from Service import MonomerArray, QueryService, serve
+
+
+def main(input_files, limit=5, host='127.0.0.1', port=8642, socket_path=None, pruning='exact', processes=1,
+         cache_file=None, b_quiet=False):
+    """
+    Loads monomer arrays, detects their families once and answers queries on them until interrupted.
+
+    Parameters:
+    - input_files: List[str] - The text or binary .mon files to load; each array is named after its file.
+    - limit: float - The divergence limit of the family detection; queries may use any lower limit.
+    - host: str - The address to listen on.
+    - port: int - The TCP port.
+    - socket_path: str - Optional Unix socket to listen on instead of TCP.
+    - pruning: str - Candidate pruning mode of find_families ('exact', 'minhash' or None).
+    - processes: int - Number of worker processes for the family detection.
+    - cache_file: str - Path of the persistent pairwise distance cache (None disables it).
+    - b_quiet: bool - Flag to turn off the progress messages and the request log.
+    """
+    set_metrics(Metrics(b_quiet))
+    cache = DistanceCache(cache_file) if cache_file else None
+    arrays = []
+    for input_file in input_files:
+        monomers = read_monomers_file(input_file, 0)
+        print(f"{input_file} -> No monomers = {len(monomers)}")
+        arrays.append(MonomerArray(os.path.basename(input_file), monomers, limit, pruning, processes, cache))
+    if cache is not None:
+        cache.close()
+    serve(QueryService(arrays), host, port, socket_path, b_quiet)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description='Keeps monomer arrays in memory and answers range, family, GRM and drawing queries over HTTP')
+    parser.add_argument('input_files', nargs='+', help='Text or binary .mon files')
+    parser.add_argument('--limit', type=float, default=5,
+                        help='Divergence limit of the family detection; queries may use lower limits (default=5)')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default=127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8642, help='TCP port (default=8642)')
+    parser.add_argument('--socket', default=None, help='Listen on this Unix socket instead of TCP')
+    parser.add_argument('--pruning', choices=['exact', 'minhash', 'none'], default='exact',
+                        help='Pair pruning before alignment: exact q-gram filter, approximate MinHash or none')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='Number of worker processes for the family detection (default=1)')
+    parser.add_argument('--cache', default=None,
+                        help='SQLite file caching pairwise distances between runs (default: no cache)')
+    parser.add_argument('--quiet', action='store_true', default=False,
+                        help='Do not print the progress messages and the request log')
+    args = parser.parse_args()
+
+    main(args.input_files, args.limit, args.host, args.port, args.socket,
+         None if args.pruning == 'none' else args.pruning, args.processes, args.cache, args.quiet)
@@ -0,0 +1,44 @@
+import numpy as np
+
+from HORunits import UNIT_KINDS, hor_units
+from MonFinder import set_back_rc_positions
+from MonomerStore import MonomerStore
+
+
+def monomer_array(labels, ort, seq_len=10000, length=170):
+    """
+    Returns monomers of the given labels laid head to tail from bp 100, with positions set as MonFinder does: the
+    left end for 'd' monomers and, for 'r' monomers, the left end on the reverse complement strand turned back by
+    set_back_rc_positions.
+    """
+    no = len(labels)
+    left = 100 + length * np.arange(no)
+    pos = np.where(np.asarray(ort) == 'r', seq_len - (left + length), left)
+    monomers = MonomerStore(pos, np.full(no, length), np.zeros(no), np.zeros(no), ort,
+                            np.zeros(no * length, dtype=np.uint8), length * np.arange(no + 1))
+    b_reverse = monomers.ort == 'r'
+    reverse = monomers.take(np.flatnonzero(b_reverse))
+    set_back_rc_positions(reverse, seq_len)
+    monomers.pos[b_reverse] = reverse.pos
+    return monomers, left
+
+
+def test_direct_copies():
+    labels = np.tile(np.arange(4), 3)
+    monomers, left = monomer_array(labels, ['d'] * 12)
+    units = hor_units(labels, monomers)
+    assert units['start'].tolist() == [0, 4, 8]
+    assert units['start_pos'].tolist() == left[[0, 4, 8]].tolist()
+    assert units['end_pos'].tolist() == (left[[3, 7, 11]] + 170).tolist()
+    assert [UNIT_KINDS[kind] for kind in units['kind']] == ['canonical'] * 3
+
+
+def test_reverse_complement_copies():
+    labels = np.tile(np.arange(4), 3)
+    ort = ['r'] * 8 + ['d', 'r', 'd', 'd']
+    monomers, left = monomer_array(labels, ort)
+    units = hor_units(labels, monomers)
+    assert units['start_pos'].tolist() == left[[0, 4, 8]].tolist()
+    assert units['end_pos'].tolist() == (left[[3, 7, 11]] + 170).tolist()
+    assert units['reverse'].tolist() == [True, True, False]
+    assert (units['start_pos'] < units['end_pos']).all()
@@ -0,0 +1,84 @@
+import edlib
+import numpy as np
+import pytest
+
+from MonFinder import find_monomers, scan_consensuses
+
+
+def brute_force_scan(seq, consensuses):
+    """
+    Aligns every consensus at every offset and returns the (pos, div, label) of the hits, as scan_consensuses.
+    """
+    names = list(consensuses)
+    ends = [len(seq) - len(consensuses[name]) - 1 for name in names]
+    hits = []
+    for i in range(max(max(ends), 0)):
+        best = None
+        for c, name in enumerate(names):
+            if i >= ends[c]:
+                continue
+            cons = consensuses[name]
+            edp = edlib.align(cons, seq[i: i + len(cons)])["editDistance"] / len(cons) * 100
+            if edp < 30 and (best is None or edp < best[1]):
+                best = (i, edp, name)
+        if best is not None:
+            hits.append(best)
+    return hits
+
+
+def scan_hits(seq, consensuses):
+    monomers, _ = scan_consensuses(seq, consensuses, 'd')
+    return list(zip(monomers.pos.tolist(), monomers.div.tolist(), monomers.label.tolist()))
+
+
+def random_sequence(rng, length):
+    return "".join(rng.choice(list("ACGT"), length))
+
+
+def mutated(rng, seq, rate):
+    bases = [b if rng.random() >= rate else rng.choice(list("ACGT")) for b in seq]
+    return "".join(b for b in bases if rng.random() >= rate / 4)
+
+
+def test_unequal_lengths_handcrafted():
+    consensuses = {'c1': "A" * 90 + "T" * 10, 'c2': "A" * 100 + "C" * 50}
+    seq = "G" * 38 + "A" * 90 + "T" * 10 + "C" * 40 + "G" * 60
+    assert scan_hits(seq, consensuses) == brute_force_scan(seq, consensuses)
+
+
+def test_unequal_lengths_random():
+    rng = np.random.default_rng(20)
+    for _ in range(60):
+        base = random_sequence(rng, int(rng.integers(40, 80)))
+        consensuses = {}
+        for c in range(int(rng.integers(2, 5))):
+            cons = mutated(rng, base, 0.15)
+            consensuses[f"c{c}"] = cons[:int(rng.integers(len(cons) // 2, len(cons) + 1))]
+        pieces = [random_sequence(rng, int(rng.integers(0, 30)))]
+        for _ in range(int(rng.integers(2, 6))):
+            pieces.append(mutated(rng, consensuses[rng.choice(list(consensuses))], 0.1))
+            pieces.append(random_sequence(rng, int(rng.integers(0, 20))))
+        seq = "".join(pieces)
+        assert scan_hits(seq, consensuses) == brute_force_scan(seq, consensuses)
+
+
+@pytest.mark.parametrize('b_named', [False, True])
+def test_monomer_lengths_follow_the_consensus(b_named):
+    rng = np.random.default_rng(3)
+    cons = random_sequence(rng, 120)
+    starts, pieces, offset = [], [random_sequence(rng, 50)], 50
+    for _ in range(8):
+        copy = mutated(rng, cons, 0.02)
+        starts.append(offset)
+        spacer = random_sequence(rng, 40)
+        pieces += [copy, spacer]
+        offset += len(copy) + len(spacer)
+    pieces.append(random_sequence(rng, 50))
+    seq = "".join(pieces)
+    monomers = find_monomers(seq, {'short': cons} if b_named else cons, 'd')
+    assert len(monomers) == len(starts)
+    assert all(abs(pos - start) <= 3 for pos, start in zip(monomers.pos.tolist(), starts))
+    # Monomers 40 bp apart are cut at the length of their consensus, not at the next monomer or 171 bp.
+    assert (monomers.seq_lengths() == 120).all()
+    if b_named:
+        assert set(monomers.label.tolist()) == {'short'}
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from Metrics import Metrics, set_metrics
+from Service import MonomerArray, QueryService
+from SyntheticArrays import synthetic_array
+
+
+def reverse_strand_array(no=40):
+    """
+    Returns a synthetic array whose every other monomer is in reverse complement orientation, with its position
+    set as MonFinder does (the excluded right end on the direct strand), and the left ends of all the monomers.
+    """
+    monomers, _ = synthetic_array('canonical', no, hor_length=4)
+    left = monomers.pos.copy()
+    b_reverse = np.arange(no) % 2 == 1
+    monomers.ort = np.where(b_reverse, 'r', 'd')
+    monomers.pos = np.where(b_reverse, left + monomers.seq_lengths(), left)
+    return monomers, left
+
+
+@pytest.fixture(scope='module')
+def array():
+    set_metrics(Metrics(True))
+    monomers, left = reverse_strand_array()
+    return MonomerArray('test', monomers), left
+
+
+def test_monomer_at_reverse_strand(array):
+    array, left = array
+    lengths = array.monomers.seq_lengths()
+    for k in range(len(left)):
+        for pos in (left[k], left[k] + lengths[k] // 2, left[k] + lengths[k] - 1):
+            assert array.monomer_at({'pos': str(pos)}) == k
+    with pytest.raises(LookupError):
+        array.monomer_at({'pos': str(left[0] - 1)})
+    with pytest.raises(LookupError):
+        array.monomer_at({'pos': str(left[-1] + lengths[-1])})
+
+
+def test_family_query_by_position(array):
+    array, left = array
+    service = QueryService([array])
+    _, body = service.query('/family', {'pos': str(left[3] + 10)})
+    assert b'"index": 3' in body
+
+
+@pytest.mark.parametrize('params', [{'step': '0'}, {'pmax': '-1'}])
+def test_invalid_grm_params(array, params):
+    array, _ = array
+    service = QueryService([array])
+    with pytest.raises(ValueError):
+        service.query('/grm', params)
+    with pytest.raises(ValueError):
+        service.query('/render', dict(params, image='grm'))